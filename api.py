@@ -1,8 +1,25 @@
-from fastapi import FastAPI, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Query, Request
 from fastapi.middleware.cors import CORSMiddleware
-from main import TaxNewsletterProcessor
-from datetime import datetime
+from fastapi.responses import StreamingResponse
+from main import TaxNewsletterProcessor, SharedServices
+from email_sender import EmailSender
+from sharepoint_uploader import SharePointUploader
+from job_queue import JobStore, JobRunner, FINISHED_STATUSES
+from webhook_events import WebhookEventLog
+from newsletter_store import NewsletterStore, NewsletterCache, LockHeld
+from http_cache import PrecomputedResponse
+from item_archive import ItemArchive
+from scheduler import create_scheduler
+from config import CIRCULARS_ROBOT_ID, NOTIFICATIONS_ROBOT_ID, PRESS_RELEASES_ROBOT_ID
+from config import BROWSE_AI_WEBHOOK_SECRET, BROWSE_AI_WEBHOOK_SIGNATURE_HEADER, JOB_EVENT_POLL_SECONDS
+from config import ARCHIVE_ENABLED, ARCHIVE_PAGE_SIZE, ARCHIVE_MAX_PAGE_SIZE
+from config import SCHEDULER_ENABLED, DIGEST_CRON, CIRCULARS_POLL_MINUTES, NOTIFICATIONS_POLL_MINUTES, PRESS_RELEASES_POLL_MINUTES
+from datetime import date
+import asyncio
+import hashlib
+import hmac
 import json
+import time
 
 app = FastAPI(title="Tax Newsletter API")
 
@@ -15,41 +32,259 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Store latest newsletter
-latest_newsletter = {
-    "status": "not_generated",
-    "last_updated": None,
-    "data": []
+def newsletter_content(newsletter):
+    """The /api/newsletter payload for a newsletter snapshot"""
+    
+    if newsletter["status"] == "not_generated":
+        return {
+            "message": "Newsletter not generated yet. Call POST /api/generate first.",
+            "status": "not_generated"
+        }
+    
+    if newsletter["status"] == "processing":
+        return {
+            "message": "Newsletter is being processed. Check /api/status for updates.",
+            "status": "processing"
+        }
+    
+    if newsletter["status"] == "error":
+        return {
+            "message": "Error generating newsletter",
+            "status": "error",
+            "error": newsletter["error"]
+        }
+    
+    # Group data by type
+    groups = {'Circular': [], 'Notification': [], 'Press Release': []}
+    for record in newsletter["data"]:
+        groups.setdefault(record['type'], []).append(record)
+    circulars, notifications, releases = groups['Circular'], groups['Notification'], groups['Press Release']
+    
+    return {
+        "status": "success",
+        "last_updated": newsletter["last_updated"],
+        "newsletter": {
+            "circulars": circulars,
+            "notifications": notifications,
+            "press_releases": releases
+        }
+    }
+
+# Newsletter state shared by all workers, read through a per-process cache
+newsletter_store = NewsletterStore()
+newsletter_cache = NewsletterCache(
+    newsletter_store, render=lambda newsletter: PrecomputedResponse(newsletter_content(newsletter))
+)
+
+# Which processing step handles each robot's items
+ROBOT_PROCESSORS = {
+    CIRCULARS_ROBOT_ID: TaxNewsletterProcessor.process_circulars,
+    NOTIFICATIONS_ROBOT_ID: TaxNewsletterProcessor.process_notifications,
+    PRESS_RELEASES_ROBOT_ID: TaxNewsletterProcessor.process_press_releases,
 }
+webhook_events = WebhookEventLog()
+# One OpenRouter client (rate limiter included) and one set of stores for every job in this worker
+services = SharedServices()
+item_archive = services.archive or ItemArchive()
+
+# /api/items type filter: singular or plural, any case ("circulars", "Press Release", ...)
+ITEM_TYPES = {'circular': 'Circular', 'notification': 'Notification', 'press_release': 'Press Release'}
+
+def process_newsletter_task(params=None, emit=None):
+    """
+    Job: process the newsletter, reporting per-item progress through emit
+    
+    The generation lease keeps a second generation from starting in any
+    other worker or process that shares the newsletter database. Once it
+    is held new polls skip, and polls already running are waited for.
+    """
+    with newsletter_store.lease('generation'):
+        polls = newsletter_store.held_locks('poll:')
+        if polls:
+            print(f"⏳ Waiting for {len(polls)} running poll(s) to finish...")
+            if emit:
+                emit({'event': 'waiting', 'for': polls})
+            while newsletter_store.held_locks('poll:'):
+                time.sleep(1)
+        
+        print("\n🚀 Processing newsletter...")
+        run_id = newsletter_store.start_run()
+        
+        try:
+            processor = TaxNewsletterProcessor(progress=emit, services=services)
+            
+            # Fetch all robots at once, then process all data
+            processor.fetch_captured_data()
+            processor.process_circulars()
+            processor.process_notifications()
+            processor.process_press_releases()
+            
+            newsletter_store.complete_run(run_id, processor.processed_data)
+            
+            print("✅ Newsletter processing completed!")
+            return {"item_count": len(processor.processed_data), "error_count": len(processor.errors)}
+            
+        except Exception as e:
+            print(f"❌ Error processing newsletter: {e}")
+            newsletter_store.fail_run(run_id, str(e))
+            raise
 
-def process_newsletter_task():
-    """Background task to process newsletter"""
-    global latest_newsletter
+def process_webhook_task(params, emit=None):
+    """
+    Job: process the items of one finished Browse AI task
     
-    print("\n🚀 Processing newsletter...")
-    latest_newsletter["status"] = "processing"
+    Items are not marked processed here: the daily run still emails them,
+    and its downloads and summaries then come from the local caches.
+    """
+    robot_id, task = params['robot_id'], params['task']
+    task_id = task['id']
+    print(f"\n🔔 Processing Browse AI task {task_id} for robot {robot_id}...")
     
     try:
-        processor = TaxNewsletterProcessor()
+        processor = TaxNewsletterProcessor(progress=emit, services=services)
         
-        # Process all data
-        processor.process_circulars()
-        processor.process_notifications()
-        processor.process_press_releases()
+        # Deliveries may carry only the task id; fetch the captured lists if so
+        if 'capturedLists' not in task:
+            task = processor.browse_ai.get_task(robot_id, task_id) or task
         
-        # Update global storage
-        latest_newsletter = {
-            "status": "completed",
-            "last_updated": datetime.now().isoformat(),
-            "data": processor.processed_data
-        }
+        processor.captured_data = {robot_id: processor.browse_ai.new_items_from_task(robot_id, task)}
+        ROBOT_PROCESSORS[robot_id](processor)
         
-        print("✅ Newsletter processing completed!")
+        newsletter_store.merge_items(processor.processed_data)
+        webhook_events.finish(task_id, 'completed')
+        print(f"✅ Task {task_id}: {len(processor.processed_data)} item(s) added")
+        return {"item_count": len(processor.processed_data), "error_count": len(processor.errors)}
         
     except Exception as e:
-        print(f"❌ Error processing newsletter: {e}")
-        latest_newsletter["status"] = "error"
-        latest_newsletter["error"] = str(e)
+        print(f"❌ Error processing Browse AI task {task_id}: {e}")
+        webhook_events.finish(task_id, 'failed')
+        raise
+
+def poll_robot_task(params, emit=None):
+    """
+    Job: process one robot's items since its last poll
+    
+    Items are marked processed, so the next poll only sees newer ones;
+    the digest job emails them from the archive.
+    
+    Each robot has its own lease. The poll takes it before checking for a
+    generation, and a generation takes its lease before checking for
+    polls, so the two never run at the same time.
+    """
+    robot_id = params['robot_id']
+    
+    try:
+        with newsletter_store.lease(f'poll:{robot_id}'):
+            # A full generation already covers this robot
+            if newsletter_store.lock_held('generation'):
+                print(f"⏭️ Skipping poll of robot {robot_id}: a newsletter generation is running")
+                return {"skipped": "generation running"}
+            
+            print(f"\n⏱️ Polling robot {robot_id}...")
+            processor = TaxNewsletterProcessor(progress=emit, services=services)
+            ROBOT_PROCESSORS[robot_id](processor)
+            
+            newsletter_store.merge_items(processor.processed_data)
+            processor.mark_processed()
+            print(f"✅ Robot {robot_id}: {len(processor.processed_data)} new item(s)")
+            return {"item_count": len(processor.processed_data), "error_count": len(processor.errors)}
+    
+    except LockHeld:
+        print(f"⏭️ Skipping poll of robot {robot_id}: another poll of it is running")
+        return {"skipped": "poll running"}
+
+def send_digest_task(params=None, emit=None):
+    """Job: email and upload the items archived since the last digest"""
+    last_id, records = item_archive.pending_digest()
+    
+    if not records:
+        if last_id:
+            item_archive.mark_digested(last_id)
+        print("📧 No new items since the last digest")
+        return {"item_count": 0}
+    
+    print(f"\n📧 Sending digest of {len(records)} item(s)...")
+    if not EmailSender().send_newsletter(records):
+        # Mark stays put, so the next digest sends these items again
+        raise RuntimeError("Digest email failed")
+    item_archive.mark_digested(last_id)
+    
+    if not SharePointUploader().upload_to_sharepoint(records):
+        print("⚠️ SharePoint upload had issues (check logs)")
+    
+    return {"item_count": len(records)}
+
+# Minutes between scheduled polls of each robot
+POLL_MINUTES = {
+    CIRCULARS_ROBOT_ID: CIRCULARS_POLL_MINUTES,
+    NOTIFICATIONS_ROBOT_ID: NOTIFICATIONS_POLL_MINUTES,
+    PRESS_RELEASES_ROBOT_ID: PRESS_RELEASES_POLL_MINUTES,
+}
+
+# Durable job queue: one runner thread per process takes queued jobs in order
+job_store = JobStore()
+job_runner = JobRunner(job_store, {
+    'generate': process_newsletter_task,
+    'webhook': process_webhook_task,
+    'digest': send_digest_task,
+    **{f'poll:{robot_id}': poll_robot_task for robot_id in ROBOT_PROCESSORS},
+}, abandon_handlers={
+    # Let the next delivery of the task through again
+    'webhook': lambda params: webhook_events.finish(params['task']['id'], 'failed'),
+})
+scheduler = None
+
+def schedule_poll(robot_id):
+    """Scheduler callback: queue a poll unless one is pending or started within half an interval"""
+    job, created = job_store.submit(
+        f'poll:{robot_id}', {"robot_id": robot_id}, single_flight=True, min_interval=POLL_MINUTES[robot_id] * 30
+    )
+    if created:
+        job_runner.wake()
+
+def schedule_digest():
+    """Scheduler callback: queue the digest once, even when several workers fire together"""
+    job, created = job_store.submit('digest', single_flight=True, min_interval=600)
+    if created:
+        job_runner.wake()
+
+def job_links(job):
+    return {"job_id": job['id'], "job": f"/api/jobs/{job['id']}", "events": f"/api/jobs/{job['id']}/events"}
+
+def verify_webhook_signature(body, signature):
+    """Check an HMAC-SHA256 signature of the raw request body"""
+    if not BROWSE_AI_WEBHOOK_SECRET or not signature:
+        return False
+    
+    expected = hmac.new(BROWSE_AI_WEBHOOK_SECRET.encode('utf-8'), body, hashlib.sha256).hexdigest()
+    signature = signature.strip().lower()
+    if signature.startswith('sha256='):
+        signature = signature[len('sha256='):]
+    return hmac.compare_digest(expected, signature)
+
+@app.on_event("startup")
+def start_job_runner():
+    job_runner.start()
+
+@app.on_event("startup")
+def start_scheduler():
+    global scheduler
+    if not SCHEDULER_ENABLED:
+        return
+    
+    # Polls mark items processed and only the digest delivers them, so no digest means no polls
+    if not ARCHIVE_ENABLED or not DIGEST_CRON:
+        print("❌ Scheduler not started: it needs ARCHIVE_ENABLED and a DIGEST_CRON to deliver polled items")
+        return
+    
+    item_archive.start_digest()
+    scheduler = create_scheduler(POLL_MINUTES, schedule_poll, schedule_digest)
+    scheduler.start()
+
+@app.on_event("shutdown")
+def stop_scheduler():
+    if scheduler is not None:
+        scheduler.shutdown(wait=False)
 
 @app.get("/")
 def root():
@@ -60,73 +295,210 @@ def root():
         "endpoints": {
             "generate": "/api/generate",
             "newsletter": "/api/newsletter",
-            "status": "/api/status"
+            "status": "/api/status",
+            "job": "/api/jobs/{job_id}",
+            "job_events": "/api/jobs/{job_id}/events",
+            "items": "/api/items?type=&from=&to=&q=&cursor=",
+            "browse_ai_webhook": "/api/webhooks/browse-ai"
         }
     }
 
 @app.get("/api/generate") 
-def generate_newsletter(background_tasks: BackgroundTasks):
+def generate_newsletter():
     """Trigger newsletter generation"""
     
-    if latest_newsletter["status"] == "processing":
+    # Queued atomically: a second call while a run is queued or running gets that run's job
+    job, created = job_store.submit('generate', single_flight=True)
+    
+    if not created:
         return {
             "message": "Newsletter is already being processed",
-            "status": "processing"
+            "status": "processing",
+            **job_links(job)
         }
     
-    # Start background task
-    background_tasks.add_task(process_newsletter_task)
+    job_runner.wake()
     
     return {
         "message": "Newsletter generation started",
-        "status": "started"
+        "status": "started",
+        **job_links(job)
     }
 
+@app.get("/api/jobs/{job_id}")
+def get_job(job_id: str):
+    """Get a job's status and result"""
+    job = job_store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    return {
+        "job_id": job['id'],
+        "kind": job['kind'],
+        "status": job['status'],
+        "created_at": job['created_at'],
+        "started_at": job['started_at'],
+        "finished_at": job['finished_at'],
+        "attempts": job['attempts'],
+        "result": job['result'],
+        "error": job['error']
+    }
+
+@app.get("/api/jobs/{job_id}/events")
+async def stream_job_events(job_id: str, request: Request):
+    """
+    Stream a job's progress as Server-Sent Events
+    
+    Every event carries its sequence number as the SSE id, so a client
+    reconnecting with Last-Event-ID resumes where it left off. The stream
+    ends once the job has finished and all its events were sent.
+    """
+    if job_store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    try:
+        last_seq = int(request.headers.get('last-event-id') or 0)
+    except ValueError:
+        last_seq = 0
+    
+    async def stream():
+        nonlocal last_seq
+        idle = 0.0
+        while True:
+            # Read the status before the events so no final event can be missed
+            job = await asyncio.to_thread(job_store.get, job_id)
+            events = await asyncio.to_thread(job_store.events, job_id, last_seq)
+            
+            for seq, data in events:
+                last_seq = seq
+                yield f"id: {seq}\nevent: {data.get('event', 'message')}\ndata: {json.dumps(data)}\n\n"
+            
+            if job is None or job['status'] in FINISHED_STATUSES or await request.is_disconnected():
+                return
+            
+            idle = 0.0 if events else idle + JOB_EVENT_POLL_SECONDS
+            if idle >= 15:
+                # Comment line keeps proxies from closing a quiet stream
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            await asyncio.sleep(JOB_EVENT_POLL_SECONDS)
+    
+    return StreamingResponse(
+        stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
 @app.get("/api/status")
 def get_status():
     """Get current processing status"""
+    newsletter = newsletter_cache.get()
+    job = job_store.latest('generate')
     return {
-        "status": latest_newsletter["status"],
-        "last_updated": latest_newsletter.get("last_updated"),
-        "item_count": len(latest_newsletter.get("data", []))
+        "status": newsletter["status"],
+        "last_updated": newsletter["last_updated"],
+        "item_count": len(newsletter["data"]),
+        "job": {"job_id": job['id'], "status": job['status']} if job else None,
+        "scheduled": {
+            scheduled.id: scheduled.next_run_time.isoformat() for scheduled in scheduler.get_jobs()
+        } if scheduler else None
     }
 
 @app.get("/api/newsletter")
-def get_newsletter():
-    """Get the latest newsletter"""
+def get_newsletter(request: Request):
+    """
+    Get the latest newsletter
     
-    if latest_newsletter["status"] == "not_generated":
-        return {
-            "message": "Newsletter not generated yet. Call POST /api/generate first.",
-            "status": "not_generated"
-        }
+    The response is built, serialized and compressed once per newsletter
+    version; repeat polls are answered from memory, or with a 304 when
+    the client sends back the ETag it has.
+    """
+    return newsletter_cache.get()['rendered'].respond(request)
+
+def parse_iso_date(value, name):
+    try:
+        return date.fromisoformat(value).isoformat() if value else None
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"{name} must be a date like 2024-01-31")
+
+@app.get("/api/items")
+def list_items(
+    item_type: str = Query(None, alias="type"),
+    date_from: str = Query(None, alias="from"),
+    date_to: str = Query(None, alias="to"),
+    q: str = None,
+    cursor: str = None,
+    limit: int = ARCHIVE_PAGE_SIZE
+):
+    """
+    Browse and search every processed item, newest first
     
-    if latest_newsletter["status"] == "processing":
-        return {
-            "message": "Newsletter is being processed. Check /api/status for updates.",
-            "status": "processing"
-        }
+    Pass the returned next_cursor to get the following page; it is null
+    on the last page.
+    """
+    doc_type = None
+    if item_type:
+        doc_type = ITEM_TYPES.get(item_type.strip().lower().replace(' ', '_').rstrip('s'))
+        if doc_type is None:
+            raise HTTPException(status_code=400, detail=f"Unknown type: {item_type}")
     
-    if latest_newsletter["status"] == "error":
-        return {
-            "message": "Error generating newsletter",
-            "status": "error",
-            "error": latest_newsletter.get("error")
-        }
+    try:
+        items, next_cursor = item_archive.search(
+            doc_type=doc_type,
+            date_from=parse_iso_date(date_from, "from"),
+            date_to=parse_iso_date(date_to, "to"),
+            query=q,
+            cursor=cursor,
+            limit=min(max(limit, 1), ARCHIVE_MAX_PAGE_SIZE)
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     
-    # Group data by type
-    circulars = [d for d in latest_newsletter["data"] if d['type'] == 'Circular']
-    notifications = [d for d in latest_newsletter["data"] if d['type'] == 'Notification']
-    releases = [d for d in latest_newsletter["data"] if d['type'] == 'Press Release']
+    return {
+        "items": items,
+        "count": len(items),
+        "next_cursor": next_cursor
+    }
+
+@app.post("/api/webhooks/browse-ai")
+async def browse_ai_webhook(request: Request):
+    """Receive a Browse AI "task finished" event and process that task's new items"""
+    
+    if not BROWSE_AI_WEBHOOK_SECRET:
+        raise HTTPException(status_code=503, detail="Webhook secret is not configured")
+    
+    body = await request.body()
+    if not verify_webhook_signature(body, request.headers.get(BROWSE_AI_WEBHOOK_SIGNATURE_HEADER)):
+        raise HTTPException(status_code=401, detail="Invalid webhook signature")
+    
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Body is not valid JSON")
+    
+    task = payload.get('task') if isinstance(payload, dict) else None
+    if not isinstance(task, dict) or not task.get('id') or not task.get('robotId'):
+        raise HTTPException(status_code=400, detail="Payload has no task id and robot id")
+    
+    task_id, robot_id = task['id'], task['robotId']
+    
+    if robot_id not in ROBOT_PROCESSORS:
+        return {"status": "ignored", "task_id": task_id, "reason": "Unknown robot"}
+    
+    if task.get('status', 'successful') != 'successful':
+        return {"status": "ignored", "task_id": task_id, "reason": f"Task status is {task.get('status')}"}
+    
+    if not webhook_events.claim(task_id, robot_id):
+        return {"status": "duplicate", "task_id": task_id}
+    
+    job, created = job_store.submit('webhook', {"robot_id": robot_id, "task": task})
+    job_runner.wake()
     
     return {
-        "status": "success",
-        "last_updated": latest_newsletter["last_updated"],
-        "newsletter": {
-            "circulars": circulars,
-            "notifications": notifications,
-            "press_releases": releases
-        }
+        "message": "Task accepted for processing",
+        "status": "accepted",
+        "task_id": task_id,
+        **job_links(job)
     }
 
 if __name__ == "__main__":
@@ -1,18 +1,33 @@
-import requests
-from config import BROWSE_AI_API_KEY
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from config import BROWSE_AI_API_KEY, BROWSE_AI_TIMEOUT, SEEN_INDEX_ENABLED, BROWSE_AI_MAX_TASK_PAGES
+from config import BROWSE_AI_PREFETCH_PAGES, BROWSE_AI_TASK_CACHE_ENABLED
+from http_client import get_session
+from seen_items import SeenItemIndex
+from task_cache import TaskCache, is_finished
 
 class BrowseAIHandler:
-    def __init__(self):
+    def __init__(self, seen_index=None, task_cache=None):
         self.api_key = BROWSE_AI_API_KEY
         self.base_url = "https://api.browse.ai/v2"
         self.headers = {
             "Authorization": f"Bearer {self.api_key}"
         }
+        self.session = get_session('browse_ai')
+        
+        # Processed-item index; pending holds what to record once a robot's items are delivered
+        self.seen_index = seen_index
+        if self.seen_index is None and SEEN_INDEX_ENABLED:
+            self.seen_index = SeenItemIndex()
+        self.pending = {}
+        self.task_cache = task_cache
+        if self.task_cache is None and BROWSE_AI_TASK_CACHE_ENABLED:
+            self.task_cache = TaskCache()
     
     def get_robot_monitors(self, robot_id):
         """Get list of monitors for a robot"""
         url = f"{self.base_url}/robots/{robot_id}/monitors"
-        response = requests.get(url, headers=self.headers)
+        response = self.session.get(url, headers=self.headers)
         
         if response.status_code == 200:
             data = response.json()
@@ -22,40 +37,261 @@ class BrowseAIHandler:
         print(f"⚠️ Failed to get monitors: {response.status_code}")
         return []
     
-    def get_latest_task(self, robot_id):
+    def get_latest_task(self, robot_id, max_pages=BROWSE_AI_MAX_TASK_PAGES):
         """Get the latest successful task for a robot (includes monitor tasks)"""
+        latest_any = None
+        
+        # Prioritize monitor tasks over manual tasks, paging past manual test runs
+        for task in self.iter_tasks(robot_id, max_pages=max_pages):
+            if task.get('status') != 'successful':
+                continue
+            if task.get('runByTaskMonitorId') is not None:
+                return task
+            latest_any = latest_any or task
+        
+        # Fallback to any successful task
+        return latest_any
+    
+    def get_task(self, robot_id, task_id):
+        """Get one task by id (finished tasks come from the local cache)"""
+        task = self.task_cache.get(task_id) if self.task_cache else None
+        if task is not None:
+            return task
+        
+        url = f"{self.base_url}/robots/{robot_id}/tasks/{task_id}"
+        response = self.session.get(url, headers=self.headers)
+        
+        if response.status_code != 200:
+            print(f"⚠️ Failed to get task {task_id}: {response.status_code}")
+            return None
+        
+        task = response.json().get('result', {}).get('robotTask')
+        if task and self.task_cache:
+            self.task_cache.store(robot_id, [task])
+        return task
+    
+    def _task_pages(self, robot_id, start_page, max_pages, prefetch):
+        """
+        Yield (tasks, page_size) for pages start_page onwards, newest first
+        
+        Once a page says more follow, up to `prefetch` later pages are
+        requested in the background so the next page is usually ready when
+        the caller gets to it. Closing the generator cancels what is left.
+        """
         url = f"{self.base_url}/robots/{robot_id}/tasks"
-        params = {"page": 1}
-        response = requests.get(url, headers=self.headers, params=params)
         
-        if response.status_code == 200:
-            data = response.json()
-            tasks = data.get('result', {}).get('robotTasks', {}).get('items', [])
-            
-            # Prioritize monitor tasks over manual tasks
-            monitor_tasks = [t for t in tasks if t.get('runByTaskMonitorId') is not None]
-            
-            if monitor_tasks:
-                # Return latest monitor task
-                for task in monitor_tasks:
-                    if task.get('status') == 'successful':
-                        return task
-            
-            # Fallback to any successful task
-            for task in tasks:
-                if task.get('status') == 'successful':
-                    return task
+        def fetch(page):
+            return self.session.get(url, headers=self.headers, params={"page": page})
+        
+        executor = ThreadPoolExecutor(max_workers=max(1, prefetch))
+        in_flight = deque([(start_page, executor.submit(fetch, start_page))])
+        next_page = start_page + 1
+        page_limit = end_page = start_page + max_pages
+        
+        try:
+            while in_flight:
+                page, future = in_flight.popleft()
+                response = future.result()
+                
+                if response.status_code != 200:
+                    print(f"⚠️ Failed to get tasks page {page}: {response.status_code}")
+                    return
+                
+                robot_tasks = response.json().get('result', {}).get('robotTasks', {})
+                tasks = robot_tasks.get('items', [])
+                page_size = robot_tasks.get('pageSize') or len(tasks)
+                # Recomputed every page: tasks created mid-walk push older ones onto later pages
+                if robot_tasks.get('totalCount') and page_size:
+                    end_page = min(page_limit, -(-robot_tasks['totalCount'] // page_size) + 1)
+                
+                yield tasks, page_size
+                
+                if not tasks or not robot_tasks.get('hasMore'):
+                    return
+                
+                while len(in_flight) < max(1, prefetch) and next_page < end_page:
+                    in_flight.append((next_page, executor.submit(fetch, next_page)))
+                    next_page += 1
+                
+                if not in_flight:
+                    print(f"⚠️ Robot {robot_id}: Stopped paging tasks at page {page}")
+        finally:
+            for page, future in in_flight:
+                future.cancel()
+            executor.shutdown(wait=False)
+    
+    def iter_tasks(self, robot_id, stop=None, max_pages=BROWSE_AI_MAX_TASK_PAGES, prefetch=BROWSE_AI_PREFETCH_PAGES):
+        """
+        Yield a robot's tasks newest first, across pages
+        
+        Args:
+            robot_id: Browse AI robot ID
+            stop: Optional predicate; iteration ends at the first task it is true for
+                  (e.g. lambda task: task['createdAt'] <= watermark)
+            max_pages: Most pages to request from the API
+            prefetch: Pages requested ahead of the one being read
+        
+        Finished tasks are kept in the task cache. Once the walk reaches the
+        range the cache holds completely, that range is read from disk and
+        paging resumes below it.
+        """
+        coverage = self.task_cache.coverage(robot_id) if self.task_cache else None
+        yielded, seen_ids = 0, set()
+        newest_finished = oldest_yielded = None
+        start_page = 1
+        
+        try:
+            while True:
+                pages = self._task_pages(robot_id, start_page, max_pages - start_page + 1, prefetch)
+                jump = None
+                
+                for tasks, page_size in pages:
+                    if self.task_cache:
+                        self.task_cache.store(robot_id, tasks)
+                    
+                    for task in tasks:
+                        # New tasks arriving mid-walk shift pages, so a task can show up twice
+                        if task.get('id') in seen_ids:
+                            continue
+                        if stop and stop(task):
+                            pages.close()
+                            return
+                        
+                        seen_ids.add(task.get('id'))
+                        yielded += 1
+                        created_at = task.get('createdAt', 0)
+                        oldest_yielded = created_at
+                        # The cached range can only start below the last unfinished task
+                        if not is_finished(task):
+                            newest_finished = None
+                        elif newest_finished is None:
+                            newest_finished = created_at
+                        yield task
+                        
+                        if coverage and is_finished(task) and coverage[1] <= created_at <= coverage[0]:
+                            jump = created_at
+                            break
+                    
+                    if jump is not None:
+                        pages.close()
+                        break
+                
+                if jump is None:
+                    return
+                
+                # Everything down to the bottom of the cached range comes from disk
+                for task in self.task_cache.iter_range(robot_id, jump, coverage[1]):
+                    if task.get('id') in seen_ids:
+                        continue
+                    if stop and stop(task):
+                        return
+                    seen_ids.add(task.get('id'))
+                    yielded += 1
+                    oldest_yielded = task.get('createdAt', 0)
+                    yield task
+                
+                start_page = yielded // max(1, page_size) + 1
+                coverage = None
+                if start_page > max_pages:
+                    return
+        finally:
+            if self.task_cache and newest_finished is not None and oldest_yielded is not None:
+                self.task_cache.extend_coverage(robot_id, newest_finished, oldest_yielded)
+    
+    @staticmethod
+    def task_items(task):
+        """Items of a task's first captured list"""
+        for list_name, list_items in task.get('capturedLists', {}).items():
+            return list_items or []
+        return []
+    
+    def get_unprocessed_items(self, robot_id, watermark, pending=None):
+        """
+        Items from every monitor task since the watermark that are not yet processed
+        
+        Reading all tasks since the last handled one means items flagged NEW
+        in a run we skipped are not lost; the seen index drops the ones
+        already processed. The state mark_processed needs goes into pending
+        (self.pending by default).
+        """
+        pending = self.pending if pending is None else pending
+        tasks = [
+            task for task in self.iter_tasks(robot_id, stop=lambda task: task.get('createdAt', 0) <= watermark)
+            if task.get('runByTaskMonitorId') is not None and task.get('status') == 'successful'
+        ]
         
-        return None
+        if not tasks:
+            print(f"✅ Robot {robot_id}: No monitoring runs since the last processed one")
+            return []
+        
+        items = [
+            item for task in tasks for item in self.task_items(task)
+            if item.get('_STATUS') != 'REMOVED'
+        ]
+        unprocessed = self.seen_index.unseen(robot_id, items)
+        pending[robot_id] = {'baseline': [], 'created_at': tasks[0].get('createdAt'), 'task_id': tasks[0].get('id')}
+        
+        print(f"✅ Robot {robot_id}: Found {len(unprocessed)} unprocessed items across {len(tasks)} monitoring run(s)")
+        return unprocessed
+    
+    def new_items_from_task(self, robot_id, task):
+        """
+        Items of a single task that still need processing
+        
+        Monitor tasks flag what changed since their previous run, so their
+        NEW items are used. Tasks without _STATUS are filtered through the
+        seen index; without an index nothing from them is taken.
+        """
+        items = [item for item in self.task_items(task) if item.get('_STATUS') != 'REMOVED']
+        
+        if any('_STATUS' in item for item in items):
+            return [item for item in items if item.get('_STATUS') == 'NEW']
+        if self.seen_index:
+            return self.seen_index.unseen(robot_id, items)
+        
+        print(f"⚠️ Robot {robot_id}: Task {task.get('id')} has no _STATUS; skipping its items")
+        return []
+    
+    def mark_processed(self, robot_id, items):
+        """
+        Record a robot's items as processed once they have been delivered
+        
+        Also records the already-known items of the listing that was read
+        and moves the robot's watermark past the tasks read. Items left out
+        (failed ones) stay unprocessed and come back while still listed.
+        """
+        if not self.seen_index:
+            return
+        
+        pending = self.pending.pop(robot_id, None)
+        if pending is None and not items:
+            return
+        
+        pending = pending or {}
+        self.seen_index.mark_processed(
+            robot_id, list(items) + pending.get('baseline', []), pending.get('created_at'), pending.get('task_id')
+        )
     
-    def get_captured_data(self, robot_id, new_only=True):
+    def get_captured_data(self, robot_id, new_only=True, pending=None):
         """
         Get captured data from latest task
         
+        With the seen index, new_only returns every item from the monitoring
+        runs since the last processed one that has not been processed yet.
+        Before the index has a watermark it falls back to the NEW items of
+        the latest monitor task.
+        
         Args:
             robot_id: Browse AI robot ID
             new_only: If True, return only NEW items from monitoring
+            pending: Dict that receives the state for mark_processed (defaults to self.pending)
         """
+        pending = self.pending if pending is None else pending
+        if new_only and self.seen_index:
+            watermark = self.seen_index.watermark(robot_id)
+            if watermark is not None:
+                return self.get_unprocessed_items(robot_id, watermark, pending)
+        
         task = self.get_latest_task(robot_id)
         
         if not task:
@@ -66,11 +302,7 @@ class BrowseAIHandler:
         is_monitor = task.get('runByTaskMonitorId') is not None
         
         # Get items
-        captured_lists = task.get('capturedLists', {})
-        items = []
-        for list_name, list_items in captured_lists.items():
-            items = list_items
-            break
+        items = self.task_items(task)
         
         if not items:
             return []
@@ -85,6 +317,14 @@ class BrowseAIHandler:
             # Check for _STATUS field
             has_status = any('_STATUS' in item for item in items)
             
+            if self.seen_index:
+                # Whatever this listing holds besides the NEW items is the starting point of the index
+                pending[robot_id] = {
+                    'baseline': [item for item in items if item.get('_STATUS') != 'NEW'],
+                    'created_at': task.get('createdAt'),
+                    'task_id': task.get('id')
+                }
+            
             if not has_status:
                 print(f"⚠️ Robot {robot_id}: First monitor run (establishing baseline)")
                 print(f"   Next monitoring run will detect changes")
@@ -103,3 +343,50 @@ class BrowseAIHandler:
         # Return all items if new_only=False
         print(f"✅ Robot {robot_id}: Fetched {len(items)} items (test mode)")
         return items
+    
+    def get_captured_data_many(self, robot_ids, new_only=True, timeout=None):
+        """
+        Get captured data for several robots at the same time
+        
+        Args:
+            robot_ids: Browse AI robot IDs (empty/None IDs are skipped)
+            new_only: Same meaning as in get_captured_data
+            timeout: Seconds to wait for each robot (defaults to BROWSE_AI_TIMEOUT)
+        
+        Returns:
+            Dict of robot_id -> items. A robot that fails or times out maps to []
+        """
+        timeout = BROWSE_AI_TIMEOUT if timeout is None else timeout
+        robot_ids = [robot_id for robot_id in dict.fromkeys(robot_ids) if robot_id]
+        results = {robot_id: [] for robot_id in robot_ids}
+        
+        if not robot_ids:
+            return results
+        
+        executor = ThreadPoolExecutor(max_workers=len(robot_ids))
+        # Each fetch stages its pending state; only fetches that finish in time apply it,
+        # so a straggler can't move the watermark past items that were never delivered
+        staged = {robot_id: {} for robot_id in robot_ids}
+        futures = {
+            executor.submit(self.get_captured_data, robot_id, new_only, staged[robot_id]): robot_id
+            for robot_id in robot_ids
+        }
+        
+        # All robots start together, so one shared deadline is a per-robot timeout
+        done, not_done = wait(futures, timeout=timeout)
+        
+        for future in done:
+            robot_id = futures[future]
+            try:
+                results[robot_id] = future.result()
+                self.pending.update(staged[robot_id])
+            except Exception as e:
+                print(f"⚠️ Robot {robot_id}: Failed to fetch captured data: {e}")
+        
+        for future in not_done:
+            print(f"⚠️ Robot {futures[future]}: Timed out after {timeout:g}s")
+            future.cancel()
+        
+        # Don't block on stragglers; their requests finish in the background
+        executor.shutdown(wait=False)
+        return results
@@ -1,7 +1,6 @@
 from browse_ai_handler import BrowseAIHandler
 from config import CIRCULARS_ROBOT_ID
-import requests
-from datetime import datetime
+from datetime import datetime, timedelta
 
 handler = BrowseAIHandler()
 
@@ -21,14 +20,12 @@ if monitors:
 else:
     print("  ⚠️ No monitors found")
 
-# Get all recent tasks
+# Get all recent tasks (last 7 days, across as many pages as needed)
 print("\n📋 Checking Recent Tasks...")
-url = f"{handler.base_url}/robots/{CIRCULARS_ROBOT_ID}/tasks"
-response = requests.get(url, headers=handler.headers, params={"page": 1})
+since = (datetime.now() - timedelta(days=7)).timestamp() * 1000
+tasks = list(handler.iter_tasks(CIRCULARS_ROBOT_ID, stop=lambda task: task.get('createdAt', 0) < since))
 
-if response.status_code == 200:
-    tasks = response.json()['result']['robotTasks']['items']
-    
+if tasks:
     print(f"Found {len(tasks)} recent tasks:\n")
     
     monitor_tasks = []
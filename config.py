@@ -17,4 +17,144 @@ OPENROUTER_API_KEY = os.getenv('OPENROUTER_API_KEY')
 SENDGRID_API_KEY = os.getenv('SENDGRID_API_KEY')
 EMAIL_FROM = os.getenv('EMAIL_FROM', 'noreply@taxalerts.com')
 EMAIL_TO = os.getenv('EMAIL_TO')
-POWER_AUTOMATE_WEBHOOK = os.getenv('POWER_AUTOMATE_WEBHOOK')
\ No newline at end of file
+POWER_AUTOMATE_WEBHOOK = os.getenv('POWER_AUTOMATE_WEBHOOK')
+
+# Pipeline concurrency (set PIPELINE_MAX_WORKERS=1 for the sequential path)
+PIPELINE_MAX_WORKERS = int(os.getenv('PIPELINE_MAX_WORKERS', '8'))
+DOWNLOAD_CONCURRENCY = int(os.getenv('DOWNLOAD_CONCURRENCY', '6'))
+EXTRACT_CONCURRENCY = int(os.getenv('EXTRACT_CONCURRENCY', '2'))
+SUMMARIZE_CONCURRENCY = int(os.getenv('SUMMARIZE_CONCURRENCY', '4'))
+
+# Browse AI fetching
+BROWSE_AI_TIMEOUT = float(os.getenv('BROWSE_AI_TIMEOUT', '30'))
+
+# Shared HTTP client (connection pools, retries, per-service timeouts)
+HTTP_POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', '10'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '10'))
+HTTP_MAX_RETRIES = int(os.getenv('HTTP_MAX_RETRIES', '3'))
+HTTP_BACKOFF_FACTOR = float(os.getenv('HTTP_BACKOFF_FACTOR', '0.5'))
+PDF_DOWNLOAD_TIMEOUT = float(os.getenv('PDF_DOWNLOAD_TIMEOUT', '30'))
+OPENROUTER_TIMEOUT = float(os.getenv('OPENROUTER_TIMEOUT', '60'))
+SHAREPOINT_TIMEOUT = float(os.getenv('SHAREPOINT_TIMEOUT', '30'))
+
+# Local caches (restored between GitHub Actions runs)
+CACHE_DIR = os.getenv('CACHE_DIR', '.cache')
+SUMMARY_CACHE_ENABLED = os.getenv('SUMMARY_CACHE_ENABLED', 'true').lower() == 'true'
+SUMMARY_CACHE_TTL_DAYS = float(os.getenv('SUMMARY_CACHE_TTL_DAYS', '30'))
+SUMMARY_CACHE_MAX_ENTRIES = int(os.getenv('SUMMARY_CACHE_MAX_ENTRIES', '5000'))
+DOCUMENT_STORE_ENABLED = os.getenv('DOCUMENT_STORE_ENABLED', 'true').lower() == 'true'
+
+# PDF text extraction limits (long documents are summarized in parts, so keep most of the text)
+PDF_TEXT_CHAR_BUDGET = int(os.getenv('PDF_TEXT_CHAR_BUDGET', '200000'))
+PDF_MAX_PAGES = int(os.getenv('PDF_MAX_PAGES', '150'))
+PDF_EXTRACT_TIME_LIMIT = float(os.getenv('PDF_EXTRACT_TIME_LIMIT', '40'))
+
+# Process-pool PDF extraction (0 = extract in the calling process)
+PDF_EXTRACT_PROCESSES = int(os.getenv('PDF_EXTRACT_PROCESSES', '2'))
+PDF_EXTRACT_TASK_TIMEOUT = float(os.getenv('PDF_EXTRACT_TASK_TIMEOUT', '60'))
+PDF_WORKER_MAX_MEMORY_MB = int(os.getenv('PDF_WORKER_MAX_MEMORY_MB', '1024'))
+PDF_WORKER_MAX_TASKS = int(os.getenv('PDF_WORKER_MAX_TASKS', '50'))
+PDF_PARALLEL_PAGE_THRESHOLD = int(os.getenv('PDF_PARALLEL_PAGE_THRESHOLD', '40'))
+PDF_PARALLEL_MIN_BYTES = int(os.getenv('PDF_PARALLEL_MIN_BYTES', str(1024 * 1024)))
+
+# HTTP range-request PDF fetching (reads only the blocks PyPDF2 needs)
+PDF_RANGE_REQUESTS = os.getenv('PDF_RANGE_REQUESTS', 'false').lower() == 'true'
+PDF_RANGE_BLOCK_SIZE = int(os.getenv('PDF_RANGE_BLOCK_SIZE', str(64 * 1024)))
+PDF_RANGE_MAX_BLOCKS = int(os.getenv('PDF_RANGE_MAX_BLOCKS', '256'))
+# Switch to one full GET once ranged reads would pass this fraction of the file
+PDF_RANGE_FULL_FETCH_RATIO = float(os.getenv('PDF_RANGE_FULL_FETCH_RATIO', '0.5'))
+
+# Streamed PDF downloads
+PDF_MAX_DOWNLOAD_MB = float(os.getenv('PDF_MAX_DOWNLOAD_MB', '50'))
+PDF_SPOOL_THRESHOLD_MB = float(os.getenv('PDF_SPOOL_THRESHOLD_MB', '8'))
+
+# PDF URL resolution (probe candidate URLs instead of trusting one guess)
+PDF_URL_PROBING = os.getenv('PDF_URL_PROBING', 'true').lower() == 'true'
+PDF_URL_PROBE_TIMEOUT = float(os.getenv('PDF_URL_PROBE_TIMEOUT', '10'))
+
+# OpenRouter rate limiting (SUMMARIZE_CONCURRENCY is the upper concurrency bound)
+OPENROUTER_REQUESTS_PER_MINUTE = int(os.getenv('OPENROUTER_REQUESTS_PER_MINUTE', '20'))
+OPENROUTER_TOKENS_PER_MINUTE = int(os.getenv('OPENROUTER_TOKENS_PER_MINUTE', '100000'))
+OPENROUTER_MAX_RETRIES = int(os.getenv('OPENROUTER_MAX_RETRIES', '4'))
+
+# Batched summarization: several short documents per chat completion
+SUMMARY_BATCH_MODE = os.getenv('SUMMARY_BATCH_MODE', 'false').lower() == 'true'
+SUMMARY_BATCH_TOKEN_BUDGET = int(os.getenv('SUMMARY_BATCH_TOKEN_BUDGET', '6000'))
+SUMMARY_BATCH_MAX_DOCS = int(os.getenv('SUMMARY_BATCH_MAX_DOCS', '8'))
+SUMMARY_BATCH_DOC_MAX_TOKENS = int(os.getenv('SUMMARY_BATCH_DOC_MAX_TOKENS', '600'))
+
+# Ordered OpenRouter models as "model=slo_seconds"; after a model's SLO the
+# request is hedged to the next model and the first good answer wins
+OPENROUTER_MODELS = [
+    (entry.rsplit('=', 1)[0].strip(), float(entry.rsplit('=', 1)[1]) if '=' in entry else 20.0)
+    for entry in os.getenv(
+        'OPENROUTER_MODELS',
+        'meta-llama/llama-3.1-70b-instruct=20,meta-llama/llama-3.1-8b-instruct=20'
+    ).split(',')
+    if entry.strip()
+]
+
+# Summarizer backend: 'llm' (OpenRouter with local fallback) or 'extractive' (local only)
+SUMMARIZER_BACKEND = os.getenv('SUMMARIZER_BACKEND', 'llm').lower()
+# Fall back to the local summarizer when an LLM call takes longer than this many seconds (time queued
+# for the rate limiter doesn't count), or past this many LLM calls per run (0 = no limit)
+LLM_DEADLINE_SECONDS = float(os.getenv('LLM_DEADLINE_SECONDS', '120'))
+LLM_CALL_BUDGET = int(os.getenv('LLM_CALL_BUDGET', '0'))
+# ...or when a call waits longer than this for the rate limiter and a concurrency slot (0 = no limit)
+LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', '900'))
+
+# Prompt construction: document text is cleaned and the most relevant
+# paragraphs are kept up to this many tokens (tiktoken encoding if installed)
+PROMPT_TOKEN_BUDGET = int(os.getenv('PROMPT_TOKEN_BUDGET', '1500'))
+TOKENIZER_ENCODING = os.getenv('TOKENIZER_ENCODING', 'cl100k_base')
+
+# Long documents (over LONG_DOC_THRESHOLD_TOKENS) are summarized map-reduce style:
+# parts of ~LONG_DOC_CHUNK_TOKENS in parallel, then one call merges the part notes
+LONG_DOC_THRESHOLD_TOKENS = int(os.getenv('LONG_DOC_THRESHOLD_TOKENS', '4000'))
+LONG_DOC_CHUNK_TOKENS = int(os.getenv('LONG_DOC_CHUNK_TOKENS', '3000'))
+LONG_DOC_MAX_CHUNKS = int(os.getenv('LONG_DOC_MAX_CHUNKS', '8'))
+
+# Duplicate documents (same or nearly the same text) share one summary;
+# SimHash bit distance up to which two texts count as the same document
+DEDUP_ENABLED = os.getenv('DEDUP_ENABLED', 'true').lower() == 'true'
+DEDUP_MAX_DISTANCE = int(os.getenv('DEDUP_MAX_DISTANCE', '3'))
+
+# Exactly-once Browse AI items: a local index of processed items plus a
+# per-robot task watermark; every monitor task since the watermark is read
+SEEN_INDEX_ENABLED = os.getenv('SEEN_INDEX_ENABLED', 'true').lower() == 'true'
+BROWSE_AI_MAX_TASK_PAGES = int(os.getenv('BROWSE_AI_MAX_TASK_PAGES', '10'))
+# Task pages requested ahead while paging, and the local cache of finished tasks
+BROWSE_AI_PREFETCH_PAGES = int(os.getenv('BROWSE_AI_PREFETCH_PAGES', '2'))
+BROWSE_AI_TASK_CACHE_ENABLED = os.getenv('BROWSE_AI_TASK_CACHE_ENABLED', 'true').lower() == 'true'
+
+# Browse AI webhook: deliveries must carry an HMAC-SHA256 of the raw body
+# (hex, optionally "sha256=" prefixed) made with this secret
+BROWSE_AI_WEBHOOK_SECRET = os.getenv('BROWSE_AI_WEBHOOK_SECRET')
+BROWSE_AI_WEBHOOK_SIGNATURE_HEADER = os.getenv('BROWSE_AI_WEBHOOK_SIGNATURE_HEADER', 'X-Browse-AI-Signature')
+
+# API job queue: a running job's lease is renewed while it runs; a job whose
+# lease lapses is retried (up to JOB_MAX_ATTEMPTS). Finished jobs are kept this many days
+JOB_LEASE_SECONDS = float(os.getenv('JOB_LEASE_SECONDS', '60'))
+JOB_MAX_ATTEMPTS = int(os.getenv('JOB_MAX_ATTEMPTS', '2'))
+JOB_HISTORY_DAYS = float(os.getenv('JOB_HISTORY_DAYS', '14'))
+JOB_EVENT_POLL_SECONDS = float(os.getenv('JOB_EVENT_POLL_SECONDS', '0.5'))
+
+# API newsletter state is shared by all workers through SQLite; each worker
+# reuses its in-memory copy for this many seconds before checking for changes.
+# A newsletter generation holds a cluster-wide lease, renewed while it runs
+NEWSLETTER_CACHE_SECONDS = float(os.getenv('NEWSLETTER_CACHE_SECONDS', '2'))
+GENERATION_LOCK_SECONDS = float(os.getenv('GENERATION_LOCK_SECONDS', '120'))
+
+# History archive of every processed item (searchable through /api/items)
+ARCHIVE_ENABLED = os.getenv('ARCHIVE_ENABLED', 'true').lower() == 'true'
+ARCHIVE_PAGE_SIZE = int(os.getenv('ARCHIVE_PAGE_SIZE', '50'))
+ARCHIVE_MAX_PAGE_SIZE = int(os.getenv('ARCHIVE_MAX_PAGE_SIZE', '200'))
+
+# Optional in-process scheduler for the API service: polls each robot on its
+# own interval (minutes, 0 disables) and sends the digest on a cron schedule
+SCHEDULER_ENABLED = os.getenv('SCHEDULER_ENABLED', 'false').lower() == 'true'
+SCHEDULER_TIMEZONE = os.getenv('SCHEDULER_TIMEZONE', 'Asia/Kolkata')
+CIRCULARS_POLL_MINUTES = float(os.getenv('CIRCULARS_POLL_MINUTES', '30'))
+NOTIFICATIONS_POLL_MINUTES = float(os.getenv('NOTIFICATIONS_POLL_MINUTES', '30'))
+PRESS_RELEASES_POLL_MINUTES = float(os.getenv('PRESS_RELEASES_POLL_MINUTES', '60'))
+DIGEST_CRON = os.getenv('DIGEST_CRON', '30 9 * * *')
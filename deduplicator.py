@@ -0,0 +1,87 @@
+import hashlib
+import re
+import threading
+from config import DEDUP_MAX_DISTANCE
+from text_preprocessor import normalise_text
+
+SIMHASH_BITS = 64
+SHINGLE_WORDS = 3
+
+
+def canonical_text(text):
+    """Lower-cased, whitespace-collapsed text so layout differences don't matter"""
+    return re.sub(r'\s+', ' ', normalise_text(text)).strip().lower()
+
+
+def content_hash(text):
+    return hashlib.sha256(canonical_text(text).encode('utf-8')).hexdigest()
+
+
+def simhash(text):
+    """64-bit SimHash over 3-word shingles; similar texts differ in few bits"""
+    words = re.findall(r'\w+', canonical_text(text))
+    shingles = [" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))]
+    
+    weights = [0] * SIMHASH_BITS
+    for shingle in shingles:
+        value = int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'big')
+        for bit in range(SIMHASH_BITS):
+            weights[bit] += 1 if value >> bit & 1 else -1
+    
+    return sum(1 << bit for bit in range(SIMHASH_BITS) if weights[bit] > 0)
+
+
+def hamming_distance(a, b):
+    return bin(a ^ b).count('1')
+
+
+class DocumentDeduplicator:
+    """
+    Finds documents whose extracted text was already seen in this run
+    
+    Exact copies are matched on a hash of the normalised text, near copies
+    (a reissued corrigendum, the same PDF re-extracted, a circular also
+    published as a notification) on SimHash distance. SimHashes are split
+    into max_distance + 1 bands; two hashes within max_distance bits agree
+    on at least one band, so only documents sharing a band are compared.
+    """
+    
+    def __init__(self, max_distance=DEDUP_MAX_DISTANCE):
+        self.max_distance = max(0, max_distance)
+        self.bands = self.max_distance + 1
+        self.band_bits = -(-SIMHASH_BITS // self.bands)
+        self.exact = {}
+        self.band_index = {}
+        self._lock = threading.Lock()
+    
+    def _band_keys(self, fingerprint):
+        mask = (1 << self.band_bits) - 1
+        return [(band, fingerprint >> (band * self.band_bits) & mask) for band in range(self.bands)]
+    
+    def find_or_add(self, text, document):
+        """
+        The earlier document with the same or nearly the same text, else None
+        
+        When nothing matches, document is remembered as the original for
+        later copies.
+        """
+        digest = content_hash(text)
+        fingerprint = simhash(text)
+        
+        with self._lock:
+            if digest in self.exact:
+                return self.exact[digest]
+            
+            best, best_distance = None, self.max_distance + 1
+            for key in self._band_keys(fingerprint):
+                for other_fingerprint, other in self.band_index.get(key, []):
+                    distance = hamming_distance(fingerprint, other_fingerprint)
+                    if distance < best_distance:
+                        best, best_distance = other, distance
+            if best is not None:
+                return best
+            
+            self.exact[digest] = document
+            for key in self._band_keys(fingerprint):
+                self.band_index.setdefault(key, []).append((fingerprint, document))
+            return None
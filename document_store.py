@@ -0,0 +1,139 @@
+import gzip
+import hashlib
+import io
+import os
+import shutil
+import threading
+import time
+from local_store import cache_path, connect
+
+
+class DocumentStore:
+    """
+    On-disk store of downloaded PDFs and their extracted text
+    
+    Raw bytes are kept gzip-compressed under blobs/, addressed by SHA-256.
+    An index maps each PDF URL to its current content hash plus the
+    ETag/Last-Modified validators needed for conditional GETs.
+    """
+    
+    def __init__(self, root=None):
+        self.root = root or os.path.dirname(cache_path('documents', 'index.db'))
+        self._lock = threading.Lock()
+        self._conn = connect(os.path.join(self.root, 'index.db'))
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS documents (
+                url TEXT PRIMARY KEY,
+                content_hash TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS texts (
+                content_hash TEXT PRIMARY KEY,
+                text TEXT NOT NULL,
+                covers INTEGER,
+                created_at REAL NOT NULL
+            )
+        """)
+    
+    @staticmethod
+    def content_hash(content):
+        return hashlib.sha256(content).hexdigest()
+    
+    def _blob_path(self, content_hash):
+        return os.path.join(self.root, 'blobs', content_hash[:2], f"{content_hash}.pdf.gz")
+    
+    def _lookup(self, url):
+        with self._lock:
+            return self._conn.execute("SELECT * FROM documents WHERE url = ?", (url,)).fetchone()
+    
+    def conditional_headers(self, url):
+        """Headers for a conditional GET, or {} if we have no usable copy of the URL"""
+        row = self._lookup(url)
+        if row is None or not os.path.exists(self._blob_path(row['content_hash'])):
+            return {}
+        
+        headers = {}
+        if row['etag']:
+            headers['If-None-Match'] = row['etag']
+        if row['last_modified']:
+            headers['If-Modified-Since'] = row['last_modified']
+        return headers
+    
+    def load(self, url):
+        """Return the stored bytes for a URL, or None"""
+        stream = self.open(url)
+        if stream is None:
+            return None
+        with stream:
+            return stream.read()
+    
+    def open(self, url):
+        """Return a decompressing reader over the stored copy of a URL, or None"""
+        row = self._lookup(url)
+        if row is None:
+            return None
+        
+        try:
+            return gzip.open(self._blob_path(row['content_hash']), 'rb')
+        except OSError:
+            return None
+    
+    def save(self, url, content, etag=None, last_modified=None):
+        """Store downloaded bytes for a URL and return their content hash"""
+        return self.save_stream(url, io.BytesIO(content), self.content_hash(content), len(content), etag, last_modified)
+    
+    def save_stream(self, url, stream, content_hash, size, etag=None, last_modified=None):
+        """Store a downloaded body read from a stream whose hash is already known"""
+        path = self._blob_path(content_hash)
+        
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.{threading.get_ident()}.tmp"
+            with gzip.open(tmp_path, 'wb') as f:
+                shutil.copyfileobj(stream, f)
+            os.replace(tmp_path, path)
+        
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO documents (url, content_hash, etag, last_modified, size, fetched_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (url, content_hash, etag, last_modified, size, time.time())
+            )
+        return content_hash
+    
+    def get_text(self, content_hash, min_chars=None):
+        """
+        Return previously extracted text for a content hash, or None
+        
+        Text that was cut short by an extraction limit is only returned if it
+        covers at least min_chars characters (min_chars=None asks for the full text).
+        """
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT text, covers FROM texts WHERE content_hash = ?", (content_hash,)
+            ).fetchone()
+        
+        if row is None:
+            return None
+        if row['covers'] is None or (min_chars is not None and row['covers'] >= min_chars):
+            return row['text']
+        return None
+    
+    def put_text(self, content_hash, text, covers=None):
+        """
+        Store extracted text
+        
+        Args:
+            covers: How many leading characters of the document the text is
+                    known to cover when extraction stopped early (None = all of it)
+        """
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO texts (content_hash, text, covers, created_at) VALUES (?, ?, ?, ?)",
+                (content_hash, text, covers, time.time())
+            )
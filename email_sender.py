@@ -4,6 +4,7 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
 from config import SENDGRID_API_KEY, EMAIL_FROM, EMAIL_TO
+from html_formatter import HTMLFormatter
 
 class EmailSender:
     def __init__(self):
@@ -134,7 +135,7 @@ class EmailSender:
                 html += f"""
                 <div class="item-card">
                     <div class="item-number">{item['number']}</div>
-                    <div class="item-date">📅 {item['date']}</div>
+                    <div class="item-date">📅 {item['date']}</div>{HTMLFormatter.aliases_html(item, 'item-date')}
                     <div class="item-summary">{item['summary']}</div>
                     <a href="{item['pdf_url']}" class="pdf-button">📄 View PDF</a>
                 </div>
@@ -154,7 +155,7 @@ class EmailSender:
                 html += f"""
                 <div class="item-card">
                     <div class="item-number">{item['number']}</div>
-                    <div class="item-date">📅 {item['date']}</div>
+                    <div class="item-date">📅 {item['date']}</div>{HTMLFormatter.aliases_html(item, 'item-date')}
                     <div class="item-summary">{item['summary']}</div>
                     <a href="{item['pdf_url']}" class="pdf-button">📄 View PDF</a>
                 </div>
@@ -0,0 +1,161 @@
+import math
+import re
+from collections import Counter
+from summarizer_backend import SummarizerBackend
+
+# Abbreviations that end in a period without ending the sentence
+ABBREVIATIONS = {
+    'no', 'nos', 'sec', 'secs', 'u/s', 'rs', 'i.e', 'e.g', 'viz', 'etc', 'vs', 'dt', 'dated',
+    'f', 'govt', 'cl', 'para', 'paras', 'sub', 'st', 'w.e.f', 'a.y', 'f.y', 'r/w', 'mr', 'ms', 'dr', 'sh', 'smt',
+}
+
+STOPWORDS = set("""
+a an and are as at be been by for from has have in is it its of on or that the this to was were which with
+under such any all shall may be been being their there these those other than into also said per
+""".split())
+
+# Phrases that signal the operative content of a CBDT circular or notification
+OPERATIVE_PATTERNS = [
+    r'\bextend(?:s|ed|ing)?\b', r'\bdue date\b', r'\bhereby\b', r'\bnotif(?:y|ies|ied)\b',
+    r'\bamend(?:s|ed|ment)?\b', r'\bsection \d+', r'\brule \d+', r'\bcome(?:s)? into force\b',
+    r'\bwith effect from\b', r'\bassessment year\b', r'\bfinancial year\b', r'\bexempt(?:ion|ed)?\b',
+    r'\bdeduct(?:ion|ed)?\b', r'\bform (?:no\.? ?)?\d+', r'\bclarif(?:y|ies|ied|ication)\b',
+    r'\bcondon(?:e|ation)\b', r'\btaxpayers?\b', r'\bdecided\b', r'\bspecif(?:y|ies|ied)\b',
+]
+
+# Letterhead, addresses and signature blocks
+BOILERPLATE_PATTERNS = [
+    r'government of india', r'ministry of finance', r'department of revenue', r'central board of direct taxes',
+    r'^\s*f\.? ?no\.?', r'north block', r'new delhi', r'under secretary', r'director', r'copy (?:to|forwarded)',
+    r'\(.*?\)\s*$', r'published in the gazette', r'^\s*to\b', r'sir/madam', r'yours faithfully',
+]
+
+DATE_PATTERN = re.compile(
+    r'\b\d{1,2}(?:st|nd|rd|th)?[\s./-](?:\d{1,2}|jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*[\s.,/-]+\d{2,4}\b',
+    re.IGNORECASE
+)
+WORD_PATTERN = re.compile(r"[a-z][a-z0-9/.-]*[a-z0-9]|[a-z]", re.IGNORECASE)
+
+OPERATIVE_RE = [re.compile(pattern, re.IGNORECASE) for pattern in OPERATIVE_PATTERNS]
+BOILERPLATE_RE = [re.compile(pattern, re.IGNORECASE) for pattern in BOILERPLATE_PATTERNS]
+
+
+def split_sentences(text):
+    """Split CBDT-style text into sentences, respecting 'No.', 'u/s.', 'i.e.' and numbering"""
+    text = re.sub(r'-\n(?=[a-z])', '', text)
+    text = re.sub(r'\s+', ' ', text).strip()
+    
+    sentences, start = [], 0
+    for match in re.finditer(r'[.;?!](?=\s+["(]?[A-Z0-9])', text):
+        end = match.end()
+        previous_word = text[start:end - 1].rsplit(' ', 1)[-1].lower().strip('(')
+        # "No. 5", "Sec. 10", "2." list numbering and initials are not sentence ends
+        if previous_word in ABBREVIATIONS or re.fullmatch(r'\d{1,2}|[a-z]|\(?[ivx]+\)?', previous_word):
+            continue
+        sentences.append(text[start:end].strip())
+        start = end
+    
+    if start < len(text):
+        sentences.append(text[start:].strip())
+    return [sentence for sentence in sentences if len(sentence) > 20]
+
+
+def words(sentence):
+    return [w.lower() for w in WORD_PATTERN.findall(sentence) if w.lower() not in STOPWORDS]
+
+
+class ExtractiveSummarizer(SummarizerBackend):
+    """
+    Local, CPU-only extractive summarizer
+    
+    Scores sentences with TextRank over TF-IDF vectors, boosts the phrases
+    that carry the operative content of CBDT circulars and notifications
+    (extensions, due dates, sections, forms, dates) and penalises
+    letterhead and signature boilerplate. The best sentences are returned
+    in document order. No network and no model; a document takes
+    milliseconds.
+    """
+    
+    name = "extractive"
+    
+    def __init__(self, max_sentences=3, max_chars=700, max_input_sentences=150):
+        self.max_sentences = max_sentences
+        self.max_chars = max_chars
+        self.max_input_sentences = max_input_sentences
+    
+    def summarize_document(self, text, doc_type, doc_number):
+        sentences = split_sentences(text or "")[:self.max_input_sentences]
+        if not sentences:
+            return (text or "").strip()[:self.max_chars]
+        
+        scores = self.score_sentences(sentences)
+        ranked = sorted(range(len(sentences)), key=lambda index: scores[index], reverse=True)
+        
+        chosen, length = [], 0
+        for index in ranked:
+            if len(chosen) >= self.max_sentences:
+                break
+            if chosen and length + len(sentences[index]) > self.max_chars:
+                continue
+            chosen.append(index)
+            length += len(sentences[index])
+        
+        summary = " ".join(sentences[index] for index in sorted(chosen))
+        return summary[:self.max_chars].rstrip()
+    
+    def score_sentences(self, sentences):
+        tokens = [words(sentence) for sentence in sentences]
+        vectors = self.tfidf_vectors(tokens)
+        centrality = self.textrank(vectors)
+        
+        scores = []
+        for index, sentence in enumerate(sentences):
+            score = centrality[index]
+            score *= 1 + 0.5 * sum(1 for pattern in OPERATIVE_RE if pattern.search(sentence))
+            if DATE_PATTERN.search(sentence):
+                score *= 1.5
+            if any(pattern.search(sentence) for pattern in BOILERPLATE_RE):
+                score *= 0.2
+            if len(tokens[index]) < 5:
+                score *= 0.5
+            # Operative paragraphs usually come early, right after the letterhead
+            score *= 1 + 0.3 / (1 + index / 5)
+            scores.append(score)
+        return scores
+    
+    @staticmethod
+    def tfidf_vectors(tokens):
+        document_frequency = Counter(word for sentence in tokens for word in set(sentence))
+        count = len(tokens)
+        vectors = []
+        for sentence in tokens:
+            term_frequency = Counter(sentence)
+            vector = {
+                word: (frequency / len(sentence)) * (math.log((1 + count) / (1 + document_frequency[word])) + 1)
+                for word, frequency in term_frequency.items()
+            }
+            norm = math.sqrt(sum(value * value for value in vector.values())) or 1.0
+            vectors.append({word: value / norm for word, value in vector.items()})
+        return vectors
+    
+    @staticmethod
+    def textrank(vectors, damping=0.85, iterations=30):
+        count = len(vectors)
+        if count == 1:
+            return [1.0]
+        
+        weights = [[0.0] * count for _ in range(count)]
+        for i in range(count):
+            for j in range(i + 1, count):
+                small, large = sorted((vectors[i], vectors[j]), key=len)
+                similarity = sum(value * large.get(word, 0.0) for word, value in small.items())
+                weights[i][j] = weights[j][i] = similarity
+        
+        totals = [sum(row) or 1.0 for row in weights]
+        ranks = [1.0 / count] * count
+        for _ in range(iterations):
+            ranks = [
+                (1 - damping) / count + damping * sum(weights[j][i] * ranks[j] / totals[j] for j in range(count))
+                for i in range(count)
+            ]
+        return ranks
@@ -1,6 +1,16 @@
 from datetime import datetime
 
 class HTMLFormatter:
+    @staticmethod
+    def aliases_html(item, css_class='item-meta'):
+        """Line listing the other numbers the same document was published under (shared with the email)"""
+        aliases = item.get('aliases')
+        if not aliases:
+            return ""
+        names = ", ".join(f"{alias['type']} {alias['number']}" for alias in aliases)
+        return f"""
+            <div class="{css_class}">🔁 Also issued as {names}</div>"""
+    
     @staticmethod
     def format_newsletter_html(processed_data):
         """Format newsletter as HTML with professional styling"""
@@ -147,7 +157,7 @@ class HTMLFormatter:
                 html += f"""
         <div class="item">
             <h3>{item['number']}</h3>
-            <div class="item-meta"> Date: {item['date']}</div>
+            <div class="item-meta"> Date: {item['date']}</div>{HTMLFormatter.aliases_html(item)}
             <div class="item-summary">{item['summary']}</div>
             <a href="{item.get('pdf_url', '#')}" class="pdf-link" target="_blank">📄 View PDF</a>
         </div>
@@ -164,7 +174,7 @@ class HTMLFormatter:
                 html += f"""
         <div class="item">
             <h3>{item['number']}</h3>
-            <div class="item-meta">Date: {item['date']}</div>
+            <div class="item-meta">Date: {item['date']}</div>{HTMLFormatter.aliases_html(item)}
             <div class="item-summary">{item['summary']}</div>
             <a href="{item.get('pdf_url', '#')}" class="pdf-link" target="_blank">📄 View PDF</a>
         </div>
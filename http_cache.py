@@ -0,0 +1,69 @@
+import gzip
+import hashlib
+import json
+from fastapi import Response
+
+try:
+    import brotli
+except ImportError:  # optional; only gzip variants are served without it
+    brotli = None
+
+
+def accepted_encodings(header):
+    """Content codings the client accepts (q > 0), from an Accept-Encoding header"""
+    accepted = set()
+    for part in (header or '').split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = params.strip()
+        if quality.startswith('q='):
+            try:
+                if float(quality[2:]) <= 0:
+                    continue
+            except ValueError:
+                continue
+        if coding:
+            accepted.add(coding.strip().lower())
+    return accepted
+
+
+class PrecomputedResponse:
+    """
+    A JSON body serialized and compressed once, then served many times
+    
+    Each variant (identity, gzip, brotli) has its own strong ETag, so a
+    client that sends one back in If-None-Match gets a bodiless 304.
+    """
+    
+    def __init__(self, content, cache_control='no-cache'):
+        # Same serialization as FastAPI's JSONResponse
+        body = json.dumps(content, ensure_ascii=False, allow_nan=False, indent=None, separators=(',', ':')).encode('utf-8')
+        tag = hashlib.sha256(body).hexdigest()[:32]
+        self.cache_control = cache_control
+        
+        self.variants = {None: (body, f'"{tag}"')}
+        self.variants['gzip'] = (gzip.compress(body, compresslevel=9, mtime=0), f'"{tag}-gz"')
+        if brotli is not None:
+            self.variants['br'] = (brotli.compress(body), f'"{tag}-br"')
+        self.etags = {etag for _, etag in self.variants.values()}
+    
+    def not_modified(self, if_none_match):
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == '*':
+            return True
+        # If-None-Match uses weak comparison, so a W/ prefix still matches
+        candidates = {tag.strip().removeprefix('W/') for tag in if_none_match.split(',')}
+        return not candidates.isdisjoint(self.etags)
+    
+    def respond(self, request):
+        accepted = accepted_encodings(request.headers.get('accept-encoding'))
+        encoding = next((coding for coding in ('br', 'gzip') if coding in accepted and coding in self.variants), None)
+        body, etag = self.variants[encoding]
+        
+        headers = {'ETag': etag, 'Cache-Control': self.cache_control, 'Vary': 'Accept-Encoding'}
+        if self.not_modified(request.headers.get('if-none-match')):
+            return Response(status_code=304, headers=headers)
+        
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        return Response(content=body, media_type='application/json', headers=headers)
@@ -0,0 +1,101 @@
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from config import (
+    HTTP_POOL_CONNECTIONS, HTTP_POOL_MAXSIZE, HTTP_MAX_RETRIES, HTTP_BACKOFF_FACTOR,
+    BROWSE_AI_TIMEOUT, PDF_DOWNLOAD_TIMEOUT, OPENROUTER_TIMEOUT, SHAREPOINT_TIMEOUT
+)
+
+# Default timeout (seconds) for each outbound service
+SERVICE_TIMEOUTS = {
+    'browse_ai': BROWSE_AI_TIMEOUT,
+    'pdf': PDF_DOWNLOAD_TIMEOUT,
+    'openrouter': OPENROUTER_TIMEOUT,
+    'sharepoint': SHAREPOINT_TIMEOUT,
+}
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+class ServiceRetry(Retry):
+    """
+    urllib3 Retry that keeps non-idempotent requests from running twice
+    
+    POSTs (Power Automate uploads) are only retried when the server cannot
+    have acted on them: connection errors, handled by Retry for every
+    method, and 429 responses. A read timeout or 5xx after a POST may come
+    from a request that was carried out, so it is not re-sent.
+    """
+    
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429 and status_code in (self.status_forcelist or ()):
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class ServiceSession(requests.Session):
+    """requests.Session that applies a default timeout to every request"""
+    
+    def __init__(self, timeout):
+        super().__init__()
+        self.timeout = timeout
+    
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def build_session(service, retries=None):
+    """
+    Create a pooled session for a service
+    
+    Args:
+        service: Key in SERVICE_TIMEOUTS (unknown services get a 30s timeout)
+        retries: Retries on connection errors and 429/5xx (defaults to HTTP_MAX_RETRIES);
+            POSTs are retried only on connection errors and 429
+    """
+    retries = HTTP_MAX_RETRIES if retries is None else retries
+    retry = ServiceRetry(
+        total=retries,
+        connect=retries,
+        read=retries,
+        status=retries,
+        backoff_factor=HTTP_BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUSES,
+        respect_retry_after_header=True,
+        raise_on_status=False,            # hand back the last response; callers check status
+    )
+    
+    # One keep-alive pool per host, shared by every thread using this session
+    adapter = HTTPAdapter(
+        pool_connections=HTTP_POOL_CONNECTIONS,
+        pool_maxsize=HTTP_POOL_MAXSIZE,
+        max_retries=retry,
+    )
+    
+    session = ServiceSession(SERVICE_TIMEOUTS.get(service, 30))
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def get_session(service):
+    """Get the process-wide shared session for a service"""
+    with _sessions_lock:
+        session = _sessions.get(service)
+        if session is None:
+            session = build_session(service)
+            _sessions[service] = session
+        return session
+
+
+def close_sessions():
+    """Close every shared session (drops pooled connections)"""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
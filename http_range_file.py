@@ -0,0 +1,199 @@
+import io
+import re
+import threading
+from collections import OrderedDict
+from config import PDF_RANGE_BLOCK_SIZE, PDF_RANGE_MAX_BLOCKS, PDF_RANGE_FULL_FETCH_RATIO
+from pdf_download import spool_response
+
+CONTENT_RANGE_RE = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+)')
+
+
+class HTTPRangeFile(io.RawIOBase):
+    """
+    Read-only, seekable file object backed by HTTP range requests
+    
+    Only the blocks that are actually read get fetched. Neighbouring missing
+    blocks are coalesced into one request, and fetched blocks are kept in an
+    LRU cache. Once the ranges read would pass full_fetch_ratio of the
+    file, the rest is served from one full GET instead. Use open_url() to
+    get a file object for a URL: it returns a HTTPRangeFile when the server
+    honours ranges, or a reader over the streamed, size-capped full body
+    when it does not.
+    """
+    
+    def __init__(self, url, session, size, block_size=PDF_RANGE_BLOCK_SIZE, max_blocks=PDF_RANGE_MAX_BLOCKS,
+                 full_fetch_ratio=PDF_RANGE_FULL_FETCH_RATIO):
+        super().__init__()
+        self.url = url
+        self.session = session
+        self.size = size
+        self.block_size = block_size
+        self.max_blocks = max(max_blocks, 2)
+        self.full_fetch_ratio = full_fetch_ratio
+        self.position = 0
+        self.bytes_fetched = 0
+        self.requests_made = 0
+        self._blocks = OrderedDict()
+        self._lock = threading.Lock()
+        # Trailer bytes from open_url (not block aligned, so kept whole)
+        self._tail_start = size
+        self._tail = b""
+        # Full body, once ranged reads stopped paying off
+        self._document = None
+        self._body = None
+    
+    @classmethod
+    def open_url(cls, url, session, block_size=PDF_RANGE_BLOCK_SIZE, max_blocks=PDF_RANGE_MAX_BLOCKS):
+        """
+        Open a URL for lazy reading
+        
+        The first request asks for the last block, which is where the PDF
+        trailer and usually the xref live, and tells us the file size.
+        """
+        response = session.get(url, headers={'Range': f'bytes=-{block_size}'}, stream=True)
+        
+        match = CONTENT_RANGE_RE.match(response.headers.get('Content-Range', ''))
+        if response.status_code != 206 or not match:
+            # Server ignored the range; spool the body we already have in full
+            return spool_response(response, url).open_stream()
+        
+        start, size = int(match.group(1)), int(match.group(3))
+        handle = cls(url, session, size, block_size, max_blocks)
+        handle._tail_start, handle._tail = start, response.content
+        handle._store_extent(start, response.content)
+        handle.requests_made = 1
+        handle.bytes_fetched = len(response.content)
+        return handle
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def tell(self):
+        return self.position
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_SET:
+            position = offset
+        elif whence == io.SEEK_CUR:
+            position = self.position + offset
+        elif whence == io.SEEK_END:
+            position = self.size + offset
+        else:
+            raise ValueError(f"invalid whence ({whence})")
+        
+        if position < 0:
+            raise ValueError("negative seek position")
+        self.position = position
+        return self.position
+    
+    def readinto(self, buffer):
+        length = min(len(buffer), max(self.size - self.position, 0))
+        if length == 0:
+            return 0
+        
+        data = self._read_range(self.position, self.position + length)
+        buffer[:length] = data
+        self.position += length
+        return length
+    
+    def _read_range(self, start, end):
+        first, last = start // self.block_size, (end - 1) // self.block_size
+        
+        with self._lock:
+            if self._body is None and start >= self._tail_start:
+                return self._tail[start - self._tail_start:end - self._tail_start]
+            
+            missing = [index for index in range(first, last + 1) if index not in self._blocks]
+            
+            # Runs of consecutive missing blocks, fetched with one request each
+            runs, run_start = [], None
+            for position, index in enumerate(missing):
+                if run_start is None:
+                    run_start = index
+                if position + 1 == len(missing) or missing[position + 1] != index + 1:
+                    runs.append((run_start, index))
+                    run_start = None
+            
+            if self._body is None and runs:
+                spans = [self._fetch_span(*run) for run in runs]
+                needed = sum(span_end - span_start for span_start, span_end in spans)
+                if self.bytes_fetched + needed > self.full_fetch_ratio * self.size:
+                    self._fetch_full()
+            if self._body is not None:
+                self._body.seek(start)
+                return self._body.read(end - start)
+            
+            for run in runs:
+                self._fetch_blocks(*run)
+            
+            blocks = []
+            for index in range(first, last + 1):
+                self._blocks.move_to_end(index)
+                blocks.append(self._blocks[index])
+            self._evict()
+        
+        data = b"".join(blocks)
+        offset = start - first * self.block_size
+        return data[offset:offset + end - start]
+    
+    def _fetch_span(self, first, last):
+        """Byte range [start, end) to request for blocks first..last, leaving out the trailer we have"""
+        start = first * self.block_size
+        return start, max(start, min((last + 1) * self.block_size, self.size, self._tail_start))
+    
+    def _fetch_blocks(self, first, last):
+        start, fetch_end = self._fetch_span(first, last)
+        data = b""
+        if fetch_end > start:
+            response = self.session.get(self.url, headers={'Range': f'bytes={start}-{fetch_end - 1}'})
+            response.raise_for_status()
+            
+            if response.status_code != 206:
+                raise IOError(f"Server stopped honouring range requests for {self.url}")
+            
+            self.requests_made += 1
+            self.bytes_fetched += len(response.content)
+            data = response.content
+        
+        end = min((last + 1) * self.block_size, self.size)
+        if end > fetch_end:
+            data += self._tail[fetch_end - self._tail_start:end - self._tail_start]
+        self._store_extent(start, data)
+    
+    def _fetch_full(self):
+        response = self.session.get(self.url, stream=True)
+        self._document = spool_response(response, self.url)
+        self._body = self._document.open_stream()
+        self.requests_made += 1
+        self.bytes_fetched += self._document.size
+        self._blocks.clear()
+        self._tail = b""
+    
+    def _store_extent(self, start, data):
+        """Cache every whole block (or final partial block) contained in data"""
+        end = start + len(data)
+        index = -(-start // self.block_size)  # first block boundary at or after start
+        
+        while index * self.block_size < end:
+            block_start = index * self.block_size
+            block_end = min(block_start + self.block_size, self.size)
+            if block_end > end:
+                break
+            self._blocks[index] = data[block_start - start:block_end - start]
+            self._blocks.move_to_end(index)
+            index += 1
+        self._evict()
+    
+    def _evict(self):
+        while len(self._blocks) > self.max_blocks:
+            self._blocks.popitem(last=False)
+    
+    def close(self):
+        if self._document is not None:
+            self._body.close()
+            self._document.close()
+            self._document = self._body = None
+        super().close()
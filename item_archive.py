@@ -0,0 +1,257 @@
+import base64
+import json
+import re
+import threading
+import time
+from datetime import datetime, date
+from local_store import cache_path, connect
+from newsletter_store import record_key
+
+# Publish dates as the CBIC listings and press release pages write them
+DATE_FORMATS = (
+    '%Y-%m-%d', '%d-%m-%Y', '%d/%m/%Y', '%d.%m.%Y',
+    '%d %b %Y', '%d %B %Y', '%d-%b-%Y', '%d-%B-%Y', '%b %d, %Y', '%B %d, %Y',
+)
+WORD_RE = re.compile(r'\w+')
+
+
+def parse_date(text):
+    """ISO date (YYYY-MM-DD) of a listing's date text, or None if it can't be read"""
+    text = ' '.join((text or '').split())
+    for fmt in DATE_FORMATS:
+        try:
+            return datetime.strptime(text, fmt).date().isoformat()
+        except ValueError:
+            continue
+    return None
+
+
+def fts_query(text):
+    """Turn free text into an FTS5 query matching every word (the last one as a prefix)"""
+    words = WORD_RE.findall(text or '')
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def encode_cursor(sort_date, item_id):
+    return base64.urlsafe_b64encode(json.dumps([sort_date, item_id]).encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """(sort_date, id) of a cursor from encode_cursor; ValueError if it is malformed"""
+    try:
+        sort_date, item_id = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+    except Exception:
+        raise ValueError("Invalid cursor")
+    if not isinstance(sort_date, str) or not isinstance(item_id, int):
+        raise ValueError("Invalid cursor")
+    return sort_date, item_id
+
+
+class ItemArchive:
+    """
+    Every processed item, kept for browsing and search
+    
+    Items are indexed by type, date and number. An FTS5 index covers
+    number, title, summary and extracted text. Listings are newest first
+    and paged with a keyset cursor (date, id), so a page costs the same
+    however deep into the archive it is.
+    """
+    
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = connect(path or cache_path('archive.db'))
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS items (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                item_key TEXT NOT NULL UNIQUE,
+                type TEXT NOT NULL,
+                number TEXT,
+                title TEXT,
+                published TEXT,
+                sort_date TEXT NOT NULL,
+                summary TEXT,
+                text TEXT,
+                record TEXT NOT NULL,
+                first_seen REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_items_date ON items (sort_date, id);
+            CREATE INDEX IF NOT EXISTS idx_items_type_date ON items (type, sort_date, id);
+            CREATE INDEX IF NOT EXISTS idx_items_type_number ON items (type, number);
+            
+            CREATE TABLE IF NOT EXISTS marks (
+                name TEXT PRIMARY KEY,
+                item_id INTEGER NOT NULL
+            );
+            
+            CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+                number, title, summary, text, content='items', content_rowid='id'
+            );
+            CREATE TRIGGER IF NOT EXISTS items_ai AFTER INSERT ON items BEGIN
+                INSERT INTO items_fts (rowid, number, title, summary, text)
+                VALUES (new.id, new.number, new.title, new.summary, new.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS items_ad AFTER DELETE ON items BEGIN
+                INSERT INTO items_fts (items_fts, rowid, number, title, summary, text)
+                VALUES ('delete', old.id, old.number, old.title, old.summary, old.text);
+            END;
+            CREATE TRIGGER IF NOT EXISTS items_au AFTER UPDATE ON items BEGIN
+                INSERT INTO items_fts (items_fts, rowid, number, title, summary, text)
+                VALUES ('delete', old.id, old.number, old.title, old.summary, old.text);
+                INSERT INTO items_fts (rowid, number, title, summary, text)
+                VALUES (new.id, new.number, new.title, new.summary, new.text);
+            END;
+        """)
+    
+    def add(self, entries):
+        """
+        Store (record, extracted text or None) pairs
+        
+        An item already in the archive is updated in place; its text is
+        kept if the new entry has none.
+        """
+        now = time.time()
+        today = date.today().isoformat()
+        rows = []
+        for record, text in entries:
+            published = record.get('date') or ''
+            rows.append({
+                'item_key': record_key(record),
+                'type': record['type'],
+                'number': record.get('number'),
+                'title': record.get('title'),
+                'published': published,
+                # Undated items sort by the day they were archived
+                'sort_date': parse_date(published) or today,
+                'summary': record.get('summary'),
+                'text': text,
+                'record': json.dumps(record),
+                'now': now
+            })
+        if not rows:
+            return
+        
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany("""
+                    INSERT INTO items (item_key, type, number, title, published, sort_date, summary, text, record,
+                                       first_seen, updated_at)
+                    VALUES (:item_key, :type, :number, :title, :published, :sort_date, :summary, :text, :record,
+                            :now, :now)
+                    ON CONFLICT (item_key) DO UPDATE SET
+                        published = excluded.published,
+                        sort_date = excluded.sort_date,
+                        summary = excluded.summary,
+                        text = COALESCE(excluded.text, items.text),
+                        record = excluded.record,
+                        updated_at = excluded.updated_at
+                """, rows)
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    def search(self, doc_type=None, date_from=None, date_to=None, query=None, cursor=None, limit=50):
+        """
+        One page of archived items, newest first
+        
+        Args:
+            doc_type: 'Circular', 'Notification' or 'Press Release'
+            date_from, date_to: inclusive ISO dates
+            query: free text, matched against number, title, summary and text
+            cursor: next_cursor of the previous page
+        
+        Returns:
+            (items, next_cursor); next_cursor is None on the last page.
+            Items are the stored records plus archived_at, and a snippet
+            of the matching text when searching.
+        """
+        conditions, params = [], []
+        if doc_type:
+            conditions.append("items.type = ?")
+            params.append(doc_type)
+        if date_from:
+            conditions.append("items.sort_date >= ?")
+            params.append(date_from)
+        if date_to:
+            conditions.append("items.sort_date <= ?")
+            params.append(date_to)
+        if cursor:
+            conditions.append("(items.sort_date, items.id) < (?, ?)")
+            params.extend(decode_cursor(cursor))
+        
+        match = fts_query(query)
+        if match:
+            source = "items JOIN items_fts ON items_fts.rowid = items.id"
+            snippet = "snippet(items_fts, -1, '[', ']', '…', 16)"
+            conditions.append("items_fts MATCH ?")
+            params.append(match)
+        else:
+            source, snippet = "items", "NULL"
+        
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        sql = (
+            f"SELECT items.id, items.sort_date, items.record, items.first_seen, {snippet} AS snippet "
+            f"FROM {source} {where} ORDER BY items.sort_date DESC, items.id DESC LIMIT ?"
+        )
+        
+        with self._lock:
+            rows = self._conn.execute(sql, (*params, limit + 1)).fetchall()
+        
+        items = []
+        for row in rows[:limit]:
+            item = json.loads(row['record'])
+            item['archived_at'] = datetime.fromtimestamp(row['first_seen']).isoformat()
+            if row['snippet'] is not None:
+                item['snippet'] = row['snippet']
+            items.append(item)
+        
+        next_cursor = encode_cursor(rows[limit - 1]['sort_date'], rows[limit - 1]['id']) if len(rows) > limit else None
+        return items, next_cursor
+    
+    # --- Digest: items archived since the last one sent ---
+    
+    def start_digest(self):
+        """Begin digests from the current end of the archive, unless they already started"""
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR IGNORE INTO marks (name, item_id) SELECT 'digest', COALESCE(MAX(id), 0) FROM items"
+            )
+    
+    def pending_digest(self):
+        """
+        Items archived since the last digest
+        
+        Returns:
+            (last_id, records) in archive order. A duplicate is left out when
+            its original is in the same digest, as the original lists it as
+            an alias; otherwise (the original went out in an earlier digest)
+            it is sent on its own. Pass last_id to mark_digested once the
+            digest went out.
+        """
+        with self._lock:
+            row = self._conn.execute("SELECT item_id FROM marks WHERE name = 'digest'").fetchone()
+            rows = self._conn.execute(
+                "SELECT id, record FROM items WHERE id > ? ORDER BY id", (row['item_id'] if row else 0,)
+            ).fetchall()
+        
+        records = [json.loads(row['record']) for row in rows]
+        last_id = rows[-1]['id'] if rows else None
+        originals = {record_key(record) for record in records if not record.get('duplicate_of')}
+        return last_id, [
+            record for record in records
+            if not record.get('duplicate_of') or record_key(record['duplicate_of']) not in originals
+        ]
+    
+    def mark_digested(self, last_id):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO marks (name, item_id) VALUES ('digest', ?) "
+                "ON CONFLICT (name) DO UPDATE SET item_id = MAX(item_id, excluded.item_id)",
+                (last_id,)
+            )
@@ -0,0 +1,299 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from config import JOB_LEASE_SECONDS, JOB_MAX_ATTEMPTS, JOB_HISTORY_DAYS
+from local_store import cache_path, connect
+
+ACTIVE_STATUSES = ('queued', 'running')
+FINISHED_STATUSES = ('completed', 'failed')
+
+
+class JobStore:
+    """
+    Durable job queue with a progress event log per job
+    
+    Jobs and their events live in SQLite, so they survive restarts and are
+    visible to every process sharing the database. A running job holds a
+    lease that its worker renews; a job whose lease runs out (the worker
+    died) is handed to the next worker, up to JOB_MAX_ATTEMPTS times.
+    """
+    
+    def __init__(self, path=None, lease_seconds=JOB_LEASE_SECONDS, max_attempts=JOB_MAX_ATTEMPTS):
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = connect(path or cache_path('jobs.db'))
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                params TEXT NOT NULL,
+                status TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                started_at REAL,
+                finished_at REAL,
+                heartbeat_at REAL,
+                worker TEXT,
+                attempts INTEGER NOT NULL DEFAULT 0,
+                result TEXT,
+                error TEXT
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_status ON jobs (status, created_at)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS job_events (
+                job_id TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                data TEXT NOT NULL,
+                PRIMARY KEY (job_id, seq)
+            )
+        """)
+    
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    @staticmethod
+    def _job(row):
+        if row is None:
+            return None
+        job = dict(row)
+        job['params'] = json.loads(job['params'])
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+    
+    def get(self, job_id):
+        with self._lock:
+            return self._job(self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone())
+    
+    def latest(self, kind):
+        """Most recently created job of a kind, or None"""
+        with self._lock:
+            return self._job(self._conn.execute(
+                "SELECT * FROM jobs WHERE kind = ? ORDER BY created_at DESC LIMIT 1", (kind,)
+            ).fetchone())
+    
+    def submit(self, kind, params=None, single_flight=False, min_interval=None):
+        """
+        Queue a job
+        
+        Returns:
+            (job, created). With single_flight, an already queued or running
+            job of the same kind is returned instead of queueing a second one;
+            with min_interval, so is one created less than that many seconds
+            ago. The checks and the insert happen in one write transaction.
+        """
+        with self._transaction() as conn:
+            if min_interval:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE kind = ? AND created_at > ? ORDER BY created_at DESC LIMIT 1",
+                    (kind, time.time() - min_interval)
+                ).fetchone()
+                if row is not None:
+                    return self._job(row), False
+            
+            if single_flight:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE kind = ? AND status IN (?, ?) ORDER BY created_at LIMIT 1",
+                    (kind, *ACTIVE_STATUSES)
+                ).fetchone()
+                if row is not None:
+                    return self._job(row), False
+            
+            job_id = uuid.uuid4().hex
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, created_at) VALUES (?, ?, ?, 'queued', ?)",
+                (job_id, kind, json.dumps(params or {}), time.time())
+            )
+        
+        self.add_event(job_id, {'event': 'queued', 'kind': kind})
+        return self.get(job_id), True
+    
+    def claim(self, worker, on_abandon=None):
+        """
+        Take the oldest queued job, or one whose worker stopped renewing its lease
+        
+        A job out of attempts is marked failed instead; on_abandon(job), if
+        given, is then called for it outside the transaction.
+        """
+        abandoned = []
+        try:
+            return self._claim(worker, abandoned)
+        finally:
+            for job in abandoned:
+                if on_abandon:
+                    on_abandon(job)
+    
+    def _claim(self, worker, abandoned):
+        now = time.time()
+        while True:
+            with self._transaction() as conn:
+                row = conn.execute(
+                    "SELECT * FROM jobs WHERE status = 'queued' OR (status = 'running' AND heartbeat_at < ?) "
+                    "ORDER BY created_at LIMIT 1",
+                    (now - self.lease_seconds,)
+                ).fetchone()
+                if row is None:
+                    return None
+                
+                if row['attempts'] >= self.max_attempts:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'failed', finished_at = ?, error = ? WHERE id = ?",
+                        (now, "Worker stopped responding", row['id'])
+                    )
+                    # Same transaction: a reader that sees the job failed also sees this event
+                    conn.execute(
+                        "INSERT INTO job_events (job_id, seq, created_at, data) "
+                        "SELECT ?, COALESCE(MAX(seq), 0) + 1, ?, ? FROM job_events WHERE job_id = ?",
+                        (row['id'], now, json.dumps({'event': 'failed', 'error': "Worker stopped responding"}), row['id'])
+                    )
+                    abandoned.append(self._job(row))
+                    continue
+                
+                conn.execute(
+                    "UPDATE jobs SET status = 'running', worker = ?, started_at = COALESCE(started_at, ?), "
+                    "heartbeat_at = ?, attempts = attempts + 1 WHERE id = ?",
+                    (worker, now, now, row['id'])
+                )
+            return self.get(row['id'])
+    
+    def heartbeat(self, job_id, worker):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ? AND status = 'running'",
+                (time.time(), job_id, worker)
+            )
+    
+    def finish(self, job_id, status, result=None, error=None):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, finished_at = ?, result = ?, error = ? WHERE id = ?",
+                (status, time.time(), json.dumps(result) if result is not None else None, error, job_id)
+            )
+    
+    def add_event(self, job_id, data):
+        """Append a progress event; events get increasing sequence numbers per job"""
+        with self._transaction() as conn:
+            seq = conn.execute(
+                "SELECT COALESCE(MAX(seq), 0) + 1 FROM job_events WHERE job_id = ?", (job_id,)
+            ).fetchone()[0]
+            conn.execute(
+                "INSERT INTO job_events (job_id, seq, created_at, data) VALUES (?, ?, ?, ?)",
+                (job_id, seq, time.time(), json.dumps(data))
+            )
+        return seq
+    
+    def events(self, job_id, after=0):
+        """(seq, data) pairs for events after the given sequence number"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT seq, data FROM job_events WHERE job_id = ? AND seq > ? ORDER BY seq",
+                (job_id, after)
+            ).fetchall()
+        return [(row['seq'], json.loads(row['data'])) for row in rows]
+    
+    def prune(self, days=JOB_HISTORY_DAYS):
+        """Drop finished jobs (and their events) older than the given age"""
+        cutoff = time.time() - days * 86400
+        with self._transaction() as conn:
+            conn.execute(
+                "DELETE FROM job_events WHERE job_id IN "
+                "(SELECT id FROM jobs WHERE status IN (?, ?) AND finished_at < ?)",
+                (*FINISHED_STATUSES, cutoff)
+            )
+            conn.execute(
+                "DELETE FROM jobs WHERE status IN (?, ?) AND finished_at < ?", (*FINISHED_STATUSES, cutoff)
+            )
+
+
+class JobRunner:
+    """
+    Runs queued jobs one at a time on a background thread
+    
+    handlers maps a job kind to a function(params, emit) returning a
+    JSON-able result; emit(data) appends a progress event to the job.
+    abandon_handlers maps a job kind to a function(params) called when a
+    job of that kind is given up after its workers kept dying, so it can
+    clean up what the handler would have on failure.
+    """
+    
+    def __init__(self, store, handlers, poll_interval=2.0, abandon_handlers=None):
+        self.store = store
+        self.handlers = handlers
+        self.abandon_handlers = abandon_handlers or {}
+        self.poll_interval = poll_interval
+        self.worker = f"{socket.gethostname()}:{os.getpid()}"
+        self._wake = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+    
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self.store.prune()
+                self._thread = threading.Thread(target=self._loop, name='job-runner', daemon=True)
+                self._thread.start()
+    
+    def wake(self):
+        """Check for queued jobs now instead of at the next poll"""
+        self._wake.set()
+    
+    def _loop(self):
+        while True:
+            try:
+                job = self.store.claim(self.worker, on_abandon=self.abandon)
+            except Exception as e:
+                print(f"⚠️ Job queue unavailable: {e}")
+                job = None
+            
+            if job is None:
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            
+            self.run(job)
+    
+    def abandon(self, job):
+        print(f"❌ Job {job['id']} ({job['kind']}) abandoned: its worker stopped responding")
+        handler = self.abandon_handlers.get(job['kind'])
+        if handler:
+            try:
+                handler(job['params'])
+            except Exception as e:
+                print(f"⚠️ Cleanup of abandoned job {job['id']} failed: {e}")
+    
+    def run(self, job):
+        job_id = job['id']
+        stop_heartbeat = threading.Event()
+        
+        def heartbeat():
+            while not stop_heartbeat.wait(self.store.lease_seconds / 3):
+                self.store.heartbeat(job_id, self.worker)
+        
+        threading.Thread(target=heartbeat, name=f'job-heartbeat-{job_id[:8]}', daemon=True).start()
+        self.store.add_event(job_id, {'event': 'started', 'attempt': job['attempts']})
+        
+        try:
+            handler = self.handlers[job['kind']]
+            result = handler(job['params'], lambda data: self.store.add_event(job_id, data))
+            # Final event first: a reader that sees the job finished has already got every event
+            self.store.add_event(job_id, {'event': 'completed', 'result': result})
+            self.store.finish(job_id, 'completed', result=result)
+        except Exception as e:
+            print(f"❌ Job {job_id} ({job['kind']}) failed: {e}")
+            self.store.add_event(job_id, {'event': 'failed', 'error': str(e)})
+            self.store.finish(job_id, 'failed', error=str(e))
+        finally:
+            stop_heartbeat.set()
@@ -0,0 +1,90 @@
+import math
+import threading
+import time
+from collections import defaultdict, deque
+from local_store import cache_path, connect
+
+
+def percentile(samples, fraction):
+    """Nearest-rank percentile of a list of numbers"""
+    if not samples:
+        return None
+    ordered = sorted(samples)
+    rank = max(0, min(len(ordered) - 1, math.ceil(fraction * len(ordered)) - 1))
+    return ordered[rank]
+
+
+class LatencyTracker:
+    """
+    Records per-model request latencies
+    
+    Recent samples are kept in memory for percentiles, and every sample is
+    also written to CACHE_DIR/model_latency.db so the model order and SLOs
+    can be tuned from history across runs.
+    """
+    
+    def __init__(self, path=None, window=500):
+        self.window = window
+        self._samples = defaultdict(lambda: deque(maxlen=self.window))
+        self._outcomes = defaultdict(lambda: defaultdict(int))
+        self._lock = threading.Lock()
+        self._conn = connect(path or cache_path('model_latency.db'))
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS latencies (
+                model TEXT NOT NULL,
+                seconds REAL NOT NULL,
+                outcome TEXT NOT NULL,
+                recorded_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_latencies_model ON latencies (model, recorded_at)")
+    
+    def record(self, model, seconds, outcome='ok'):
+        """
+        Args:
+            outcome: 'ok', 'error', or 'cancelled' (lost a hedge; seconds is a lower bound)
+        """
+        with self._lock:
+            if outcome == 'ok':
+                self._samples[model].append(seconds)
+            self._outcomes[model][outcome] += 1
+            self._conn.execute(
+                "INSERT INTO latencies (model, seconds, outcome, recorded_at) VALUES (?, ?, ?, ?)",
+                (model, seconds, outcome, time.time())
+            )
+    
+    def percentiles(self, model, since=None):
+        """p50/p90/p99 of successful requests (in-memory window, or history since a timestamp)"""
+        if since is None:
+            with self._lock:
+                samples = list(self._samples.get(model, ()))
+        else:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT seconds FROM latencies WHERE model = ? AND outcome = 'ok' AND recorded_at >= ?",
+                    (model, since)
+                ).fetchall()
+            samples = [row['seconds'] for row in rows]
+        
+        return {
+            'count': len(samples),
+            'p50': percentile(samples, 0.5),
+            'p90': percentile(samples, 0.9),
+            'p99': percentile(samples, 0.99),
+        }
+    
+    def report(self):
+        """One line per model seen in this process"""
+        with self._lock:
+            models = list(self._outcomes)
+        
+        lines = []
+        for model in models:
+            stats = self.percentiles(model)
+            outcomes = dict(self._outcomes[model])
+            if stats['count']:
+                timing = f"p50 {stats['p50']:.1f}s, p90 {stats['p90']:.1f}s, p99 {stats['p99']:.1f}s"
+            else:
+                timing = "no successful requests"
+            lines.append(f"{model}: {timing} ({', '.join(f'{k} {v}' for k, v in sorted(outcomes.items()))})")
+        return lines
@@ -1,82 +1,458 @@
-import requests
-from config import OPENROUTER_API_KEY
+import asyncio
+import json
+import threading
+from config import OPENROUTER_API_KEY, OPENROUTER_MODELS, SUMMARY_CACHE_ENABLED
+from config import SUMMARIZER_BACKEND, LLM_DEADLINE_SECONDS, LLM_QUEUE_TIMEOUT_SECONDS, LLM_CALL_BUDGET
+from config import SUMMARY_BATCH_MODE, SUMMARY_BATCH_TOKEN_BUDGET, SUMMARY_BATCH_MAX_DOCS, SUMMARY_BATCH_DOC_MAX_TOKENS
+from config import LONG_DOC_THRESHOLD_TOKENS, LONG_DOC_CHUNK_TOKENS, LONG_DOC_MAX_CHUNKS
+from extractive_summarizer import ExtractiveSummarizer
+from openrouter_client import AsyncOpenRouterClient, OpenRouterError, DeadlineExceeded, QueueTimeout
+from summarizer_backend import SummarizerBackend
+from summary_cache import SummaryCache
+from text_preprocessor import chunk_text, count_tokens, prepare_text
 
+# Bump whenever the prompt wording changes so cached summaries are invalidated
+PROMPT_VERSION = "3"
 
-class LLMSummarizer:
-    def __init__(self):
+SYSTEM_PROMPT = "You are a tax expert. Provide concise summaries without meta-commentary. Write directly and professionally."
+
+# Meta-phrases the model sometimes starts with anyway
+CLEANUP_PHRASES = [
+    "Here is a summary:",
+    "Here's a summary:",
+    "Here is the summary:",
+    "Here's the summary:",
+    "Summary:",
+    "The main update is that",
+    "The main change is that",
+    "In summary,",
+    "To summarize,",
+    "Here is a 2-3 sentence",
+    "Here is a 3-4 sentence",
+    "Here's a 2-3 sentence",
+    "Here's a 3-4 sentence"
+]
+
+ERROR_SUMMARY = "Summary unavailable due to API error"
+
+# Tokens we allow for each summary in a reply
+SUMMARY_REPLY_TOKENS = 300
+# Tokens we allow for the notes on one part of a long document
+PART_NOTES_REPLY_TOKENS = 200
+
+
+def estimate_tokens(text):
+    """Token count for rate limiting and batch packing"""
+    return count_tokens(text)
+
+
+class LLMSummarizer(SummarizerBackend):
+    name = "llm"
+    
+    def __init__(self, cache=None, client=None, batch_mode=SUMMARY_BATCH_MODE, models=None, fallback=None,
+                 deadline=LLM_DEADLINE_SECONDS, queue_timeout=LLM_QUEUE_TIMEOUT_SECONDS, call_budget=LLM_CALL_BUDGET):
         self.api_key = OPENROUTER_API_KEY
-        self.base_url = "https://openrouter.ai/api/v1/chat/completions"
-        self.model = "meta-llama/llama-3.1-70b-instruct"
+        # Ordered (model, latency SLO) pairs; later models are hedges for slow earlier ones
+        self.models = models or OPENROUTER_MODELS or [("meta-llama/llama-3.1-70b-instruct", 20.0)]
+        self.model = self.models[0][0]
+        # Cache lookups accept a summary from any configured model, preferring the earlier ones
+        self.model_names = [model for model, _ in self.models]
+        self.client = client or AsyncOpenRouterClient(self.api_key)
+        self.batch_mode = batch_mode
+        
+        self.cache = cache
+        if self.cache is None:
+            self.cache = create_summary_cache()
+        
+        # Local engine used when OpenRouter fails, is too slow or is over budget (False disables)
+        self.fallback = ExtractiveSummarizer() if fallback is None else fallback
+        # Deadlines start once a call has its rate limit budget and slot; queueing has its own limit
+        self.deadline = deadline
+        self.queue_timeout = queue_timeout
+        self.call_budget = call_budget
+        self.calls = 0
+        self.fallbacks = 0
+        self._budget_lock = threading.Lock()
     
-    def summarize_document(self, text, doc_type, doc_number):
-        """Summarize circular or notification text using OpenRouter"""
+    def _take_call(self, count=1):
+        """Count LLM calls against the per-run budget; False if they don't fit in what is left"""
+        with self._budget_lock:
+            if self.call_budget and self.calls + count > self.call_budget:
+                return False
+            self.calls += count
+            return True
+    
+    def _timeout_reason(self, error):
+        if isinstance(error, QueueTimeout):
+            return f"LLM queue wait over {self.queue_timeout:g}s"
+        return f"no LLM answer within {self.deadline:g}s"
+    
+    def _fallback_summary(self, text, doc_type, doc_number, reason):
+        if not self.fallback:
+            return ERROR_SUMMARY
         
-        prompt = f"""Summarize this tax {doc_type} in 2-3 clear, professional sentences. Write directly - no introductory phrases like "Here is a summary" or "The main update is". Focus on:
+        print(f"⚠️ {doc_number}: {reason}; using {self.fallback.name} summary")
+        with self._budget_lock:
+            self.fallbacks += 1
+        return self.fallback.summarize_document(text, doc_type, doc_number)
+    
+    def report(self):
+        lines = []
+        if self.cache:
+            stats = self.cache.stats()
+            lines.append(f"🗃️ Summary cache: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries")
+        for line in self.client.latency.report():
+            lines.append(f"⏱️ {line}")
+        if self.fallbacks:
+            lines.append(f"🛟 {self.fallbacks} summaries from the {self.fallback.name} fallback")
+        return lines
+    
+    @staticmethod
+    def document_excerpt(text):
+        """The cleaned, most relevant part of a document's text, within PROMPT_TOKEN_BUDGET"""
+        return prepare_text(text)
+    
+    def build_prompt(self, text, doc_type):
+        return f"""Summarize this tax {doc_type} in 2-3 clear, professional sentences. Write directly - no introductory phrases like "Here is a summary" or "The main update is". Focus on:
 
 1. The specific change or update
 2. Who is affected (taxpayers, entities, deadlines)
 3. Required actions or important dates
 
 Document text:
-{text[:5000]}
+{self.document_excerpt(text)}
 
 Summary:"""
+    
+    def build_batch_prompt(self, documents):
+        """
+        Prompt asking for one summary per document as JSON
         
-        try:
-            headers = {
-                "Authorization": f"Bearer {self.api_key}",
-                "Content-Type": "application/json",
-                "HTTP-Referer": "https://github.com/yourusername/tax-newsletter",
-                "X-Title": "Tax Newsletter Automation"
-            }
-            
-            payload = {
-                "model": self.model,
-                "messages": [
-                    {
-                        "role": "system",
-                        "content": "You are a tax expert. Provide concise summaries without meta-commentary. Write directly and professionally."
-                    },
-                    {
-                        "role": "user",
-                        "content": prompt
-                    }
-                ],
-                "temperature": 0.3
-            }
-            
-            response = requests.post(self.base_url, json=payload, headers=headers, timeout=60)
-            response.raise_for_status()
+        Args:
+            documents: List of (doc_id, text, doc_type, doc_number)
+        """
+        sections = "\n\n".join(
+            f"=== Document {doc_id}: {doc_type} {doc_number} ===\n{self.document_excerpt(text)}"
+            for doc_id, text, doc_type, doc_number in documents
+        )
+        return f"""Summarize each of the following tax documents in 2-3 clear, professional sentences. Write directly - no introductory phrases like "Here is a summary" or "The main update is". Focus on:
+
+1. The specific change or update
+2. Who is affected (taxpayers, entities, deadlines)
+3. Required actions or important dates
+
+Respond with JSON only, in exactly this form, with one entry per document:
+{{"summaries": [{{"id": "D1", "summary": "..."}}]}}
+
+{sections}"""
+    
+    @staticmethod
+    def clean_summary(summary):
+        """Strip meta-phrases like 'Here is a summary:' from the start"""
+        summary = summary.strip()
+        
+        for phrase in CLEANUP_PHRASES:
+            if summary.lower().startswith(phrase.lower()):
+                summary = summary[len(phrase):].strip()
+                # Remove any trailing colon if present
+                if summary.startswith(':'):
+                    summary = summary[1:].strip()
+        
+        return summary
+    
+    def summarize_document(self, text, doc_type, doc_number):
+        """Summarize circular or notification text using OpenRouter"""
+        return asyncio.run(self.summarize_async(text, doc_type, doc_number))
+    
+    def summarize_many(self, documents, on_summary=None):
+        """
+        Summarize several documents concurrently under the rate limiter
+        
+        Args:
+            documents: List of (text, doc_type, doc_number) tuples
+            on_summary: Optional callback(index, summary), called as each summary is ready
+        
+        Returns:
+            List of summaries in the same order
+        """
+        if not documents:
+            return []
+        return asyncio.run(self.summarize_many_async(documents, on_summary))
+    
+    async def summarize_many_async(self, documents, on_summary=None):
+        summaries = [None] * len(documents)
+        
+        def deliver(index, summary):
+            summaries[index] = summary
+            if on_summary and summary is not None:
+                on_summary(index, summary)
+        
+        async def run_single(index):
+            deliver(index, await self.summarize_async(*documents[index]))
+        
+        if not self.batch_mode or len(documents) < 2:
+            await asyncio.gather(*(run_single(index) for index in range(len(documents))))
+            return summaries
+        
+        batchable, singles = [], []
+        
+        for index, (text, doc_type, doc_number) in enumerate(documents):
+            if self.cache:
+                deliver(index, self.cache.get(self.model_names, PROMPT_VERSION, self.cache_input(text, doc_type)[0]))
+            if summaries[index] is not None:
+                continue
             
-            result = response.json()
-            summary = result['choices'][0]['message']['content'].strip()
+            if estimate_tokens(self.document_excerpt(text)) <= SUMMARY_BATCH_DOC_MAX_TOKENS:
+                batchable.append(index)
+            else:
+                singles.append(index)
+        
+        async def run_batch(indexes):
+            results = await self.summarize_batch_async([documents[index] for index in indexes])
             
-            # Clean up any remaining meta-phrases
-            cleanup_phrases = [
-                "Here is a summary:",
-                "Here's a summary:",
-                "Here is the summary:",
-                "Here's the summary:",
-                "Summary:",
-                "The main update is that",
-                "The main change is that",
-                "In summary,",
-                "To summarize,",
-                "Here is a 2-3 sentence",
-                "Here is a 3-4 sentence",
-                "Here's a 2-3 sentence",
-                "Here's a 3-4 sentence"
-            ]
+            # Anything the model left out is retried on its own
+            missing = [index for index, summary in zip(indexes, results) if summary is None]
+            for index, summary in zip(indexes, results):
+                deliver(index, summary)
+            if missing:
+                print(f"⚠️ Batch reply missed {len(missing)} document(s); retrying them individually")
+                await asyncio.gather(*(run_single(index) for index in missing))
+        
+        await asyncio.gather(
+            *(run_batch(batch) for batch in self.pack_batches(documents, batchable)),
+            *(run_single(index) for index in singles)
+        )
+        return summaries
+    
+    def pack_batches(self, documents, indexes):
+        """Group document indexes into batches within the token budget and doc limit"""
+        batches, current, current_tokens = [], [], 0
+        
+        for index in indexes:
+            tokens = estimate_tokens(self.document_excerpt(documents[index][0])) + SUMMARY_REPLY_TOKENS
+            if current and (current_tokens + tokens > SUMMARY_BATCH_TOKEN_BUDGET or len(current) >= SUMMARY_BATCH_MAX_DOCS):
+                batches.append(current)
+                current, current_tokens = [], 0
+            current.append(index)
+            current_tokens += tokens
+        
+        if current:
+            batches.append(current)
+        return batches
+    
+    async def summarize_batch_async(self, documents):
+        """
+        Summarize several documents with one request
+        
+        Returns:
+            List of summaries in order, with None for any the reply did not include
+        """
+        if len(documents) == 1:
+            return [await self.summarize_async(*documents[0])]
+        if not self._take_call():
+            return [None] * len(documents)
+        
+        labelled = [(f"D{position}", text, doc_type, doc_number)
+                    for position, (text, doc_type, doc_number) in enumerate(documents, 1)]
+        prompt = self.build_batch_prompt(labelled)
+        
+        model = self.model
+        try:
+            reply, model = await self.complete(prompt, SUMMARY_REPLY_TOKENS * len(documents))
+            by_id = self.parse_batch_reply(reply)
+        except (DeadlineExceeded, QueueTimeout) as e:
+            print(f"Error summarizing batch of {len(documents)} with OpenRouter: {self._timeout_reason(e)}")
+            by_id = {}
+        except Exception as e:
+            print(f"Error summarizing batch of {len(documents)} with OpenRouter: {e}")
+            by_id = {}
+        
+        summaries = []
+        for doc_id, text, doc_type, doc_number in labelled:
+            summary = by_id.get(doc_id)
+            if summary and self.cache:
+                self.cache.put(model, PROMPT_VERSION, self.build_prompt(text, doc_type), summary)
+            summaries.append(summary or None)
+        return summaries
+    
+    def parse_batch_reply(self, content):
+        """Map document ids to cleaned summaries from a JSON batch reply"""
+        start, end = content.find('{'), content.rfind('}')
+        if start == -1 or end <= start:
+            return {}
+        
+        try:
+            data = json.loads(content[start:end + 1])
+        except json.JSONDecodeError:
+            return {}
+        
+        entries = data.get('summaries', []) if isinstance(data, dict) else []
+        return {
+            str(entry.get('id', '')).strip(): self.clean_summary(str(entry.get('summary', '')))
+            for entry in entries
+            if isinstance(entry, dict) and entry.get('summary')
+        }
+    
+    async def complete(self, prompt, reply_tokens):
+        """Send one prompt (hedged across the configured models); returns (reply text, model that answered)"""
+        payload = {
+            "model": self.model,
+            "messages": [
+                {
+                    "role": "system",
+                    "content": SYSTEM_PROMPT
+                },
+                {
+                    "role": "user",
+                    "content": prompt
+                }
+            ],
+            "temperature": 0.3
+        }
+        
+        estimated_tokens = estimate_tokens(SYSTEM_PROMPT + prompt) + reply_tokens
+        result, model = await self.client.complete_hedged(
+            payload, self.models, estimated_tokens, deadline=self.deadline, queue_timeout=self.queue_timeout
+        )
+        return result['choices'][0]['message']['content'], model
+    
+    def cache_input(self, text, doc_type):
+        """
+        (cache key text, parts) for a document; parts is None unless it is summarized map-reduce style
+        
+        A map-reduce summary covers the whole text, so it is keyed on all of
+        its parts; the prompt only holds a PROMPT_TOKEN_BUDGET excerpt, which
+        two different long documents can share.
+        """
+        if estimate_tokens(text) > LONG_DOC_THRESHOLD_TOKENS:
+            chunks = self.document_chunks(text)
+            if len(chunks) > 1:
+                return "\0".join(("map-reduce", doc_type, *chunks)), chunks
+        return self.build_prompt(text, doc_type), None
+    
+    async def summarize_async(self, text, doc_type, doc_number):
+        cache_text, chunks = self.cache_input(text, doc_type)
+        
+        if self.cache:
+            cached = self.cache.get(self.model_names, PROMPT_VERSION, cache_text)
+            if cached is not None:
+                return cached
+        
+        if chunks:
+            return await self.summarize_long_async(text, doc_type, doc_number, cache_text, chunks)
+        
+        prompt = cache_text  # short documents are keyed on their prompt
+        
+        if not self._take_call():
+            return self._fallback_summary(text, doc_type, doc_number, "LLM call budget used up")
+        
+        try:
+            reply, model = await self.complete(prompt, SUMMARY_REPLY_TOKENS)
+            summary = self.clean_summary(reply)
             
-            for phrase in cleanup_phrases:
-                if summary.lower().startswith(phrase.lower()):
-                    summary = summary[len(phrase):].strip()
-                    # Remove any trailing colon if present
-                    if summary.startswith(':'):
-                        summary = summary[1:].strip()
+            if self.cache:
+                self.cache.put(model, PROMPT_VERSION, prompt, summary)
             
             return summary
             
+        except (DeadlineExceeded, QueueTimeout) as e:
+            return self._fallback_summary(text, doc_type, doc_number, self._timeout_reason(e))
+        except Exception as e:
+            print(f"Error summarizing {doc_number} with OpenRouter: {e}")
+            return self._fallback_summary(text, doc_type, doc_number, "LLM unavailable")
+    
+    
+    @staticmethod
+    def document_chunks(text):
+        """Parts of a long document for the map phase, at most LONG_DOC_MAX_CHUNKS of them"""
+        max_chunks = max(2, LONG_DOC_MAX_CHUNKS)
+        chunk_tokens = max(LONG_DOC_CHUNK_TOKENS, -(-estimate_tokens(text) // max_chunks))
+        chunks = chunk_text(text, chunk_tokens)
+        # Packing along paragraph boundaries leaves gaps, so grow the parts until they fit the limit
+        while len(chunks) > max_chunks:
+            chunk_tokens = int(chunk_tokens * 1.25) + 1
+            chunks = chunk_text(text, chunk_tokens)
+        return chunks
+    
+    def build_part_prompt(self, chunk, doc_type, position, total):
+        return f"""This is part {position} of {total} of a tax {doc_type}. List the specific changes, who is affected, and any deadlines, dates, sections, rules or forms it mentions, as up to 4 short bullet points. If this part has no substantive content (only headers, addresses or signatures), reply with NONE.
+
+Text:
+{chunk}"""
+    
+    def build_merge_prompt(self, notes, doc_type, total):
+        parts = "\n\n".join(f"Part {position} of {total}:\n{note.strip()}" for position, note in notes)
+        return f"""Below are notes on consecutive parts of one tax {doc_type}. Summarize the whole document in 2-3 clear, professional sentences. Write directly - no introductory phrases like "Here is a summary" or "The main update is". Focus on:
+
+1. The specific change or update
+2. Who is affected (taxpayers, entities, deadlines)
+3. Required actions or important dates
+
+Notes:
+{parts}
+
+Summary:"""
+    
+    async def summarize_long_async(self, text, doc_type, doc_number, cache_text, chunks):
+        """
+        Map-reduce summary of a long document
+        
+        Every part is summarized at once (the rate limiter and concurrency
+        limit still apply), then one call merges the part notes, so a long
+        document costs about two round trips rather than one per part.
+        """
+        if not self._take_call(len(chunks) + 1):
+            return self._fallback_summary(text, doc_type, doc_number, "LLM call budget too small for a long document")
+        
+        print(f"📚 {doc_number}: long document, summarizing {len(chunks)} parts in parallel")
+        try:
+            summary, model = await self.map_reduce(chunks, doc_type, doc_number)
+        except (DeadlineExceeded, QueueTimeout) as e:
+            return self._fallback_summary(text, doc_type, doc_number, self._timeout_reason(e))
         except Exception as e:
-            print(f"Error summarizing with OpenRouter: {e}")
-            return "Summary unavailable due to API error"
+            print(f"Error summarizing {doc_number} with OpenRouter: {e}")
+            return self._fallback_summary(text, doc_type, doc_number, "LLM unavailable")
+        
+        if self.cache:
+            self.cache.put(model, PROMPT_VERSION, cache_text, summary)
+        return summary
+    
+    async def map_reduce(self, chunks, doc_type, doc_number):
+        """Summarize the parts, then merge their notes; returns (summary, model that merged)"""
+        total = len(chunks)
+        replies = await asyncio.gather(
+            *(self.complete(self.build_part_prompt(chunk, doc_type, position, total), PART_NOTES_REPLY_TOKENS)
+              for position, chunk in enumerate(chunks, 1)),
+            return_exceptions=True
+        )
+        
+        failures = [reply for reply in replies if isinstance(reply, BaseException)]
+        replies = [reply if isinstance(reply, BaseException) else reply[0] for reply in replies]
+        if len(failures) == total:
+            raise failures[0]
+        if failures:
+            print(f"⚠️ {doc_number}: {len(failures)} of {total} parts failed; merging the rest")
+        
+        notes = [
+            (position, reply) for position, reply in enumerate(replies, 1)
+            if isinstance(reply, str) and reply.strip() and reply.strip().upper() != 'NONE'
+        ]
+        if not notes:
+            raise OpenRouterError("no notes from any part")
+        
+        reply, model = await self.complete(self.build_merge_prompt(notes, doc_type, total), SUMMARY_REPLY_TOKENS)
+        return self.clean_summary(reply), model
+
+def create_summary_cache():
+    """The summary cache for the current prompt version, or None if caching is disabled"""
+    if not SUMMARY_CACHE_ENABLED:
+        return None
+    cache = SummaryCache()
+    cache.invalidate_other_versions(PROMPT_VERSION)
+    return cache
+
+def create_summarizer(backend=SUMMARIZER_BACKEND, client=None, cache=None):
+    """Build the configured summarizer backend (client and cache are shared ones for the LLM backend)"""
+    if backend == 'extractive':
+        return ExtractiveSummarizer()
+    return LLMSummarizer(cache=cache, client=client)
@@ -0,0 +1,26 @@
+import os
+import sqlite3
+from config import CACHE_DIR
+
+
+def cache_path(*parts):
+    """Path inside CACHE_DIR, creating parent directories as needed"""
+    path = os.path.join(CACHE_DIR, *parts)
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    return path
+
+
+def connect(path):
+    """
+    Open a SQLite database for a local store
+    
+    Connections are shared between threads (callers serialise access with
+    their own lock) and use WAL so readers don't block the writer.
+    """
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.execute("PRAGMA busy_timeout=30000")
+    return conn
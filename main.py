@@ -1,32 +1,80 @@
 import ssl
 import certifi
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from browse_ai_handler import BrowseAIHandler
 from pdf_processor import PDFProcessor
 #from gemini_summarizer import GeminiSummarizer
-from llm_summarizer import LLMSummarizer
+from llm_summarizer import create_summarizer, create_summary_cache
+from openrouter_client import AsyncOpenRouterClient
 from email_sender import EmailSender
 from sharepoint_uploader import SharePointUploader  # NEW LINE
+from deduplicator import DocumentDeduplicator
+from item_archive import ItemArchive
+from document_store import DocumentStore
+from seen_items import SeenItemIndex
+from task_cache import TaskCache
+from newsletter_store import record_key
 from config import CIRCULARS_ROBOT_ID, NOTIFICATIONS_ROBOT_ID, PRESS_RELEASES_ROBOT_ID
+from config import PIPELINE_MAX_WORKERS, DOWNLOAD_CONCURRENCY, EXTRACT_CONCURRENCY, DEDUP_ENABLED
+from config import ARCHIVE_ENABLED, DOCUMENT_STORE_ENABLED, SEEN_INDEX_ENABLED, BROWSE_AI_TASK_CACHE_ENABLED
+from config import SUMMARIZER_BACKEND
 
 
-class TaxNewsletterProcessor:
+class SharedServices:
+    """
+    Clients and stores that outlive a single processor
+    
+    A long-running process (the API service) builds one and passes it to
+    every TaxNewsletterProcessor, so all runs share one OpenRouter rate
+    limiter, concurrency limit and thread pool, and one connection per
+    local store.
+    """
+    
     def __init__(self):
-        self.browse_ai = BrowseAIHandler()
-        self.pdf_processor = PDFProcessor()
+        self.llm_client = AsyncOpenRouterClient() if SUMMARIZER_BACKEND != 'extractive' else None
+        self.summary_cache = create_summary_cache()
+        self.document_store = DocumentStore() if DOCUMENT_STORE_ENABLED else None
+        self.seen_index = SeenItemIndex() if SEEN_INDEX_ENABLED else None
+        self.task_cache = TaskCache() if BROWSE_AI_TASK_CACHE_ENABLED else None
+        self.archive = ItemArchive() if ARCHIVE_ENABLED else None
+
+
+class TaxNewsletterProcessor:
+    def __init__(self, max_workers=None, progress=None, services=None):
+        services = services or SharedServices()
+        self.browse_ai = BrowseAIHandler(seen_index=services.seen_index, task_cache=services.task_cache)
+        self.pdf_processor = PDFProcessor(store=services.document_store)
         #self.summarizer = GeminiSummarizer()
-        self.summarizer = LLMSummarizer()  
+        self.summarizer = create_summarizer(client=services.llm_client, cache=services.summary_cache)
         self.email_sender = EmailSender()
         self.sharepoint_uploader = SharePointUploader()  # NEW LINE
         self.processed_data = []
+        self.errors = []
+        self.captured_data = {}
+        # robot_id -> (doc_type, key field, items) handed out this run, for mark_processed
+        self.fetched_items = {}
+        # Shared by circulars and notifications, so a document published as both is summarized once
+        self.deduplicator = DocumentDeduplicator() if DEDUP_ENABLED else None
+        # History of every processed item, with extracted texts, for /api/items
+        self.archive = services.archive
+        
+        # Worker pool size for documents; 1 keeps the old one-by-one behaviour
+        self.max_workers = max(1, max_workers or PIPELINE_MAX_WORKERS)
+        self.download_slots = threading.BoundedSemaphore(max(1, DOWNLOAD_CONCURRENCY))
+        self.extract_slots = threading.BoundedSemaphore(max(1, EXTRACT_CONCURRENCY))
+        
+        # Optional callback(event dict) for per-item progress (downloaded/extracted/summarized/failed)
+        self.progress = progress
     
     def process_circulars(self):
         """Process circulars from Browse AI (ALL NEW items)"""
         print("\n📋 Processing Circulars...")
         print("-" * 60)
         
-        circulars = self.browse_ai.get_captured_data(CIRCULARS_ROBOT_ID, new_only=True)
+        circulars = self.get_captured_items(CIRCULARS_ROBOT_ID, 'Circular', 'Circular Number')
         #circulars = self.browse_ai.get_captured_data(CIRCULARS_ROBOT_ID, new_only=False)
-
+        
         
         if not circulars:
             print("No new circulars found")
@@ -34,47 +82,16 @@ class TaxNewsletterProcessor:
         
         print(f"Found {len(circulars)} NEW circulars\n")
         
-        for circular in circulars:
-            circular_num = circular.get('Circular Number', '').strip()
-            date = circular.get('Publish Date', '').strip()
-            
-            if not circular_num:
-                continue
-            
-            print(f"Processing: {circular_num}")
-            
-            pdf_url = self.pdf_processor.find_circular_pdf_url(circular_num)
-            pdf_content = self.pdf_processor.download_pdf(pdf_url)
-            
-            if pdf_content:
-                text = self.pdf_processor.extract_text(pdf_content)
-                
-                if text and len(text) > 100:
-                    print(f"  ✅ Extracted {len(text)} characters")
-                    print(f"  🤖 Summarizing...")
-                    summary = self.summarizer.summarize_document(text, "circular", circular_num)
-                    
-                    self.processed_data.append({
-                        'type': 'Circular',
-                        'number': circular_num,
-                        'date': date,
-                        'summary': summary,
-                        'pdf_url': pdf_url
-                    })
-                    print(f"  ✅ Summarized!\n")
-                else:
-                    print(f"  ❌ Text extraction failed\n")
-            else:
-                print(f"  ❌ PDF download failed\n")
+        self.process_documents(circulars, 'Circular', 'Circular Number', self.pdf_processor.resolve_circular_pdf_url)
     
     def process_notifications(self):
         """Process notifications from Browse AI (ALL NEW items)"""
         print("\n📢 Processing Notifications...")
         print("-" * 60)
         
-        notifications = self.browse_ai.get_captured_data(NOTIFICATIONS_ROBOT_ID, new_only=True)
+        notifications = self.get_captured_items(NOTIFICATIONS_ROBOT_ID, 'Notification', 'Notification Number')
         #notifications = self.browse_ai.get_captured_data(NOTIFICATIONS_ROBOT_ID, new_only=False)
-
+        
         
         if not notifications:
             print("No new notifications found")
@@ -82,47 +99,262 @@ class TaxNewsletterProcessor:
         
         print(f"Found {len(notifications)} NEW notifications\n")
         
-        for notification in notifications:
-            notif_num = notification.get('Notification Number', '').strip()
-            date = notification.get('Publish Date', '').strip()
+        self.process_documents(notifications, 'Notification', 'Notification Number', self.pdf_processor.resolve_notification_pdf_url)
+    
+    def fetch_captured_data(self):
+        """Fetch circulars, notifications and press releases from all robots in parallel"""
+        robot_ids = [CIRCULARS_ROBOT_ID, NOTIFICATIONS_ROBOT_ID, PRESS_RELEASES_ROBOT_ID]
+        self.captured_data = self.browse_ai.get_captured_data_many(robot_ids, new_only=True)
+        return self.captured_data
+    
+    def get_captured_items(self, robot_id, doc_type, key_field):
+        """Use prefetched items for a robot, or fetch them now if not prefetched"""
+        if robot_id in self.captured_data:
+            items = self.captured_data.pop(robot_id)
+        else:
+            items = self.browse_ai.get_captured_data(robot_id, new_only=True)
+        
+        self.fetched_items[robot_id] = (doc_type, key_field, items)
+        return items
+    
+    def mark_processed(self):
+        """Record delivered items in the seen index; failed ones are retried next run"""
+        failed = {(error['type'], error['number']) for error in self.errors}
+        
+        for robot_id, (doc_type, key_field, items) in self.fetched_items.items():
+            delivered = [item for item in items if (doc_type, item.get(key_field, '').strip()) not in failed]
+            self.browse_ai.mark_processed(robot_id, delivered)
+        
+        self.fetched_items = {}
+    
+    def process_documents(self, items, doc_type, number_field, find_pdf_url):
+        """
+        Download, extract and summarize PDF documents
+        
+        Downloads and extraction run in the worker pool; the extracted texts
+        are then summarized together under the OpenRouter rate limiter.
+        Documents whose text matches one already seen this run reuse its
+        summary and are listed as aliases on its record. Results are
+        appended to processed_data in listing order, whatever order the
+        work finishes in. Failures are collected in self.errors.
+        """
+        jobs = []
+        seen_numbers = set()
+        for item in items:
+            number = item.get(number_field, '').strip()
+            date = item.get('Publish Date', '').strip()
             
-            if not notif_num:
+            # The listing sometimes repeats an item; fetch it only once
+            if not number or number in seen_numbers:
                 continue
             
-            print(f"Processing: {notif_num}")
-            
-            pdf_url = self.pdf_processor.find_notification_pdf_url(notif_num)
-            pdf_content = self.pdf_processor.download_pdf(pdf_url)
+            seen_numbers.add(number)
+            jobs.append((number, date))
+        
+        def run_job(job):
+            return self._fetch_document(doc_type, job[0], job[1], find_pdf_url)
+        
+        if self.max_workers == 1 or len(jobs) <= 1:
+            documents = list(map(run_job, jobs))
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(jobs))) as executor:
+                # executor.map yields in submission order, so output stays stable
+                documents = list(executor.map(run_job, jobs))
+        
+        self._summarize_documents(doc_type, self._collapse_duplicates(documents))
+        self._collect_results(doc_type, documents)
+        self._archive(self._archive_entries(documents))
+    
+    def _fetch_document(self, doc_type, number, date, find_pdf_url):
+        """
+        Resolve, download and extract one document
+        
+        Returns:
+            Dict with number, date, pdf_url, text (None on failure), error and log lines
+        """
+        doc = {'type': doc_type, 'number': number, 'date': date, 'pdf_url': None, 'text': None, 'error': None,
+               'log': [f"Processing: {number}"]}
+        stage = "download"
+        
+        try:
+            with self.download_slots:
+                doc['pdf_url'] = pdf_url = find_pdf_url(number)
             
-            if pdf_content:
-                text = self.pdf_processor.extract_text(pdf_content)
+            if self.pdf_processor.range_requests:
+                # Range requests fetch and parse together, and mostly wait on the network
+                stage = "extract"
+                with self.download_slots:
+                    text = self.pdf_processor.extract_text_from_url(pdf_url)
+                self._report('downloaded', doc_type, number, pdf_url=pdf_url)
+            else:
+                with self.download_slots:
+                    document = self.pdf_processor.download_document(pdf_url)
+                
+                if not document:
+                    self.pdf_processor.forget_pdf_url(doc_type.lower(), number)
+                    doc['log'].append(f"  ❌ PDF download failed")
+                    doc['error'] = self._item_error(doc_type, number, stage, "PDF download failed")
+                    self._report('failed', doc_type, number, error=doc['error'])
+                    return doc
                 
-                if text and len(text) > 100:
-                    print(f"  ✅ Extracted {len(text)} characters")
-                    print(f"  🤖 Summarizing...")
-                    summary = self.summarizer.summarize_document(text, "notification", notif_num)
-                    
-                    self.processed_data.append({
-                        'type': 'Notification',
-                        'number': notif_num,
-                        'date': date,
-                        'summary': summary,
-                        'pdf_url': pdf_url
-                    })
-                    print(f"  ✅ Summarized!\n")
-                else:
-                    print(f"  ❌ Text extraction failed\n")
+                self._report('downloaded', doc_type, number, pdf_url=pdf_url, bytes=len(document))
+                stage = "extract"
+                with document, self.extract_slots:
+                    text = self.pdf_processor.extract_text(document)
+            
+            if not text or len(text) <= 100:
+                doc['log'].append(f"  ❌ Text extraction failed")
+                doc['error'] = self._item_error(doc_type, number, stage, "Text extraction failed")
+                self._report('failed', doc_type, number, error=doc['error'])
+                return doc
+            
+            doc['text'] = text
+            doc['log'].append(f"  ✅ Extracted {len(text)} characters")
+            self._report('extracted', doc_type, number, characters=len(text))
+            
+        except Exception as e:
+            doc['log'].append(f"  ❌ Failed during {stage}: {e}")
+            doc['error'] = self._item_error(doc_type, number, stage, str(e))
+            self._report('failed', doc_type, number, error=doc['error'])
+        
+        return doc
+    
+    def _collapse_duplicates(self, documents):
+        """Mark documents that repeat an earlier one's text; returns the ones still to summarize"""
+        extracted = [doc for doc in documents if doc['text']]
+        if not self.deduplicator:
+            return extracted
+        
+        unique = []
+        for doc in extracted:
+            original = self.deduplicator.find_or_add(doc['text'], doc)
+            if original is None:
+                unique.append(doc)
             else:
-                print(f"  ❌ PDF download failed\n")
+                doc['duplicate_of'] = original
+                doc['log'].append(f"  🔁 Same content as {original['type']} {original['number']}; reusing its summary")
+                self._report('duplicate', doc['type'], doc['number'],
+                             duplicate_of={'type': original['type'], 'number': original['number']})
+        return unique
+    
+    def _summarize_documents(self, doc_type, documents):
+        """Summarize extracted documents in one rate-limited batch"""
+        if not documents:
+            return
+        
+        print(f"🤖 Summarizing {len(documents)} {doc_type.lower()}(s)...\n")
+        
+        def on_summary(index, summary):
+            doc = documents[index]
+            self._report('summarized', doc_type, doc['number'], record={
+                'type': doc_type,
+                'number': doc['number'],
+                'date': doc['date'],
+                'summary': summary,
+                'pdf_url': doc['pdf_url']
+            })
+        
+        summaries = self.summarizer.summarize_many(
+            [(doc['text'], doc_type.lower(), doc['number']) for doc in documents], on_summary=on_summary
+        )
+        
+        for doc, summary in zip(documents, summaries):
+            doc['summary'] = summary
+            doc['log'].append(f"  🤖 Summarizing...")
+            doc['log'].append(f"  ✅ Summarized!")
+    
+    def _collect_results(self, doc_type, documents):
+        """Print each item's log and keep its record or error, in order"""
+        for doc in documents:
+            print("\n".join(doc['log']) + "\n")
+            
+            if doc['error']:
+                self.errors.append(doc['error'])
+            elif doc.get('duplicate_of'):
+                # The original's record comes first (earlier in this listing or an earlier listing)
+                doc['duplicate_of']['record'].setdefault('aliases', []).append({
+                    'type': doc_type,
+                    'number': doc['number'],
+                    'date': doc['date'],
+                    'pdf_url': doc['pdf_url']
+                })
+            elif 'summary' in doc:
+                doc['record'] = {
+                    'type': doc_type,
+                    'number': doc['number'],
+                    'date': doc['date'],
+                    'summary': doc['summary'],
+                    'pdf_url': doc['pdf_url']
+                }
+                self.processed_data.append(doc['record'])
+    
+    def _archive_entries(self, documents):
+        """
+        (record, text) pairs to archive for a listing's documents
+        
+        An original that gained an alias here is stored again, even when it
+        came from an earlier listing, so its archived record (which the
+        digest sends) lists the alias.
+        """
+        entries = {}
+        for doc in documents:
+            if doc.get('record'):
+                entries[record_key(doc['record'])] = (doc['record'], doc['text'])
+            elif doc.get('duplicate_of', {}).get('record'):
+                original = doc['duplicate_of']['record']
+                entries.setdefault(record_key(original), (original, None))
+                alias = self._alias_record(doc)
+                entries[record_key(alias)] = (alias, doc['text'])
+        return list(entries.values())
+    
+    @staticmethod
+    def _alias_record(doc):
+        """Archive record for a duplicate: its own number and link, the original's summary"""
+        original = doc['duplicate_of']['record']
+        return {
+            'type': doc['type'],
+            'number': doc['number'],
+            'date': doc['date'],
+            'summary': original['summary'],
+            'pdf_url': doc['pdf_url'],
+            'duplicate_of': {'type': original['type'], 'number': original['number']}
+        }
+    
+    def _archive(self, entries):
+        """Add (record, text) pairs to the history archive; a failure here never stops the run"""
+        if not self.archive or not entries:
+            return
+        try:
+            self.archive.add(entries)
+        except Exception as e:
+            print(f"⚠️ Could not archive {len(entries)} item(s): {e}")
+    
+    def _report(self, stage, doc_type, number, **details):
+        """Send a per-item progress event to the progress callback, if any"""
+        if not self.progress:
+            return
+        try:
+            self.progress({'event': 'item', 'stage': stage, 'type': doc_type, 'number': number, **details})
+        except Exception as e:
+            print(f"⚠️ Progress callback failed: {e}")
+    
+    @staticmethod
+    def _item_error(doc_type, number, stage, message):
+        return {
+            'type': doc_type,
+            'number': number,
+            'stage': stage,
+            'error': message
+        }
     
     def process_press_releases(self):
         """Process press releases from Browse AI (ALL NEW items)"""
         print("\n🗞️ Processing Press Releases...")
         print("-" * 60)
         
-        releases = self.browse_ai.get_captured_data(PRESS_RELEASES_ROBOT_ID, new_only=True)
+        releases = self.get_captured_items(PRESS_RELEASES_ROBOT_ID, 'Press Release', 'Title')
         #releases = self.browse_ai.get_captured_data(PRESS_RELEASES_ROBOT_ID, new_only=False)
-
+        
         
         if not releases:
             print("No new press releases found")
@@ -130,6 +362,7 @@ class TaxNewsletterProcessor:
         
         print(f"Found {len(releases)} NEW press releases\n")
         
+        start = len(self.processed_data)
         for release in releases:
             title = release.get('Title', '').strip()
             date = release.get('Date', '').strip()
@@ -145,7 +378,10 @@ class TaxNewsletterProcessor:
                 'date': date,
                 'summary': title
             })
+            self._report('summarized', 'Press Release', title, record=self.processed_data[-1])
             print(f"  ✅ Added\n")
+        
+        self._archive([(record, None) for record in self.processed_data[start:]])
     
     def run(self):
         """Run the entire processing pipeline"""
@@ -153,12 +389,19 @@ class TaxNewsletterProcessor:
         print("🚀 TAX NEWSLETTER PROCESSOR")
         print("=" * 60)
         
+        self.fetch_captured_data()
         self.process_circulars()
         self.process_notifications()
         self.process_press_releases()
         
         print("\n" + "=" * 60)
         
+        if self.errors:
+            print(f"⚠️ {len(self.errors)} item(s) failed:")
+            for error in self.errors:
+                print(f"  • {error['type']} {error['number']} ({error['stage']}): {error['error']}")
+            print()
+        
         if self.processed_data:
             print(f"✅ Found {len(self.processed_data)} new items total")
             print("\nBreakdown:")
@@ -179,8 +422,10 @@ class TaxNewsletterProcessor:
             
             if email_success:
                 print("✅ Email sent successfully!")
+                self.mark_processed()
             else:
                 print("❌ Email sending failed!")
+                print("   Items stay unprocessed and will be picked up again next run")
             
             # NEW: Upload to SharePoint
             print("\n📤 Uploading to SharePoint...")
@@ -195,6 +440,10 @@ class TaxNewsletterProcessor:
             print("✅ No new items detected (all content unchanged)")
             print("📧 No email sent (nothing to report)")
             print("📤 No SharePoint upload (nothing to report)")
+            self.mark_processed()
+        
+        for line in self.summarizer.report():
+            print(line)
         
         print("=" * 60)
         print("✅ Processing complete!\n")
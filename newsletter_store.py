@@ -0,0 +1,308 @@
+import json
+import os
+import socket
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import datetime
+from config import NEWSLETTER_CACHE_SECONDS, GENERATION_LOCK_SECONDS
+from local_store import cache_path, connect
+
+
+class LockHeld(Exception):
+    """Raised when a cluster-wide lock is held by another process"""
+
+
+def record_key(record):
+    """Identity of a newsletter record: its type plus number (or title for press releases)"""
+    return f"{record['type']}|{record.get('number') or record.get('title')}"
+
+
+def isoformat(timestamp):
+    return datetime.fromtimestamp(timestamp).isoformat() if timestamp else None
+
+
+class NewsletterStore:
+    """
+    Newsletter runs and their items, shared by every API worker
+    
+    State lives in SQLite (WAL), so all uvicorn workers and restarts see
+    the same newsletter. Every change bumps a version number, which lets
+    readers cache the newsletter and only reload it when it changed.
+    Leases in the same database act as cluster-wide locks.
+    """
+    
+    def __init__(self, path=None):
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._lock = threading.Lock()
+        self._conn = connect(path or cache_path('newsletter.db'))
+        self._conn.executescript("""
+            CREATE TABLE IF NOT EXISTS runs (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                status TEXT NOT NULL,
+                started_at REAL NOT NULL,
+                finished_at REAL,
+                updated_at REAL NOT NULL,
+                error TEXT
+            );
+            CREATE TABLE IF NOT EXISTS run_items (
+                run_id INTEGER NOT NULL,
+                item_key TEXT NOT NULL,
+                position INTEGER NOT NULL,
+                record TEXT NOT NULL,
+                merged_at REAL,
+                PRIMARY KEY (run_id, item_key)
+            );
+            CREATE TABLE IF NOT EXISTS state (
+                key TEXT PRIMARY KEY,
+                value INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS locks (
+                name TEXT PRIMARY KEY,
+                owner TEXT NOT NULL,
+                expires_at REAL NOT NULL
+            );
+        """)
+        self._conn.execute("INSERT OR IGNORE INTO state (key, value) VALUES ('version', 0)")
+    
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield self._conn
+                self._conn.execute("UPDATE state SET value = value + 1 WHERE key = 'version'")
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+    
+    # --- Cluster-wide locks ---
+    
+    def acquire_lock(self, name, token, ttl):
+        """Take or renew a lease; False if another owner holds an unexpired one"""
+        now = time.time()
+        with self._lock:
+            return self._conn.execute("""
+                INSERT INTO locks (name, owner, expires_at) VALUES (?, ?, ?)
+                ON CONFLICT (name) DO UPDATE SET owner = excluded.owner, expires_at = excluded.expires_at
+                WHERE locks.owner = excluded.owner OR locks.expires_at < ?
+            """, (name, token, now + ttl, now)).rowcount == 1
+    
+    def release_lock(self, name, token):
+        with self._lock:
+            self._conn.execute("DELETE FROM locks WHERE name = ? AND owner = ?", (name, token))
+    
+    def lock_held(self, name):
+        with self._lock:
+            row = self._conn.execute("SELECT expires_at FROM locks WHERE name = ?", (name,)).fetchone()
+        return row is not None and row['expires_at'] >= time.time()
+    
+    def held_locks(self, prefix):
+        """Names of the unexpired locks whose name starts with prefix"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT name FROM locks WHERE substr(name, 1, ?) = ? AND expires_at >= ?",
+                (len(prefix), prefix, time.time())
+            ).fetchall()
+        return [row['name'] for row in rows]
+    
+    @contextmanager
+    def lease(self, name, ttl=GENERATION_LOCK_SECONDS):
+        """
+        Hold a cluster-wide lock for the duration of the block
+        
+        The lease is renewed in the background; if this process dies it
+        expires after ttl seconds and another process can take over.
+        """
+        token = f"{self.owner}:{uuid.uuid4().hex[:8]}"
+        if not self.acquire_lock(name, token, ttl):
+            raise LockHeld(f"{name} is already running in another process")
+        
+        stop = threading.Event()
+        
+        def renew():
+            while not stop.wait(ttl / 3):
+                self.acquire_lock(name, token, ttl)
+        
+        threading.Thread(target=renew, name=f'lease-{name}', daemon=True).start()
+        try:
+            yield
+        finally:
+            stop.set()
+            self.release_lock(name, token)
+    
+    # --- Runs ---
+    
+    def start_run(self):
+        now = time.time()
+        with self._transaction() as conn:
+            # A run still marked processing was cut off (its process went away)
+            conn.execute(
+                "UPDATE runs SET status = 'error', error = 'Generation was interrupted', updated_at = ? "
+                "WHERE status = 'processing'",
+                (now,)
+            )
+            return conn.execute(
+                "INSERT INTO runs (status, started_at, updated_at) VALUES ('processing', ?, ?)", (now, now)
+            ).lastrowid
+    
+    def complete_run(self, run_id, records):
+        """
+        Publish a run's records as the current newsletter
+        
+        Items merged into the previous newsletter while this run was
+        generating are carried over, unless the run has its own copy.
+        """
+        now = time.time()
+        rows = [(run_id, record_key(record), position, json.dumps(record), None) for position, record in enumerate(records)]
+        with self._transaction() as conn:
+            started_at = conn.execute("SELECT started_at FROM runs WHERE id = ?", (run_id,)).fetchone()['started_at']
+            previous = self._current_run(conn)
+            if previous is not None:
+                keys = {record_key(record) for record in records}
+                merged = conn.execute(
+                    "SELECT item_key, record, merged_at FROM run_items WHERE run_id = ? AND merged_at >= ? ORDER BY position",
+                    (previous['id'], started_at)
+                ).fetchall()
+                carried = [row for row in merged if row['item_key'] not in keys]
+                rows += [
+                    (run_id, row['item_key'], len(records) + offset, row['record'], row['merged_at'])
+                    for offset, row in enumerate(carried)
+                ]
+            
+            conn.executemany(
+                "INSERT OR REPLACE INTO run_items (run_id, item_key, position, record, merged_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute(
+                "UPDATE runs SET status = 'completed', finished_at = ?, updated_at = ? WHERE id = ?",
+                (now, now, run_id)
+            )
+    
+    def fail_run(self, run_id, error):
+        now = time.time()
+        with self._transaction() as conn:
+            conn.execute(
+                "UPDATE runs SET status = 'error', error = ?, finished_at = ?, updated_at = ? WHERE id = ?",
+                (error, now, now, run_id)
+            )
+    
+    @staticmethod
+    def _current_run(conn):
+        """The completed run the newsletter shows: the one finished last"""
+        return conn.execute(
+            "SELECT * FROM runs WHERE status = 'completed' ORDER BY finished_at DESC, id DESC LIMIT 1"
+        ).fetchone()
+    
+    def merge_items(self, records):
+        """
+        Add records to the current newsletter, replacing older copies of the same items
+        
+        A run generating at the same time carries them over when it completes.
+        """
+        if not records:
+            return
+        now = time.time()
+        with self._transaction() as conn:
+            row = self._current_run(conn)
+            if row is None:
+                run_id = conn.execute(
+                    "INSERT INTO runs (status, started_at, finished_at, updated_at) VALUES ('completed', ?, ?, ?)",
+                    (now, now, now)
+                ).lastrowid
+            else:
+                run_id = row['id']
+            
+            position = conn.execute(
+                "SELECT COALESCE(MAX(position), -1) + 1 FROM run_items WHERE run_id = ?", (run_id,)
+            ).fetchone()[0]
+            for offset, record in enumerate(records):
+                conn.execute("DELETE FROM run_items WHERE run_id = ? AND item_key = ?", (run_id, record_key(record)))
+                conn.execute(
+                    "INSERT INTO run_items (run_id, item_key, position, record, merged_at) VALUES (?, ?, ?, ?, ?)",
+                    (run_id, record_key(record), position + offset, json.dumps(record), now)
+                )
+            conn.execute("UPDATE runs SET updated_at = ? WHERE id = ?", (now, run_id))
+    
+    def version(self):
+        with self._lock:
+            return self._conn.execute("SELECT value FROM state WHERE key = 'version'").fetchone()[0]
+    
+    def snapshot(self):
+        """
+        The newsletter as the API presents it
+        
+        Returns:
+            Dict with version, status ('not_generated', 'processing',
+            'completed' or 'error'), error, last_updated and data (the
+            records of the latest completed run)
+        """
+        generating = self.lock_held('generation')
+        with self._lock:
+            self._conn.execute("BEGIN")
+            try:
+                version = self._conn.execute("SELECT value FROM state WHERE key = 'version'").fetchone()[0]
+                processing = self._conn.execute("SELECT 1 FROM runs WHERE status = 'processing'").fetchone()
+                # Webhook merges touch the current run, so they also clear an earlier failed run
+                latest = self._conn.execute("SELECT * FROM runs ORDER BY updated_at DESC, id DESC LIMIT 1").fetchone()
+                current = self._current_run(self._conn)
+                rows = self._conn.execute(
+                    "SELECT record FROM run_items WHERE run_id = ? ORDER BY position", (current['id'],)
+                ).fetchall() if current else []
+            finally:
+                self._conn.execute("COMMIT")
+        
+        status, error = 'not_generated', None
+        if processing and generating:
+            status = 'processing'
+        elif processing:
+            status, error = 'error', "Generation was interrupted"
+        elif latest is not None:
+            status, error = latest['status'], latest['error']
+        
+        return {
+            "version": version,
+            "status": status,
+            "error": error,
+            "last_updated": isoformat(current['updated_at']) if current else None,
+            "data": [json.loads(row['record']) for row in rows]
+        }
+
+
+class NewsletterCache:
+    """
+    In-process read-through cache of NewsletterStore.snapshot()
+    
+    A snapshot is reused for up to ttl seconds; after that a one-row
+    version check decides whether it has to be reloaded. render, if
+    given, runs once per loaded snapshot and its result is kept under
+    snapshot['rendered'].
+    """
+    
+    def __init__(self, store, ttl=NEWSLETTER_CACHE_SECONDS, render=None):
+        self.store = store
+        self.ttl = ttl
+        self.render = render
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+    
+    def get(self):
+        with self._lock:
+            now = time.monotonic()
+            if self._snapshot is not None and now - self._checked_at < self.ttl:
+                return self._snapshot
+            
+            if self._snapshot is None or self.store.version() != self._snapshot['version']:
+                snapshot = self.store.snapshot()
+                if self.render:
+                    snapshot['rendered'] = self.render(snapshot)
+                self._snapshot = snapshot
+            self._checked_at = now
+            return self._snapshot
+    
+    def invalidate(self):
+        with self._lock:
+            self._snapshot = None
@@ -0,0 +1,298 @@
+import asyncio
+import functools
+import threading
+import time
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    OPENROUTER_API_KEY, OPENROUTER_REQUESTS_PER_MINUTE, OPENROUTER_TOKENS_PER_MINUTE,
+    OPENROUTER_MAX_RETRIES, SUMMARIZE_CONCURRENCY
+)
+from http_client import build_session
+from latency_tracker import LatencyTracker
+
+OPENROUTER_URL = "https://openrouter.ai/api/v1/chat/completions"
+THROTTLE_STATUSES = (429, 503)
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+
+class OpenRouterError(Exception):
+    """Raised when a completion fails after all retries"""
+
+
+class DeadlineExceeded(OpenRouterError):
+    """Raised when a completion got no answer within its deadline"""
+
+
+class QueueTimeout(OpenRouterError):
+    """Raised when a request waited too long for the rate limiter or a concurrency slot"""
+
+
+class TokenBucket:
+    """
+    Per-minute budget that refills continuously
+    
+    reserve() always succeeds and returns how long the caller must wait
+    before spending what it reserved, so waiters are served in order.
+    State sits behind a threading lock, so one bucket can be shared by
+    several event loops (one per worker thread).
+    """
+    
+    def __init__(self, per_minute):
+        self.capacity = max(1, per_minute)
+        self.rate = self.capacity / 60.0
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def reserve(self, amount):
+        amount = min(amount, self.capacity)
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD concurrency limit
+    
+    The limit grows by about one slot per limit-full of successes and is
+    halved on a throttling response. While a Retry-After is in force no new
+    request starts.
+    """
+    
+    def __init__(self, max_limit=SUMMARIZE_CONCURRENCY, min_limit=1):
+        self.max_limit = max(1, max_limit)
+        self.min_limit = max(1, min(min_limit, self.max_limit))
+        self.limit = float(self.max_limit)
+        self.in_flight = 0
+        self.paused_until = 0.0
+        self._lock = threading.Lock()
+    
+    def _try_acquire(self):
+        with self._lock:
+            now = time.monotonic()
+            if now < self.paused_until:
+                return self.paused_until - now
+            if self.in_flight < int(self.limit):
+                self.in_flight += 1
+                return 0.0
+            return 0.05
+    
+    async def acquire(self):
+        while True:
+            wait = self._try_acquire()
+            if wait == 0.0:
+                return
+            await asyncio.sleep(wait)
+    
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+    
+    def on_success(self):
+        with self._lock:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+    
+    def on_throttle(self, retry_after=None):
+        with self._lock:
+            self.limit = max(self.min_limit, self.limit / 2)
+            if retry_after:
+                self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+
+
+def parse_retry_after(value):
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+class AsyncOpenRouterClient:
+    """
+    asyncio client for OpenRouter chat completions
+    
+    Every request waits for a requests-per-minute bucket, a tokens-per-minute
+    bucket and an adaptive concurrency slot. 429/503 responses shrink the
+    concurrency and honour Retry-After. The blocking HTTP call runs on the
+    client's own thread pool (so an abandoned hedge never holds up the
+    event loop's shutdown) using a pooled session without urllib3 status
+    retries, so throttling reaches the limiter instead of being retried
+    blindly. A request keeps its concurrency slot until its HTTP call
+    returns, even when the caller has given up on it.
+    """
+    
+    def __init__(self, api_key=OPENROUTER_API_KEY, requests_per_minute=OPENROUTER_REQUESTS_PER_MINUTE,
+                 tokens_per_minute=OPENROUTER_TOKENS_PER_MINUTE, max_concurrency=SUMMARIZE_CONCURRENCY,
+                 max_retries=OPENROUTER_MAX_RETRIES, latency=None):
+        self.api_key = api_key
+        self.url = OPENROUTER_URL
+        self.max_retries = max_retries
+        self.request_bucket = TokenBucket(requests_per_minute)
+        self.token_bucket = TokenBucket(tokens_per_minute)
+        self.concurrency = AdaptiveConcurrency(max_concurrency)
+        self.session = build_session('openrouter', retries=0)
+        self._executor = ThreadPoolExecutor(max_workers=max(4, max_concurrency * 2), thread_name_prefix='openrouter')
+        self.latency = latency or LatencyTracker()
+        self.headers = {
+            "Authorization": f"Bearer {self.api_key}",
+            "Content-Type": "application/json",
+            "HTTP-Referer": "https://github.com/yourusername/tax-newsletter",
+            "X-Title": "Tax Newsletter Automation"
+        }
+    
+    async def _wait_for_budget(self, estimated_tokens):
+        wait = max(self.request_bucket.reserve(1), self.token_bucket.reserve(estimated_tokens))
+        if wait > 0:
+            await asyncio.sleep(wait)
+    
+    async def _wait_for_turn(self, estimated_tokens, queue_timeout):
+        """Wait for the rate limit budget and a concurrency slot (which the caller must release)"""
+        async def wait():
+            await self._wait_for_budget(estimated_tokens)
+            await self.concurrency.acquire()
+        
+        try:
+            await asyncio.wait_for(wait(), timeout=queue_timeout or None)
+        except asyncio.TimeoutError:
+            raise QueueTimeout(f"no rate limit budget or free slot within {queue_timeout:g}s")
+    
+    async def complete(self, payload, estimated_tokens=1000, deadline=None, queue_timeout=None):
+        """
+        Send a chat completion request and return the parsed JSON response
+        
+        Args:
+            deadline: seconds the request may take, counting the HTTP calls
+                and retry backoff but not time queued for the rate limiter
+                or a concurrency slot
+            queue_timeout: seconds each attempt may queue for those
+        
+        Raises:
+            DeadlineExceeded past the deadline, QueueTimeout when queued
+            too long, OpenRouterError once retries are exhausted
+        """
+        last_error = None
+        spent = 0.0
+        
+        def remaining():
+            return deadline - spent if deadline else None
+        
+        for attempt in range(self.max_retries + 1):
+            await self._wait_for_turn(estimated_tokens, queue_timeout)
+            started = time.monotonic()
+            post = functools.partial(self.session.post, self.url, json=payload, headers=self.headers)
+            try:
+                future = self._executor.submit(post)
+            except Exception:
+                self.concurrency.release()
+                raise
+            # Cancelling this coroutine can't stop a request already on the wire; the slot
+            # stays taken until the HTTP call itself ends, so abandoned requests still count
+            future.add_done_callback(lambda _: self.concurrency.release())
+            try:
+                response = await asyncio.wait_for(asyncio.wrap_future(future), timeout=remaining())
+            except asyncio.TimeoutError:
+                raise DeadlineExceeded(f"no answer within {deadline:g}s")
+            except requests.RequestException as e:
+                last_error = e
+                response = None
+            
+            if response is not None:
+                if response.status_code in THROTTLE_STATUSES:
+                    self.concurrency.on_throttle(parse_retry_after(response.headers.get('Retry-After')))
+                
+                if response.status_code not in RETRY_STATUSES:
+                    if not response.ok:
+                        raise OpenRouterError(f"{response.status_code} {response.reason}: {response.text[:200]}")
+                    self.concurrency.on_success()
+                    return response.json()
+                
+                last_error = f"{response.status_code} {response.reason}"
+            
+            # Exponential backoff on top of any Retry-After pause
+            if attempt < self.max_retries:
+                backoff = min(30, 2 ** attempt)
+                spent += time.monotonic() - started + backoff
+                if deadline and spent >= deadline:
+                    raise DeadlineExceeded(f"no answer within {deadline:g}s (last error: {last_error})")
+                await asyncio.sleep(backoff)
+        
+        raise OpenRouterError(f"Gave up after {self.max_retries + 1} attempts: {last_error}")
+    
+    async def _timed_complete(self, payload, estimated_tokens, deadline, queue_timeout):
+        model = payload['model']
+        started = time.monotonic()
+        try:
+            result = await self.complete(payload, estimated_tokens, deadline, queue_timeout)
+        except asyncio.CancelledError:
+            self.latency.record(model, time.monotonic() - started, 'cancelled')
+            raise
+        except Exception:
+            self.latency.record(model, time.monotonic() - started, 'error')
+            raise
+        self.latency.record(model, time.monotonic() - started)
+        return result
+    
+    async def complete_hedged(self, payload, models, estimated_tokens=1000, deadline=None, queue_timeout=None):
+        """
+        Send a completion to an ordered list of models with hedging
+        
+        The first model is asked straight away. If it has not answered
+        within its latency SLO, or it fails, the same request also goes to
+        the next model, and so on down the list. The first good answer wins.
+        Losing requests are abandoned rather than stopped: one not yet sent
+        is dropped, but one already sent runs to completion (and is billed)
+        in the background, holding its concurrency slot until it returns.
+        
+        Args:
+            payload: Chat completion payload (its 'model' is overridden)
+            models: List of (model, slo_seconds)
+            deadline, queue_timeout: applied to each model's request (see complete)
+        
+        Returns:
+            (parsed JSON response, model) of the winning model
+        """
+        pending = set()
+        models_by_task = {}
+        errors = []
+        launched = 0
+        
+        def launch_next():
+            nonlocal launched
+            model, _ = models[launched]
+            launched += 1
+            task = asyncio.create_task(
+                self._timed_complete({**payload, 'model': model}, estimated_tokens, deadline, queue_timeout)
+            )
+            models_by_task[task] = model
+            pending.add(task)
+        
+        launch_next()
+        try:
+            while pending:
+                # Wait for the SLO of the most recently launched model before hedging again
+                slo = models[launched - 1][1] if launched < len(models) else None
+                done, _ = await asyncio.wait(pending, timeout=slo, return_when=asyncio.FIRST_COMPLETED)
+                
+                for task in done:
+                    pending.discard(task)
+                    if task.exception() is None:
+                        return task.result(), models_by_task[task]
+                    errors.append(task.exception())
+                
+                # SLO expired, or a request failed: bring in the next model
+                if launched < len(models):
+                    launch_next()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+        
+        # Keep the kind of failure (e.g. DeadlineExceeded) when every model failed the same way
+        kinds = {type(error) for error in errors}
+        error_type = kinds.pop() if len(kinds) == 1 and isinstance(errors[0], OpenRouterError) else OpenRouterError
+        raise error_type(f"All models failed: {'; '.join(str(error) for error in errors)}")
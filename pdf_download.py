@@ -0,0 +1,152 @@
+import hashlib
+import io
+import mmap
+import tempfile
+from config import PDF_MAX_DOWNLOAD_MB, PDF_SPOOL_THRESHOLD_MB
+
+CHUNK_SIZE = 64 * 1024
+PDF_MAGIC = b'%PDF-'
+# The PDF spec lets readers accept a header anywhere in the first 1 KB
+MAGIC_WINDOW = 1024
+# Content-Types that are certainly not a PDF (error pages, JSON errors); anything
+# else is judged by the magic bytes, since servers label PDFs inconsistently
+NON_PDF_CONTENT_TYPES = ('text/', 'image/', 'application/json', 'application/xml', 'application/xhtml')
+
+
+class DownloadError(Exception):
+    """Raised when a download is too large or is not a PDF"""
+
+
+class DownloadedPDF:
+    """
+    PDF body spooled to memory, or to a memory-mapped temp file once large
+    
+    The SHA-256 and size are worked out while the body streams in, so
+    nothing needs to re-read the file to identify it.
+    """
+    
+    def __init__(self, url, spool_threshold=PDF_SPOOL_THRESHOLD_MB * 1024 * 1024):
+        self.url = url
+        self.spool_threshold = spool_threshold
+        self.size = 0
+        self.sha256 = None
+        self._hash = hashlib.sha256()
+        self._memory = io.BytesIO()
+        self._file = None
+        self._bytes = None
+    
+    def write(self, chunk):
+        self._hash.update(chunk)
+        self.size += len(chunk)
+        
+        if self._file is None and self.size > self.spool_threshold:
+            # Roll over to a named temp file so worker processes can map it by path
+            self._file = tempfile.NamedTemporaryFile(prefix='pdf-', suffix='.pdf')
+            self._file.write(self._memory.getbuffer())
+            self._memory = None
+        
+        (self._file or self._memory).write(chunk)
+    
+    def finish(self):
+        self.sha256 = self._hash.hexdigest()
+        if self._file:
+            self._file.flush()
+        return self
+    
+    @property
+    def path(self):
+        """Temp file path when spooled to disk, otherwise None"""
+        return self._file.name if self._file else None
+    
+    @property
+    def content(self):
+        """The body as bytes (small downloads) or a read-only mmap (large ones)"""
+        if self._file:
+            return self.open_stream()
+        if self._bytes is None:
+            self._bytes = self._memory.getvalue()
+        return self._bytes
+    
+    def open_stream(self):
+        """A fresh seekable reader over the body, without copying spooled files"""
+        if self._file:
+            return mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        return io.BytesIO(self.content)
+    
+    def read_bytes(self):
+        if self._file:
+            with self.open_stream() as mapped:
+                return mapped[:]
+        return self.content
+    
+    def close(self):
+        if self._file:
+            self._file.close()
+            self._file = None
+        self._memory = None
+        self._bytes = None
+    
+    def __len__(self):
+        return self.size
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc):
+        self.close()
+
+
+def spool_stream(url, stream, max_bytes=None):
+    """Copy an already-trusted stream (e.g. the document store) into a DownloadedPDF"""
+    document = DownloadedPDF(url)
+    while True:
+        chunk = stream.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        document.write(chunk)
+        if max_bytes and document.size > max_bytes:
+            document.close()
+            raise DownloadError(f"larger than {max_bytes:,} bytes")
+    return document.finish()
+
+
+def spool_response(response, url, max_bytes=PDF_MAX_DOWNLOAD_MB * 1024 * 1024):
+    """
+    Stream a requests response (opened with stream=True) into a DownloadedPDF
+    
+    Rejects oversized bodies from Content-Length before reading, checks the
+    Content-Type and the %PDF- magic bytes on the first chunk, and stops as
+    soon as the body passes max_bytes.
+    """
+    try:
+        response.raise_for_status()
+        
+        declared = int(response.headers.get('Content-Length') or 0)
+        if max_bytes and declared > max_bytes:
+            raise DownloadError(f"Content-Length {declared:,} exceeds limit of {int(max_bytes):,} bytes")
+        
+        content_type = response.headers.get('Content-Type', '').split(';')[0].strip().lower()
+        if content_type.startswith(NON_PDF_CONTENT_TYPES):
+            raise DownloadError(f"unexpected Content-Type '{content_type}'")
+        
+        document = DownloadedPDF(url)
+        head = b""
+        for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+            if len(head) < MAGIC_WINDOW:
+                head += chunk[:MAGIC_WINDOW]
+                if len(head) >= MAGIC_WINDOW and PDF_MAGIC not in head[:MAGIC_WINDOW]:
+                    document.close()
+                    raise DownloadError("response is not a PDF (missing %PDF- header)")
+            
+            document.write(chunk)
+            if max_bytes and document.size > max_bytes:
+                document.close()
+                raise DownloadError(f"body exceeds limit of {int(max_bytes):,} bytes")
+        
+        if PDF_MAGIC not in head[:MAGIC_WINDOW]:
+            document.close()
+            raise DownloadError("response is not a PDF (missing %PDF- header)")
+        
+        return document.finish()
+    finally:
+        response.close()
@@ -0,0 +1,222 @@
+import atexit
+import math
+import multiprocessing
+import queue
+import resource
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    PDF_EXTRACT_PROCESSES, PDF_EXTRACT_TASK_TIMEOUT, PDF_WORKER_MAX_MEMORY_MB,
+    PDF_WORKER_MAX_TASKS, PDF_PARALLEL_PAGE_THRESHOLD, PDF_PARALLEL_MIN_BYTES
+)
+from pdf_text import count_pages, iter_pdf_text, source_size
+
+
+class ExtractionError(Exception):
+    """Raised when a worker fails, times out or runs out of memory"""
+
+
+def _peak_rss_mb():
+    # ru_maxrss is in kilobytes on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _worker_main(conn, max_memory_mb):
+    """Worker process loop: run extraction tasks until told to stop"""
+    if max_memory_mb:
+        limit = max_memory_mb * 1024 * 1024
+        try:
+            resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+        except (ValueError, OSError):
+            pass
+    
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        
+        kind, args = task
+        try:
+            if kind == 'count':
+                result = count_pages(*args)
+            else:
+                pdf_content, max_chars, max_pages, time_limit, start_page, stop_page = args
+                stats = {}
+                text = "".join(iter_pdf_text(pdf_content, max_chars, max_pages, time_limit, stats, start_page, stop_page))
+                result = (text, stats)
+            conn.send(('ok', result, _peak_rss_mb()))
+        except MemoryError:
+            conn.send(('memory', f"worker exceeded {max_memory_mb} MB", _peak_rss_mb()))
+            return
+        except Exception as e:
+            conn.send(('error', f"{type(e).__name__}: {e}", _peak_rss_mb()))
+
+
+class _Worker:
+    def __init__(self, ctx, max_memory_mb):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, max_memory_mb), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+    
+    def stop(self, kill=False):
+        if kill or not self.process.is_alive():
+            self.process.kill()
+        else:
+            try:
+                self.conn.send(None)
+            except OSError:
+                self.process.kill()
+        self.process.join(timeout=5)
+        self.conn.close()
+
+
+class PDFExtractionEngine:
+    """
+    Runs PDF text extraction in a pool of worker processes
+    
+    PyPDF2 is pure Python, so threads serialise on the GIL and a malformed
+    PDF can hang or bloat the caller. Here each task runs in a separate
+    process that can be killed on timeout. Workers have an address-space
+    ceiling and are recycled after max_tasks_per_worker tasks or once their
+    peak RSS passes half the ceiling. Large PDFs are split into page ranges
+    and the ranges are extracted in parallel.
+    """
+    
+    def __init__(self, processes=PDF_EXTRACT_PROCESSES, task_timeout=PDF_EXTRACT_TASK_TIMEOUT,
+                 max_memory_mb=PDF_WORKER_MAX_MEMORY_MB, max_tasks_per_worker=PDF_WORKER_MAX_TASKS,
+                 parallel_page_threshold=PDF_PARALLEL_PAGE_THRESHOLD, parallel_min_bytes=PDF_PARALLEL_MIN_BYTES):
+        self.processes = max(1, processes)
+        self.task_timeout = task_timeout
+        self.max_memory_mb = max_memory_mb
+        self.max_tasks_per_worker = max_tasks_per_worker
+        self.parallel_page_threshold = parallel_page_threshold
+        self.parallel_min_bytes = parallel_min_bytes
+        
+        # forkserver avoids forking a process that already runs threads (uvicorn, our pools)
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context('forkserver' if 'forkserver' in methods else 'spawn')
+        self._idle = queue.Queue()
+        self._started = 0
+        self._workers = set()
+        self._lock = threading.Lock()
+        atexit.register(self.close)
+    
+    def _spawn(self):
+        worker = _Worker(self._ctx, self.max_memory_mb)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+    
+    def _acquire(self):
+        with self._lock:
+            spawn = self._started < self.processes
+            if spawn:
+                self._started += 1
+        return self._spawn() if spawn else self._idle.get()
+    
+    def _release(self, worker, retire):
+        if retire:
+            with self._lock:
+                self._workers.discard(worker)
+            worker.stop(kill=worker.process.is_alive() and retire == 'kill')
+            worker = self._spawn()
+        self._idle.put(worker)
+    
+    def _run(self, kind, args):
+        worker = self._acquire()
+        retire = 'kill'
+        try:
+            worker.conn.send((kind, args))
+            if not worker.conn.poll(self.task_timeout):
+                raise ExtractionError(f"timed out after {self.task_timeout:g}s")
+            
+            status, result, peak_rss_mb = worker.conn.recv()
+            worker.tasks += 1
+            retire = (
+                status == 'memory'
+                or (self.max_memory_mb and peak_rss_mb > self.max_memory_mb / 2)
+                or (self.max_tasks_per_worker and worker.tasks >= self.max_tasks_per_worker)
+            )
+            
+            if status != 'ok':
+                raise ExtractionError(result)
+            return result
+        except (EOFError, OSError) as e:
+            raise ExtractionError(f"worker process died: {e}")
+        finally:
+            self._release(worker, retire)
+    
+    def extract(self, pdf_content, max_chars=None, max_pages=None, time_limit=None):
+        """
+        Extract text in the worker pool
+        
+        pdf_content is PDF bytes or a file path; a path is memory-mapped by
+        the worker, so large spooled downloads are never copied between processes.
+        
+        Returns:
+            (text, stats) as produced by pdf_text.iter_pdf_text
+        """
+        if self.processes > 1 and source_size(pdf_content) >= self.parallel_min_bytes:
+            page_count = self._run('count', (pdf_content,))
+            window = page_count if max_pages is None else min(page_count, max_pages)
+            
+            if window >= self.parallel_page_threshold:
+                return self._extract_ranges(pdf_content, page_count, window, max_chars, time_limit)
+        
+        return self._run('extract', (pdf_content, max_chars, max_pages, time_limit, 0, None))
+    
+    def _extract_ranges(self, pdf_content, page_count, window, max_chars, time_limit):
+        """Extract the first `window` pages as parallel page ranges, in order"""
+        size = math.ceil(window / self.processes)
+        ranges = [(start, min(start + size, window)) for start in range(0, window, size)]
+        
+        def run_range(page_range):
+            return self._run('extract', (pdf_content, max_chars, None, time_limit, page_range[0], page_range[1]))
+        
+        with ThreadPoolExecutor(max_workers=len(ranges)) as executor:
+            results = list(executor.map(run_range, ranges))
+        
+        text = "".join(range_text for range_text, _ in results)
+        stats = {
+            'pages': sum(range_stats['pages'] for _, range_stats in results),
+            'page_count': page_count,
+            'stopped_by': None,
+        }
+        
+        if max_chars is not None and len(text) >= max_chars:
+            stopped = len(text) > max_chars or any(s['stopped_by'] == 'chars' for _, s in results)
+            text = text[:max_chars]
+            stats['stopped_by'] = 'chars' if stopped or window < page_count else None
+        elif any(s['stopped_by'] == 'time' for _, s in results):
+            stats['stopped_by'] = 'time'
+        elif window < page_count:
+            stats['stopped_by'] = 'pages'
+        
+        return text, stats
+    
+    def close(self):
+        """Stop every worker process"""
+        with self._lock:
+            workers = list(self._workers)
+            self._workers.clear()
+            self._started = self.processes  # no new workers after close
+        for worker in workers:
+            worker.stop()
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+
+def get_extraction_engine():
+    """Get the process-wide shared extraction engine"""
+    global _engine
+    with _engine_lock:
+        if _engine is None:
+            _engine = PDFExtractionEngine()
+        return _engine
@@ -1,30 +1,122 @@
-import requests
-import PyPDF2
-import io
+from contextlib import nullcontext
+from config import DOCUMENT_STORE_ENABLED, PDF_TEXT_CHAR_BUDGET, PDF_MAX_PAGES, PDF_EXTRACT_TIME_LIMIT
+from config import PDF_EXTRACT_PROCESSES, PDF_RANGE_REQUESTS, PDF_URL_PROBING
+from document_store import DocumentStore
+from http_client import get_session
+from http_range_file import HTTPRangeFile
+from pdf_download import DownloadedPDF, spool_response, spool_stream
+from pdf_extraction_pool import get_extraction_engine
+from pdf_text import iter_pdf_text
+from pdf_url_resolver import PDFURLResolver
 
 class PDFProcessor:
+    def __init__(self, store=None, engine=None):
+        self.session = get_session('pdf')
+        self.store = store
+        if self.store is None and DOCUMENT_STORE_ENABLED:
+            self.store = DocumentStore()
+        
+        # Worker processes for extraction; None extracts in this process
+        self.engine = engine
+        if self.engine is None and PDF_EXTRACT_PROCESSES > 0:
+            self.engine = get_extraction_engine()
+        
+        self.range_requests = PDF_RANGE_REQUESTS
+        self.resolver = PDFURLResolver(self.session) if PDF_URL_PROBING else None
     
     def download_pdf(self, url):
-        """Download PDF from URL"""
+        """Download PDF from URL and return its bytes"""
+        document = self.download_document(url)
+        if document is None:
+            return None
+        with document:
+            return document.read_bytes()
+    
+    def download_document(self, url):
+        """
+        Stream a PDF into a size-capped, spooled DownloadedPDF
+        
+        Uses a conditional GET when the document store has a copy. Returns
+        None on failure; callers should close() the result when done.
+        """
         try:
-            response = requests.get(url, timeout=30)
-            response.raise_for_status()
-            return response.content
+            headers = self.store.conditional_headers(url) if self.store else {}
+            response = self.session.get(url, headers=headers, stream=True)
+            
+            if response.status_code == 304 and headers:
+                response.close()
+                stored = self.store.open(url)
+                if stored is not None:
+                    with stored:
+                        return spool_stream(url, stored)
+                # Stored copy went missing, fetch it again unconditionally
+                response = self.session.get(url, stream=True)
+            
+            document = spool_response(response, url)
+            
+            if self.store:
+                with document.open_stream() as stream:
+                    self.store.save_stream(
+                        url,
+                        stream,
+                        document.sha256,
+                        document.size,
+                        etag=response.headers.get('ETag'),
+                        last_modified=response.headers.get('Last-Modified')
+                    )
+            return document
         except Exception as e:
             print(f"Error downloading PDF from {url}: {e}")
             return None
     
-    def extract_text(self, pdf_content):
-        """Extract text from PDF bytes"""
+    def extract_text_from_url(self, url, max_chars=PDF_TEXT_CHAR_BUDGET, max_pages=PDF_MAX_PAGES, time_limit=PDF_EXTRACT_TIME_LIMIT):
+        """
+        Extract text straight from a URL using HTTP range requests
+        
+        Only the trailer, xref and the pages within the limits are fetched.
+        Servers without range support get a streamed full download instead.
+        Runs in this process, since the work is mostly waiting on the network.
+        """
         try:
-            pdf_file = io.BytesIO(pdf_content)
-            reader = PyPDF2.PdfReader(pdf_file)
-            
-            text = ""
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
+            with HTTPRangeFile.open_url(url, self.session) as pdf_file:
+                return "".join(self.iter_text(pdf_file, max_chars, max_pages, time_limit)).strip()
+        except Exception as e:
+            print(f"Error extracting text from {url}: {e}")
+            return None
+    
+    def iter_text(self, pdf_content, max_chars=None, max_pages=None, time_limit=None, stats=None):
+        """Yield page text lazily within the given limits (see pdf_text.iter_pdf_text)"""
+        return iter_pdf_text(pdf_content, max_chars, max_pages, time_limit, stats)
+    
+    def extract_text(self, pdf_content, max_chars=PDF_TEXT_CHAR_BUDGET, max_pages=PDF_MAX_PAGES, time_limit=PDF_EXTRACT_TIME_LIMIT):
+        """
+        Extract text from PDF bytes or a DownloadedPDF within a character, page and time budget
+        
+        Pass None for a limit to disable it. Reuses stored text for known content.
+        """
+        downloaded = isinstance(pdf_content, DownloadedPDF)
+        content_hash = None
+        if self.store:
+            content_hash = pdf_content.sha256 if downloaded else self.store.content_hash(pdf_content)
+            text = self.store.get_text(content_hash, min_chars=max_chars)
+            if text is not None:
+                return text if max_chars is None else text[:max_chars]
+        
+        try:
+            if self.engine:
+                # Spooled downloads go to the workers by path and are mmapped there
+                source = (pdf_content.path or pdf_content.content) if downloaded else pdf_content
+                text, stats = self.engine.extract(source, max_chars, max_pages, time_limit)
+            else:
+                stats = {}
+                with pdf_content.open_stream() if downloaded else nullcontext(pdf_content) as source:
+                    text = "".join(self.iter_text(source, max_chars, max_pages, time_limit, stats))
+            text = text.strip()
             
-            return text.strip()
+            if content_hash:
+                covers = {None: None, 'chars': max_chars}.get(stats['stopped_by'], len(text))
+                self.store.put_text(content_hash, text, covers=covers)
+            return text
         except Exception as e:
             print(f"Error extracting text: {e}")
             return None
@@ -47,3 +139,32 @@ class PDFProcessor:
         
         url = f"https://incometaxindia.gov.in/communications/notification/notification-{number.lower()}.pdf"
         return url
+    
+    def resolve_circular_pdf_url(self, circular_number):
+        """Find the PDF URL for a circular, probing URL variants if needed"""
+        return self.resolve_pdf_url('circular', circular_number)
+    
+    def resolve_notification_pdf_url(self, notification_number):
+        """Find the PDF URL for a notification, probing URL variants if needed"""
+        return self.resolve_pdf_url('notification', notification_number)
+    
+    def resolve_pdf_url(self, doc_type, number):
+        """
+        Find a document's PDF URL
+        
+        The constructed URL is the first candidate; with probing enabled the
+        resolver checks the other variants in parallel and caches the answer.
+        """
+        if doc_type == 'circular':
+            guess = self.find_circular_pdf_url(number)
+        else:
+            guess = self.find_notification_pdf_url(number)
+        
+        if not self.resolver:
+            return guess
+        return self.resolver.resolve(doc_type, number, preferred=guess)
+    
+    def forget_pdf_url(self, doc_type, number):
+        """Drop a cached URL resolution that turned out not to work"""
+        if self.resolver:
+            self.resolver.forget(doc_type, number)
@@ -0,0 +1,79 @@
+import io
+import mmap
+import os
+import time
+import PyPDF2
+
+
+def open_reader(pdf_content):
+    """PdfReader over PDF bytes, a file path (memory-mapped) or a seekable file-like object"""
+    if isinstance(pdf_content, (bytes, bytearray)):
+        pdf_content = io.BytesIO(pdf_content)
+    elif isinstance(pdf_content, str):
+        with open(pdf_content, 'rb') as f:
+            pdf_content = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    return PyPDF2.PdfReader(pdf_content)
+
+
+def source_size(pdf_content):
+    """Size in bytes of anything open_reader accepts"""
+    if isinstance(pdf_content, str):
+        return os.path.getsize(pdf_content)
+    if hasattr(pdf_content, 'seek') and not hasattr(pdf_content, '__len__'):
+        position = pdf_content.tell()
+        size = pdf_content.seek(0, io.SEEK_END)
+        pdf_content.seek(position)
+        return size
+    return len(pdf_content)
+
+
+def count_pages(pdf_content):
+    return len(open_reader(pdf_content).pages)
+
+
+def iter_pdf_text(pdf_content, max_chars=None, max_pages=None, time_limit=None, stats=None,
+                  start_page=0, stop_page=None):
+    """
+    Yield the text of each page lazily, stopping at the first limit reached
+    
+    Args:
+        pdf_content: PDF bytes, file path or seekable file-like object
+        max_chars: Stop once this many characters have been yielded
+                   (the last page is cut to fit)
+        max_pages: Stop after this many pages
+        time_limit: Stop starting new pages after this many seconds
+        stats: Optional dict; gets 'pages', 'page_count' and 'stopped_by'
+               ('chars', 'pages', 'time', or None when the range was read in full)
+        start_page, stop_page: Only read pages in [start_page, stop_page)
+    """
+    stats = {} if stats is None else stats
+    stats.update(pages=0, stopped_by=None)
+    
+    reader = open_reader(pdf_content)
+    page_count = len(reader.pages)
+    stop_page = page_count if stop_page is None else min(stop_page, page_count)
+    stats['page_count'] = page_count
+    started = time.monotonic()
+    remaining = max_chars
+    
+    for page_number in range(start_page, stop_page):
+        if max_pages is not None and page_number - start_page >= max_pages:
+            stats['stopped_by'] = 'pages'
+            return
+        if time_limit is not None and time.monotonic() - started > time_limit:
+            stats['stopped_by'] = 'time'
+            print(f"⚠️ Text extraction stopped after {time_limit:g}s ({page_number} of {page_count} pages)")
+            return
+        
+        page_text = (reader.pages[page_number].extract_text() or "") + "\n"
+        stats['pages'] += 1
+        
+        if remaining is not None and len(page_text) >= remaining:
+            yield page_text[:remaining]
+            if len(page_text) > remaining or page_number < stop_page - 1:
+                stats['stopped_by'] = 'chars'
+            return
+        
+        if remaining is not None:
+            remaining -= len(page_text)
+        yield page_text
@@ -0,0 +1,138 @@
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from config import PDF_URL_PROBE_TIMEOUT
+from local_store import cache_path, connect
+
+BASE_URL = "https://incometaxindia.gov.in/communications"
+# Prefixes Browse AI puts in front of the number in listing text
+NUMBER_PREFIXES = {
+    'circular': 'Circular No.',
+    'notification': 'Notification No.',
+}
+
+
+class PDFURLResolver:
+    """
+    Resolves circular/notification numbers to PDF URLs
+    
+    The site's file names are not consistent (leading zeros, separators,
+    case), so instead of trusting one guessed URL we probe every plausible
+    variant at once with HEAD requests. Confirmed number → URL mappings are
+    cached on disk, so later runs skip probing.
+    """
+    
+    def __init__(self, session, path=None, probe_timeout=PDF_URL_PROBE_TIMEOUT):
+        self.session = session
+        self.probe_timeout = probe_timeout
+        self._lock = threading.Lock()
+        self._conn = connect(path or cache_path('pdf_urls.db'))
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS resolved_urls (
+                doc_type TEXT NOT NULL,
+                number TEXT NOT NULL,
+                url TEXT NOT NULL,
+                resolved_at REAL NOT NULL,
+                PRIMARY KEY (doc_type, number)
+            )
+        """)
+    
+    @staticmethod
+    def normalise_number(doc_type, number):
+        """'Notification No. 05/2026 [F.No...]' → '05-2026'"""
+        prefix = NUMBER_PREFIXES.get(doc_type, '')
+        number = number.replace(prefix, '').split('[')[0]
+        return number.replace(' ', '').replace(':', '').replace('/', '-').strip()
+    
+    def candidates(self, doc_type, number, preferred=None):
+        """Candidate URLs, most likely first (preferred, if given, leads)"""
+        base = self.normalise_number(doc_type, number)
+        parts = base.split('-')
+        
+        variants = [base]
+        if len(parts) >= 2 and parts[0].isdigit():
+            stripped = parts[0].lstrip('0') or '0'
+            variants.append('-'.join([stripped] + parts[1:]))
+            variants.append('-'.join([stripped.zfill(2)] + parts[1:]))
+        # Some files use the number without separators or with underscores
+        variants.append(base.replace('-', '_'))
+        variants.append(re.sub(r'[^0-9A-Za-z]', '', base))
+        
+        urls = [preferred] if preferred else []
+        for variant in variants:
+            for name in (variant.lower(), variant):
+                url = f"{BASE_URL}/{doc_type}/{doc_type}-{name}.pdf"
+                if name and url not in urls:
+                    urls.append(url)
+        return urls
+    
+    def cached(self, doc_type, number):
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT url FROM resolved_urls WHERE doc_type = ? AND number = ?",
+                (doc_type, self.normalise_number(doc_type, number))
+            ).fetchone()
+        return row['url'] if row else None
+    
+    def remember(self, doc_type, number, url):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO resolved_urls (doc_type, number, url, resolved_at) VALUES (?, ?, ?, ?)",
+                (doc_type, self.normalise_number(doc_type, number), url, time.time())
+            )
+    
+    def forget(self, doc_type, number):
+        """Drop a cached mapping (e.g. after the URL stopped working)"""
+        with self._lock:
+            self._conn.execute(
+                "DELETE FROM resolved_urls WHERE doc_type = ? AND number = ?",
+                (doc_type, self.normalise_number(doc_type, number))
+            )
+    
+    def probe(self, url):
+        """True if the URL serves a PDF"""
+        try:
+            response = self.session.head(url, allow_redirects=True, timeout=self.probe_timeout)
+            if response.status_code in (403, 405, 501):
+                # HEAD not allowed; read just the first bytes instead
+                response = self.session.get(url, headers={'Range': 'bytes=0-1023'}, stream=True, timeout=self.probe_timeout)
+                try:
+                    head = next(response.iter_content(chunk_size=1024), b"") if response.ok else b""
+                finally:
+                    response.close()
+                return b'%PDF-' in head
+            
+            content_type = response.headers.get('Content-Type', '').lower()
+            return response.ok and not content_type.startswith(('text/', 'application/json'))
+        except Exception:
+            return False
+    
+    def resolve(self, doc_type, number, preferred=None):
+        """
+        Return the URL of a document's PDF
+        
+        Uses the cache if possible; otherwise probes all candidates in
+        parallel and picks the most likely one that serves a PDF. Falls back
+        to the first candidate when none do, so the caller's download
+        reports the failure as before.
+        """
+        url = self.cached(doc_type, number)
+        if url:
+            return url
+        
+        urls = self.candidates(doc_type, number, preferred)
+        executor = ThreadPoolExecutor(max_workers=len(urls))
+        try:
+            futures = [executor.submit(self.probe, url) for url in urls]
+            
+            # Take candidates in priority order, but only wait as long as needed
+            for url, future in zip(urls, futures):
+                if future.result():
+                    self.remember(doc_type, number, url)
+                    return url
+        finally:
+            # Don't wait for lower-priority probes that are still running
+            executor.shutdown(wait=False, cancel_futures=True)
+        
+        return urls[0]
@@ -0,0 +1,38 @@
+from datetime import datetime, timedelta
+from apscheduler.schedulers.background import BackgroundScheduler
+from apscheduler.triggers.cron import CronTrigger
+from config import SCHEDULER_TIMEZONE, DIGEST_CRON
+
+
+def create_scheduler(poll_minutes, poll, digest):
+    """
+    Background scheduler for the API service
+    
+    Args:
+        poll_minutes: robot_id -> minutes between polls (0 or no robot id disables)
+        poll: function(robot_id) called on each robot's interval
+        digest: function() called on the DIGEST_CRON schedule
+    
+    Missed or overlapping fires are coalesced into one. The functions
+    should only queue work, so the scheduler thread is never busy.
+    """
+    scheduler = BackgroundScheduler(
+        timezone=SCHEDULER_TIMEZONE,
+        job_defaults={'coalesce': True, 'max_instances': 1, 'misfire_grace_time': 300}
+    )
+    
+    # Stagger first polls so robots don't all hit Browse AI at once
+    start = datetime.now(scheduler.timezone)
+    for offset, (robot_id, minutes) in enumerate(poll_minutes.items()):
+        if not robot_id or minutes <= 0:
+            continue
+        scheduler.add_job(
+            poll, 'interval', args=[robot_id], minutes=minutes, id=f'poll-{robot_id}',
+            next_run_time=start + timedelta(seconds=10 + 30 * offset)
+        )
+        print(f"⏱️ Polling robot {robot_id} every {minutes:g} min")
+    
+    scheduler.add_job(digest, CronTrigger.from_crontab(DIGEST_CRON, timezone=SCHEDULER_TIMEZONE), id='digest')
+    print(f"⏱️ Digest scheduled at '{DIGEST_CRON}' ({SCHEDULER_TIMEZONE})")
+    
+    return scheduler
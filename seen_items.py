@@ -0,0 +1,93 @@
+import re
+import threading
+import time
+from local_store import cache_path, connect
+
+# Fields that identify an item, in order of preference
+KEY_FIELDS = ('Circular Number', 'Notification Number', 'Title')
+DATE_FIELDS = ('Publish Date', 'Date')
+
+
+def item_key(item):
+    """Stable identity of a captured item: its number or title plus its date"""
+    name = next((item.get(field) for field in KEY_FIELDS if item.get(field)), None)
+    if name is None:
+        name = "|".join(f"{key}={value}" for key, value in sorted(item.items()) if not key.startswith('_'))
+    date = next((item.get(field) for field in DATE_FIELDS if item.get(field)), '')
+    return re.sub(r'\s+', ' ', f"{name}|{date}").strip().lower()
+
+
+class SeenItemIndex:
+    """
+    Persistent record of which Browse AI items have been processed
+    
+    Keeps the keys of processed items per robot, plus a watermark: the
+    createdAt (ms) of the newest monitor task whose items were handled.
+    Tasks up to the watermark never need to be read again.
+    """
+    
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = connect(path or cache_path('seen_items.db'))
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS seen_items (
+                robot_id TEXT NOT NULL,
+                item_key TEXT NOT NULL,
+                processed_at REAL NOT NULL,
+                PRIMARY KEY (robot_id, item_key)
+            )
+        """)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS watermarks (
+                robot_id TEXT PRIMARY KEY,
+                created_at INTEGER NOT NULL,
+                task_id TEXT,
+                updated_at REAL NOT NULL
+            )
+        """)
+    
+    def watermark(self, robot_id):
+        """createdAt of the newest task already handled for the robot, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT created_at FROM watermarks WHERE robot_id = ?", (robot_id,)
+            ).fetchone()
+        return row['created_at'] if row else None
+    
+    def unseen(self, robot_id, items):
+        """Items not yet processed, without repeats, in their original order"""
+        with self._lock:
+            seen = {
+                row['item_key'] for row in
+                self._conn.execute("SELECT item_key FROM seen_items WHERE robot_id = ?", (robot_id,))
+            }
+        
+        fresh = []
+        for item in items:
+            key = item_key(item)
+            if key not in seen:
+                seen.add(key)
+                fresh.append(item)
+        return fresh
+    
+    def mark_processed(self, robot_id, items, created_at=None, task_id=None):
+        """Record items as processed and move the watermark forward to created_at"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.executemany(
+                    "INSERT OR IGNORE INTO seen_items (robot_id, item_key, processed_at) VALUES (?, ?, ?)",
+                    [(robot_id, item_key(item), now) for item in items]
+                )
+                if created_at is not None:
+                    self._conn.execute("""
+                        INSERT INTO watermarks (robot_id, created_at, task_id, updated_at) VALUES (?, ?, ?, ?)
+                        ON CONFLICT (robot_id) DO UPDATE SET
+                            created_at = excluded.created_at, task_id = excluded.task_id, updated_at = excluded.updated_at
+                        WHERE excluded.created_at > watermarks.created_at
+                    """, (robot_id, created_at, task_id, now))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
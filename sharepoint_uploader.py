@@ -1,12 +1,13 @@
-import requests
 from datetime import datetime
 import config
+from http_client import get_session
 from html_formatter import HTMLFormatter  # Add this import
 
 class SharePointUploader:
     def __init__(self):
         self.webhook_url = config.POWER_AUTOMATE_WEBHOOK
         self.html_formatter = HTMLFormatter()  # Add this
+        self.session = get_session('sharepoint')
     
     # Keep the existing format_newsletter_content for text version
     
@@ -27,7 +28,7 @@ class SharePointUploader:
             
             # Send to Power Automate webhook
             print(f"📤 Uploading to SharePoint: {filename}")
-            response = requests.post(self.webhook_url, json=payload, timeout=30)
+            response = self.session.post(self.webhook_url, json=payload)
             
             if response.status_code in [200, 202]:
                 print("✅ Uploaded to SharePoint successfully!")
@@ -0,0 +1,27 @@
+class SummarizerBackend:
+    """
+    Interface shared by the summarizer engines
+    
+    A backend summarizes the extracted text of a circular or notification.
+    summarize_many takes (text, doc_type, doc_number) tuples and returns
+    summaries in the same order; engines that can overlap requests override it.
+    on_summary(index, summary), if given, is called as each summary is ready.
+    """
+    
+    name = "base"
+    cache = None
+    
+    def summarize_document(self, text, doc_type, doc_number):
+        raise NotImplementedError
+    
+    def summarize_many(self, documents, on_summary=None):
+        summaries = []
+        for index, (text, doc_type, doc_number) in enumerate(documents):
+            summaries.append(self.summarize_document(text, doc_type, doc_number))
+            if on_summary:
+                on_summary(index, summaries[-1])
+        return summaries
+    
+    def report(self):
+        """Lines describing cache/latency statistics for the run summary"""
+        return []
@@ -0,0 +1,119 @@
+import hashlib
+import threading
+import time
+from config import SUMMARY_CACHE_TTL_DAYS, SUMMARY_CACHE_MAX_ENTRIES
+from local_store import cache_path, connect
+
+
+class SummaryCache:
+    """
+    Persistent cache of LLM summaries
+    
+    Entries are keyed by model, prompt-template version and a SHA-256 of
+    the prompt input, expire after a TTL and are evicted least-recently-used
+    once the cache grows past max_entries.
+    """
+    
+    def __init__(self, path=None, ttl_days=SUMMARY_CACHE_TTL_DAYS, max_entries=SUMMARY_CACHE_MAX_ENTRIES):
+        self.ttl = ttl_days * 86400
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = connect(path or cache_path('summaries.db'))
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS summaries (
+                key TEXT PRIMARY KEY,
+                model TEXT NOT NULL,
+                prompt_version TEXT NOT NULL,
+                summary TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_summaries_accessed ON summaries (accessed_at)")
+    
+    @staticmethod
+    def make_key(model, prompt_version, text):
+        text_hash = hashlib.sha256(text.encode('utf-8')).hexdigest()
+        return hashlib.sha256(f"{model}\0{prompt_version}\0{text_hash}".encode('utf-8')).hexdigest()
+    
+    def get(self, model, prompt_version, text):
+        """
+        Return the cached summary, or None on a miss or expired entry
+        
+        model may also be a list of models, tried in order; one hit or
+        miss is counted either way.
+        """
+        models = [model] if isinstance(model, str) else list(model)
+        now = time.time()
+        
+        with self._lock:
+            for name in models:
+                key = self.make_key(name, prompt_version, text)
+                row = self._conn.execute(
+                    "SELECT summary, created_at FROM summaries WHERE key = ?", (key,)
+                ).fetchone()
+                
+                if row is None:
+                    continue
+                if self.ttl > 0 and now - row['created_at'] > self.ttl:
+                    self._conn.execute("DELETE FROM summaries WHERE key = ?", (key,))
+                    continue
+                
+                self._conn.execute("UPDATE summaries SET accessed_at = ? WHERE key = ?", (now, key))
+                self.hits += 1
+                return row['summary']
+            
+            self.misses += 1
+            return None
+    
+    def put(self, model, prompt_version, text, summary):
+        """Store a summary and evict the least recently used entries past the size limit"""
+        key = self.make_key(model, prompt_version, text)
+        now = time.time()
+        
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO summaries (key, model, prompt_version, summary, created_at, accessed_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, model, prompt_version, summary, now, now)
+            )
+            
+            if self.max_entries > 0:
+                self._conn.execute(
+                    "DELETE FROM summaries WHERE key IN ("
+                    "SELECT key FROM summaries ORDER BY accessed_at DESC LIMIT -1 OFFSET ?)",
+                    (self.max_entries,)
+                )
+    
+    def invalidate(self, model=None, prompt_version=None):
+        """
+        Delete entries for a model and/or prompt version (everything if neither is given)
+        
+        Returns:
+            Number of entries removed
+        """
+        clauses, params = [], []
+        if model is not None:
+            clauses.append("model = ?")
+            params.append(model)
+        if prompt_version is not None:
+            clauses.append("prompt_version = ?")
+            params.append(prompt_version)
+        
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        with self._lock:
+            return self._conn.execute(f"DELETE FROM summaries{where}", params).rowcount
+    
+    def invalidate_other_versions(self, prompt_version):
+        """Drop entries written by any other prompt-template version"""
+        with self._lock:
+            return self._conn.execute(
+                "DELETE FROM summaries WHERE prompt_version != ?", (prompt_version,)
+            ).rowcount
+    
+    def stats(self):
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM summaries").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
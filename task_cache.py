@@ -0,0 +1,94 @@
+import json
+import threading
+import time
+from local_store import cache_path, connect
+
+# Tasks in these states never change again, so they can be cached forever
+FINISHED_STATUSES = ('successful', 'failed')
+
+
+def is_finished(task):
+    return task.get('status') in FINISHED_STATUSES
+
+
+class TaskCache:
+    """
+    Local copy of finished Browse AI tasks
+    
+    Besides the tasks themselves it keeps, per robot, the createdAt range
+    (newest, oldest) for which it holds every task. A task walk that
+    reaches that range can read it from disk instead of paging through it.
+    """
+    
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = connect(path or cache_path('browse_ai_tasks.db'))
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS tasks (
+                id TEXT PRIMARY KEY,
+                robot_id TEXT NOT NULL,
+                created_at INTEGER NOT NULL,
+                status TEXT NOT NULL,
+                data TEXT NOT NULL,
+                stored_at REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_tasks_robot_created ON tasks (robot_id, created_at)")
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS coverage (
+                robot_id TEXT PRIMARY KEY,
+                newest INTEGER NOT NULL,
+                oldest INTEGER NOT NULL
+            )
+        """)
+    
+    def get(self, task_id):
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM tasks WHERE id = ?", (task_id,)).fetchone()
+        return json.loads(row['data']) if row else None
+    
+    def store(self, robot_id, tasks):
+        """Keep the finished ones among tasks"""
+        rows = [
+            (task['id'], robot_id, task.get('createdAt', 0), task['status'], json.dumps(task), time.time())
+            for task in tasks if task.get('id') and is_finished(task)
+        ]
+        if not rows:
+            return
+        with self._lock:
+            self._conn.executemany("INSERT OR REPLACE INTO tasks VALUES (?, ?, ?, ?, ?, ?)", rows)
+    
+    def coverage(self, robot_id):
+        """(newest, oldest) createdAt of the fully cached range, or None"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT newest, oldest FROM coverage WHERE robot_id = ?", (robot_id,)
+            ).fetchone()
+        return (row['newest'], row['oldest']) if row else None
+    
+    def extend_coverage(self, robot_id, newest, oldest):
+        """Record that every task from newest down to oldest is cached"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT newest, oldest FROM coverage WHERE robot_id = ?", (robot_id,)
+            ).fetchone()
+            if row and oldest <= row['newest'] and newest >= row['oldest']:
+                # Overlapping ranges merge; otherwise the newer range replaces the old one
+                newest, oldest = max(newest, row['newest']), min(oldest, row['oldest'])
+            elif row and newest < row['oldest']:
+                return
+            self._conn.execute(
+                "INSERT OR REPLACE INTO coverage (robot_id, newest, oldest) VALUES (?, ?, ?)",
+                (robot_id, newest, oldest)
+            )
+    
+    def iter_range(self, robot_id, below, oldest):
+        """Cached tasks created before `below` and no earlier than oldest, newest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT data FROM tasks WHERE robot_id = ? AND created_at < ? AND created_at >= ? "
+                "ORDER BY created_at DESC",
+                (robot_id, below, oldest)
+            ).fetchall()
+        for row in rows:
+            yield json.loads(row['data'])
@@ -0,0 +1,207 @@
+"""
+Task-history walk (iter_tasks) and seen-index watermark of BrowseAIHandler,
+against a fake paginated Browse AI API
+"""
+import threading
+import time
+import pytest
+from browse_ai_handler import BrowseAIHandler
+from seen_items import SeenItemIndex
+from task_cache import TaskCache
+
+ROBOT = 'robot-1'
+PAGE_SIZE = 10
+
+
+def make_task(number, status='successful', items=None):
+    return {
+        'id': f'task-{number}',
+        'createdAt': 1_000_000 + number * 1000,
+        'status': status,
+        'runByTaskMonitorId': 'monitor-1',
+        'capturedLists': {'Circulars': items if items is not None else []},
+    }
+
+
+def make_item(number, status='NEW'):
+    return {'Circular Number': f'Circular No. {number}/2026', 'Date': '01-01-2026', '_STATUS': status}
+
+
+class FakeResponse:
+    def __init__(self, payload):
+        self.status_code = 200
+        self.payload = payload
+    
+    def json(self):
+        return self.payload
+
+
+class FakeTaskAPI:
+    """
+    GET /robots/<id>/tasks?page=N over a list of tasks kept newest first
+    
+    on_page(page) runs after a page is served, so tests can add tasks
+    while a walk is in progress. Requested pages are recorded.
+    """
+    
+    def __init__(self, tasks, delay=0.0):
+        self.tasks = list(tasks)
+        self.delay = delay
+        self.pages = []
+        self.on_page = None
+        self._lock = threading.Lock()
+    
+    def add_newer(self, *tasks):
+        with self._lock:
+            self.tasks[:0] = sorted(tasks, key=lambda task: task['createdAt'], reverse=True)
+    
+    def get(self, url, headers=None, params=None):
+        time.sleep(self.delay)
+        page = params['page']
+        with self._lock:
+            self.pages.append(page)
+            items = self.tasks[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+            total = len(self.tasks)
+        if self.on_page:
+            self.on_page(page)
+        return FakeResponse({'result': {'robotTasks': {
+            'items': [dict(task) for task in items],
+            'pageSize': PAGE_SIZE,
+            'totalCount': total,
+            'hasMore': page * PAGE_SIZE < total,
+        }}})
+
+
+@pytest.fixture
+def handler(tmp_path):
+    handler = BrowseAIHandler(
+        seen_index=SeenItemIndex(str(tmp_path / 'seen.db')),
+        task_cache=TaskCache(str(tmp_path / 'tasks.db'))
+    )
+    handler.session = FakeTaskAPI([make_task(number) for number in range(30, 0, -1)])
+    return handler
+
+
+def walk(handler):
+    return [task['id'] for task in handler.iter_tasks(ROBOT, prefetch=1)]
+
+
+def test_walk_yields_every_task_newest_first(handler):
+    assert walk(handler) == [f'task-{number}' for number in range(30, 0, -1)]
+
+
+def test_second_walk_reads_the_cached_range_from_disk(handler):
+    walk(handler)
+    assert handler.task_cache.coverage(ROBOT) == (make_task(30)['createdAt'], make_task(1)['createdAt'])
+    
+    handler.session.pages.clear()
+    assert walk(handler) == [f'task-{number}' for number in range(30, 0, -1)]
+    # Page 1 finds the cached range; paging resumes below it instead of walking pages 2-3
+    assert 2 not in handler.session.pages and 3 not in handler.session.pages
+
+
+def test_new_tasks_on_top_are_paged_then_the_cache_takes_over(handler):
+    walk(handler)
+    handler.session.add_newer(make_task(31), make_task(32), make_task(33))
+    handler.session.pages.clear()
+    
+    assert walk(handler) == [f'task-{number}' for number in range(33, 0, -1)]
+    assert 2 not in handler.session.pages and 3 not in handler.session.pages
+    assert handler.task_cache.coverage(ROBOT)[0] == make_task(33)['createdAt']
+
+
+def test_tasks_added_mid_walk_are_not_yielded_twice(tmp_path):
+    handler = BrowseAIHandler(seen_index=SeenItemIndex(str(tmp_path / 'seen.db')), task_cache=False)
+    api = handler.session = FakeTaskAPI([make_task(number) for number in range(30, 0, -1)])
+    # Two new tasks after page 1 push its last two tasks onto page 2
+    api.on_page = lambda page: page == 1 and api.add_newer(make_task(31), make_task(32))
+    
+    ids = walk(handler)
+    assert ids == [f'task-{number}' for number in range(30, 0, -1)]
+
+
+def test_unfinished_tasks_stay_out_of_the_cached_range(handler):
+    handler.session.tasks[0] = make_task(30, status='in-progress')
+    handler.session.tasks[1] = make_task(29, status='in-progress')
+    walk(handler)
+    assert handler.task_cache.coverage(ROBOT)[0] == make_task(28)['createdAt']
+    
+    # Once they finish, the next walk gets them from the API, not a stale copy
+    handler.session.tasks[0] = make_task(30, items=[make_item(1)])
+    handler.session.tasks[1] = make_task(29)
+    tasks = list(handler.iter_tasks(ROBOT, prefetch=1))
+    assert [task['status'] for task in tasks[:2]] == ['successful', 'successful']
+    assert handler.task_items(tasks[0]) == [make_item(1)]
+    assert len(tasks) == 30
+
+
+def test_walk_stops_at_the_watermark(handler):
+    watermark = make_task(25)['createdAt']
+    tasks = list(handler.iter_tasks(ROBOT, stop=lambda task: task['createdAt'] <= watermark, prefetch=1))
+    assert [task['id'] for task in tasks] == [f'task-{number}' for number in range(30, 25, -1)]
+
+
+# --- Seen-index watermark ---
+
+@pytest.fixture
+def monitored(tmp_path):
+    """Handler whose robot was last handled up to task 2, with tasks 3 and 4 since"""
+    handler = BrowseAIHandler(seen_index=SeenItemIndex(str(tmp_path / 'seen.db')), task_cache=False)
+    handler.session = FakeTaskAPI([
+        make_task(4, items=[make_item(4), make_item(3, 'UNCHANGED')]),
+        make_task(3, items=[make_item(3)]),
+        make_task(2, items=[make_item(2)]),
+        make_task(1, items=[make_item(1)]),
+    ])
+    handler.seen_index.mark_processed(ROBOT, [make_item(1), make_item(2)], make_task(2)['createdAt'], 'task-2')
+    return handler
+
+
+def numbers(items):
+    return sorted(item['Circular Number'] for item in items)
+
+
+def test_items_since_the_watermark_are_returned_once(monitored):
+    items = monitored.get_captured_data(ROBOT)
+    assert numbers(items) == ['Circular No. 3/2026', 'Circular No. 4/2026']
+
+
+def test_watermark_moves_only_once_items_are_delivered(monitored):
+    items = monitored.get_captured_data(ROBOT)
+    assert monitored.seen_index.watermark(ROBOT) == make_task(2)['createdAt']
+    
+    # Delivery failed (no mark_processed): the next run gets the same items
+    assert numbers(monitored.get_captured_data(ROBOT)) == numbers(items)
+    
+    monitored.mark_processed(ROBOT, items)
+    assert monitored.seen_index.watermark(ROBOT) == make_task(4)['createdAt']
+    assert monitored.get_captured_data(ROBOT) == []
+
+
+def test_undelivered_items_come_back_while_still_listed(monitored):
+    items = monitored.get_captured_data(ROBOT)
+    monitored.mark_processed(ROBOT, [item for item in items if item['Circular Number'].startswith('Circular No. 4')])
+    
+    monitored.session.add_newer(make_task(5, items=[make_item(3, 'UNCHANGED'), make_item(5)]))
+    assert numbers(monitored.get_captured_data(ROBOT)) == ['Circular No. 3/2026', 'Circular No. 5/2026']
+
+
+def test_in_progress_task_is_read_once_it_finishes(monitored):
+    monitored.session.add_newer(make_task(5, status='in-progress', items=[make_item(5)]))
+    monitored.mark_processed(ROBOT, monitored.get_captured_data(ROBOT))
+    assert monitored.seen_index.watermark(ROBOT) == make_task(4)['createdAt']
+    
+    monitored.session.tasks[0] = make_task(5, items=[make_item(5)])
+    assert numbers(monitored.get_captured_data(ROBOT)) == ['Circular No. 5/2026']
+
+
+def test_timed_out_fetch_leaves_the_watermark_alone(monitored):
+    monitored.session.delay = 0.5
+    results = monitored.get_captured_data_many([ROBOT], timeout=0.1)
+    assert results == {ROBOT: []}
+    
+    # The straggler finishes later, but its state never reaches pending
+    time.sleep(1.0)
+    monitored.mark_processed(ROBOT, [])
+    assert ROBOT not in monitored.pending
+    assert monitored.seen_index.watermark(ROBOT) == make_task(2)['createdAt']
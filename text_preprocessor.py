@@ -0,0 +1,212 @@
+import functools
+import os
+import re
+import threading
+from collections import Counter
+from config import PROMPT_TOKEN_BUDGET, TOKENIZER_ENCODING
+from extractive_summarizer import OPERATIVE_RE, BOILERPLATE_RE, DATE_PATTERN, split_sentences
+from local_store import cache_path
+
+try:
+    import tiktoken
+except ImportError:  # optional; token counts fall back to an estimate
+    tiktoken = None
+
+# "Page 2 of 5", "- 3 -", bare page numbers
+PAGE_NUMBER_RE = re.compile(r'^\s*(?:page\s+\d+(?:\s+of\s+\d+)?|[-–]?\s*\d{1,3}\s*[-–]?)\s*$', re.IGNORECASE)
+# Lines that open a new paragraph: "2.", "3.1", "(a)", "(iv)", "Explanation", "Provided that"
+SECTION_START_RE = re.compile(
+    r'^\s*(?:\d{1,2}(?:\.\d{1,2})*\.?\s|\(\w{1,4}\)\s|[ivx]{1,4}\)\s|explanation\b|provided\s+(?:further\s+)?that\b|sub(?:ject)?\s*[:.-])',
+    re.IGNORECASE
+)
+SUBJECT_RE = re.compile(r'^\s*(?:sub(?:ject)?|re)\s*[:.-]', re.IGNORECASE)
+OMISSION = "[...]"
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def get_encoding():
+    """The tiktoken encoding, or None when tiktoken or its vocabulary is unavailable"""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                _encoding = False
+                if tiktoken is not None:
+                    # Keep the downloaded vocabulary with the other local caches
+                    os.environ.setdefault('TIKTOKEN_CACHE_DIR', cache_path('tiktoken'))
+                    try:
+                        _encoding = tiktoken.get_encoding(TOKENIZER_ENCODING)
+                    except Exception as e:
+                        print(f"⚠️ Tokenizer unavailable ({e}); estimating tokens from length")
+    return _encoding or None
+
+
+def count_tokens(text):
+    """Number of tokens in text (tiktoken if available, else ~4 characters per token)"""
+    encoding = get_encoding()
+    if encoding is None:
+        return len(text) // 4 + 1
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def truncate_to_tokens(text, max_tokens):
+    """Cut text down to at most max_tokens, at a word boundary"""
+    encoding = get_encoding()
+    if encoding is None:
+        cut = text[:max_tokens * 4]
+    else:
+        tokens = encoding.encode(text, disallowed_special=())
+        if len(tokens) <= max_tokens:
+            return text
+        cut = encoding.decode(tokens[:max_tokens])
+    if len(cut) < len(text) and ' ' in cut:
+        cut = cut.rsplit(' ', 1)[0]
+    return cut.rstrip()
+
+
+def normalise_text(text):
+    """
+    Clean PDF-extracted text
+    
+    Drops page numbers and running headers/footers (lines repeated on
+    several pages), joins words hyphenated across line breaks and collapses
+    runs of spaces and blank lines. Line breaks are kept so paragraphs can
+    still be told apart.
+    """
+    lines = [re.sub(r'[ \t\xa0]+', ' ', line).strip() for line in (text or "").splitlines()]
+    
+    counts = Counter(line.lower() for line in lines if 3 <= len(line) <= 120)
+    seen = set()
+    kept = []
+    for line in lines:
+        if PAGE_NUMBER_RE.match(line):
+            continue
+        key = line.lower()
+        if counts.get(key, 0) >= 3:
+            # Running header or footer: keep only its first appearance
+            if key in seen:
+                continue
+            seen.add(key)
+        kept.append(line)
+    
+    text = "\n".join(kept)
+    text = re.sub(r'(\w)-\n(?=[a-z])', r'\1', text)
+    return re.sub(r'\n{3,}', '\n\n', text).strip()
+
+
+def split_sections(text):
+    """Split normalised text into paragraphs: blank lines or numbered/lettered paragraph starts"""
+    sections, current = [], []
+    for line in text.splitlines():
+        if not line or (current and SECTION_START_RE.match(line)):
+            if current:
+                sections.append(current)
+            current = []
+        if line:
+            current.append(line)
+    if current:
+        sections.append(current)
+    return sections
+
+
+def is_boilerplate(lines):
+    """Letterhead, address or signature block: short and mostly boilerplate lines"""
+    if sum(len(line.split()) for line in lines) > 60:
+        return False
+    matches = sum(1 for line in lines if any(pattern.search(line) for pattern in BOILERPLATE_RE))
+    return matches * 2 >= len(lines)
+
+
+def score_section(text, index):
+    """Relevance of a paragraph, using the extractive summarizer's operative-content signals"""
+    score = 1 + 0.5 * sum(1 for pattern in OPERATIVE_RE if pattern.search(text))
+    if DATE_PATTERN.search(text):
+        score *= 1.5
+    if SUBJECT_RE.match(text):
+        score *= 3
+    if len(text.split()) < 8:
+        score *= 0.5
+    # Operative paragraphs usually come early, right after the letterhead
+    return score * (1 + 0.3 / (1 + index / 5))
+
+
+@functools.lru_cache(maxsize=128)
+def prepare_text(text, token_budget=PROMPT_TOKEN_BUDGET):
+    """
+    The most relevant part of a document that fits in token_budget tokens
+    
+    Text is normalised, letterhead and signature blocks are removed, and
+    paragraphs are picked by relevance until the budget is used. Picked
+    paragraphs keep their document order; gaps are marked with "[...]".
+    """
+    sections = [
+        " ".join(lines) for lines in split_sections(normalise_text(text))
+        if not is_boilerplate(lines)
+    ]
+    if not sections:
+        return truncate_to_tokens((text or "").strip(), token_budget)
+    
+    joined = "\n\n".join(sections)
+    if count_tokens(joined) <= token_budget:
+        return joined
+    
+    sizes = [count_tokens(section) for section in sections]
+    ranked = sorted(range(len(sections)), key=lambda index: score_section(sections[index], index), reverse=True)
+    
+    chosen, used = {}, 0
+    separator = count_tokens(f"\n\n{OMISSION}\n\n")
+    for index in ranked:
+        remaining = token_budget - used
+        if sizes[index] + separator <= remaining:
+            chosen[index] = sections[index]
+            used += sizes[index] + separator
+        elif not chosen:
+            # The best paragraph alone is over budget: keep as much of it as fits
+            chosen[index] = truncate_to_tokens(sections[index], remaining - separator)
+            break
+    
+    parts, previous = [], -1
+    for index in sorted(chosen):
+        if index != previous + 1:
+            parts.append(OMISSION)
+        parts.append(chosen[index])
+        previous = index
+    if previous != len(sections) - 1:
+        parts.append(OMISSION)
+    return "\n\n".join(parts)
+
+
+
+@functools.lru_cache(maxsize=32)
+def chunk_text(text, chunk_tokens):
+    """
+    Split a document into chunks of at most chunk_tokens along paragraph boundaries
+    
+    Text is normalised and letterhead/signature blocks are dropped as for
+    prepare_text. A paragraph longer than a chunk is split between sentences.
+    """
+    pieces = []
+    for lines in split_sections(normalise_text(text)):
+        if is_boilerplate(lines):
+            continue
+        section = " ".join(lines)
+        if count_tokens(section) <= chunk_tokens:
+            pieces.append(section)
+        else:
+            pieces.extend(split_sentences(section))
+    
+    chunks, current, used = [], [], 0
+    for piece in pieces:
+        size = count_tokens(piece)
+        if size > chunk_tokens:
+            piece, size = truncate_to_tokens(piece, chunk_tokens), chunk_tokens
+        if current and used + size > chunk_tokens:
+            chunks.append("\n\n".join(current))
+            current, used = [], 0
+        current.append(piece)
+        used += size
+    if current:
+        chunks.append("\n\n".join(current))
+    return chunks
@@ -0,0 +1,48 @@
+import threading
+import time
+from local_store import cache_path, connect
+
+
+class WebhookEventLog:
+    """
+    Record of Browse AI webhook deliveries, keyed by task id
+    
+    Browse AI retries deliveries, so the same task can arrive several
+    times. claim() lets exactly one of them through; a task whose
+    processing failed can be claimed again by the next delivery.
+    """
+    
+    def __init__(self, path=None):
+        self._lock = threading.Lock()
+        self._conn = connect(path or cache_path('webhook_events.db'))
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS webhook_events (
+                task_id TEXT PRIMARY KEY,
+                robot_id TEXT NOT NULL,
+                status TEXT NOT NULL,
+                received_at REAL NOT NULL,
+                finished_at REAL
+            )
+        """)
+    
+    def claim(self, task_id, robot_id):
+        """True if this delivery should be processed, False for a duplicate"""
+        with self._lock:
+            inserted = self._conn.execute(
+                "INSERT OR IGNORE INTO webhook_events (task_id, robot_id, status, received_at) VALUES (?, ?, 'received', ?)",
+                (task_id, robot_id, time.time())
+            ).rowcount
+            if inserted:
+                return True
+            return self._conn.execute(
+                "UPDATE webhook_events SET status = 'received', received_at = ?, finished_at = NULL "
+                "WHERE task_id = ? AND status = 'failed'",
+                (time.time(), task_id)
+            ).rowcount == 1
+    
+    def finish(self, task_id, status):
+        with self._lock:
+            self._conn.execute(
+                "UPDATE webhook_events SET status = ?, finished_at = ? WHERE task_id = ?",
+                (status, time.time(), task_id)
+            )